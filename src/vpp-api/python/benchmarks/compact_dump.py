@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Memory and time of decoding a large dump.
+
+Decodes a synthetic dump of ip_route_details (one path each) or
+ip_neighbor_details into namedtuples (unpack) or compact records
+(unpack_compact) and reports the memory held by the decoded dump,
+the decoding time and the time of reading a few fields. Run once per
+representation, the memory is the growth of the peak resident size.
+No VPP is needed, only the .api.json files.
+'''
+
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from vpp_papi import VPPApiJSONFiles  # noqa: E402
+
+
+def load(apifiles):
+    messages = {}
+    for apifile in apifiles:
+        with open(apifile) as f:
+            m, _ = VPPApiJSONFiles.process_json_file(f)
+        messages.update(m)
+    return messages
+
+
+def route(i):
+    path = {'sw_if_index': i % 8, 'proto': 0,
+            'nh': {'address': {'ip4': b'\x0a\x00\x00\x01'}},
+            'n_labels': 0, 'label_stack': [{}] * 16}
+    return {'route': {'prefix': '11.{}.{}.0/24'.format(i >> 8 & 255,
+                                                       i & 255),
+                      'n_paths': 1, 'paths': [path]}}
+
+
+def neighbor(i):
+    return {'neighbor': {'sw_if_index': i % 8,
+                         'mac_address': b'\x02\x00\x00\x00\x00' +
+                         bytes([i % 256]),
+                         'ip_address': '10.0.{}.{}'.format(i >> 8 & 255,
+                                                           i & 255)}}
+
+
+def read_route(r):
+    return r.route.prefix, r.route.paths[0].sw_if_index
+
+
+def read_neighbor(r):
+    return r.neighbor.ip_address, r.neighbor.sw_if_index
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=1000000,
+                        help='details in the dump')
+    parser.add_argument('-m', '--message', default='route',
+                        choices=['route', 'neighbor'])
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help='decode into compact records')
+    parser.add_argument('apifiles', nargs='*',
+                        help='.api.json files, default VPP install location')
+    args = parser.parse_args()
+
+    messages = load(args.apifiles or VPPApiJSONFiles.find_api_files())
+    msg = messages['ip_{}_details'.format(args.message)]
+    make, read = {'route': (route, read_route),
+                  'neighbor': (neighbor, read_neighbor)}[args.message]
+    # Distinct details, decoded over and over
+    bufs = [msg.pack(dict(make(i), _vl_msg_id=1)) for i in range(4096)]
+    unpack = msg.unpack_compact if args.compact else msg.unpack
+    unpack(bufs[0])
+
+    before = maxrss()
+    start = time.perf_counter()
+    dump = [unpack(bufs[i % len(bufs)])[0] for i in range(args.count)]
+    decode = time.perf_counter() - start
+    memory = maxrss() - before
+
+    start = time.perf_counter()
+    for r in dump:
+        read(r)
+    access = time.perf_counter() - start
+
+    print('{} {}: {:.0f} MB, {:.0f} bytes/detail, {:.2f} us/unpack, '
+          '{:.3f} us/read'.format(
+              msg.name, 'compact' if args.compact else 'namedtuple',
+              memory / 2 ** 20, memory / args.count,
+              decode / args.count * 1e6, access / args.count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
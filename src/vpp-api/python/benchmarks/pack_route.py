@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Packing cost of ip_route_add_del.
+
+Packs the same route given as a prefix string, as ipaddress objects,
+as dictionaries of packed addresses and with the prefix and paths
+passed pre-packed as bytes, which skips type conversion altogether.
+No VPP is needed, only the .api.json files.
+'''
+
+import argparse
+import ipaddress
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from vpp_papi import VPPApiJSONFiles  # noqa: E402
+from vpp_papi.vpp_serializer import vpp_get_type  # noqa: E402
+
+
+def load(apifiles):
+    messages = {}
+    for apifile in apifiles:
+        with open(apifile) as f:
+            m, _ = VPPApiJSONFiles.process_json_file(f)
+        messages.update(m)
+    return messages
+
+
+def routes(n):
+    '''Yield (label, list of route arguments) in each calling convention'''
+    path = {'sw_if_index': 1, 'proto': 0,
+            'nh': {'address': {'ip4': b'\x0a\x00\x00\x01'}},
+            'n_labels': 0, 'label_stack': [{}] * 16}
+    networks = [ipaddress.ip_network((0x0b000000 + (i << 8), 24))
+                for i in range(n)]
+
+    def route(prefix, paths):
+        return {'route': {'table_id': 0, 'prefix': prefix,
+                          'n_paths': len(paths), 'paths': paths},
+                'is_add': 1}
+
+    yield 'string', [route(str(p), [path]) for p in networks]
+    yield 'ipaddress', [route(p, [path]) for p in networks]
+    yield 'dict', [route({'address': {'af': 0, 'un': {
+        'ip4': p.network_address.packed}}, 'len': p.prefixlen}, [path])
+        for p in networks]
+
+    prefix_t = vpp_get_type('vl_api_prefix_t')
+    packed_path = vpp_get_type('vl_api_fib_path_t').pack(path)
+    yield 'bytes', [route(prefix_t.pack(p), [packed_path])
+                    for p in networks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=20000,
+                        help='routes to pack')
+    parser.add_argument('apifiles', nargs='*',
+                        help='.api.json files, default VPP install location')
+    args = parser.parse_args()
+
+    messages = load(args.apifiles or VPPApiJSONFiles.find_api_files())
+    msg = messages['ip_route_add_del']
+    expected = None
+    print('{:<12} {:>10}'.format('arguments', 'us/pack'))
+    for label, arguments in routes(args.count):
+        start = time.perf_counter()
+        packed = [msg.pack(a) for a in arguments]
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected = packed
+        assert packed == expected, label
+        print('{:<12} {:>10.2f}'.format(label, elapsed / args.count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Reply latency of the socket transport.
+
+Times show_version and control_ping round trips against a running VPP,
+with replies passed from the reader thread through the in-process queue
+and through a multiprocessing.Queue (multiprocess=True).
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from vpp_papi import VPPApiClient  # noqa: E402
+
+
+def measure(f, n):
+    '''Return the per call latencies of n calls in microseconds.'''
+    f()
+    samples = []
+    for _ in range(n):
+        t = time.perf_counter()
+        f()
+        samples.append((time.perf_counter() - t) * 1e6)
+    samples.sort()
+    return samples
+
+
+def run(args, multiprocess):
+    vpp = VPPApiClient(apifiles=args.apifiles or None,
+                       server_address=args.socket,
+                       multiprocess=multiprocess)
+    vpp.connect('reply-latency')
+    try:
+        for name in ('show_version', 'control_ping'):
+            s = measure(getattr(vpp.api, name), args.count)
+            print('{:<14} {:<22} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                'multiprocess' if multiprocess else 'in-process', name,
+                s[len(s) // 2], s[len(s) * 99 // 100],
+                sum(s) / len(s)))
+    finally:
+        vpp.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--socket', default='/run/vpp/api.sock',
+                        help='VPP API socket')
+    parser.add_argument('-n', '--count', type=int, default=10000,
+                        help='calls per message')
+    parser.add_argument('apifiles', nargs='*',
+                        help='.api.json files, default VPP install location')
+    args = parser.parse_args()
+
+    print('{:<14} {:<22} {:>8} {:>8} {:>8}'.format(
+        'queue', 'message', 'p50 us', 'p99 us', 'mean us'))
+    for multiprocess in (False, True):
+        run(args, multiprocess)
+
+
+if __name__ == '__main__':
+    main()
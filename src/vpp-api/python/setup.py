@@ -31,5 +31,11 @@ setup(
     test_suite='vpp_papi.tests',
     install_requires=requirements,
     packages=find_packages(),
+    entry_points={
+        'console_scripts': [
+            'vpp_stats_exporter = vpp_papi.vpp_stats_exporter:main',
+            'vpp_stats_history = vpp_papi.vpp_stats_history:main',
+        ],
+    },
     long_description='''VPP Python language binding.''',
     zip_safe=True)
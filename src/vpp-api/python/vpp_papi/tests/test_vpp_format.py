@@ -12,6 +12,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import collections
 import ipaddress
 import socket
 import unittest
@@ -126,3 +127,38 @@ class TestVppFormat(unittest.TestCase):
         # PY3: raises OSError
         with self.assertRaises((socket.error, OSError)):
             res = vpp_format.format_vl_api_ip4_prefix_t(ip6_prefix)
+
+
+class TestVppUnformat(unittest.TestCase):
+
+    def tearDown(self):
+        vpp_format.set_unpackers()
+
+    def test_cached_unpacker(self):
+        unpack = vpp_format.conversion_unpacker_table['vl_api_ip4_address_t']
+        unpack.cache_clear()
+        a = unpack(ip4_addrn)
+        self.assertEqual(a, ipaddress.IPv4Address(ip4_addr))
+        self.assertIs(unpack(ip4_addrn), a)
+        self.assertEqual(unpack.cache_info().hits, 1)
+
+        vpp_format.set_unpackers(cache_size=0)
+        unpack = vpp_format.conversion_unpacker_table['vl_api_ip4_address_t']
+        self.assertIsNot(unpack(ip4_addrn), unpack(ip4_addrn))
+
+    def test_packed_unpacker(self):
+        vpp_format.set_unpackers(packed=True)
+        table = vpp_format.conversion_unpacker_table
+        a = table['vl_api_ip6_address_t'](ip6_addrn)
+        self.assertEqual(a, ip6_addrn)
+        self.assertEqual(str(a), ip6_addr)
+        self.assertEqual(a.address(), ipaddress.IPv6Address(ip6_addr))
+
+        prefix = collections.namedtuple('prefix', ['address', 'len'])
+        p = table['vl_api_ip4_prefix_t'](prefix(ip4_addrn, 24))
+        self.assertEqual(str(p), '1.2.3.4/24')
+        self.assertEqual(p.network(),
+                         ipaddress.IPv4Network(text_type('1.2.3.0/24')))
+
+        mac = table['vl_api_mac_address_t'](b'\x01\x02\x03\x04\x05\x06')
+        self.assertEqual(str(mac), '01:02:03:04:05:06')
@@ -12,15 +12,31 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import asyncio
 import ctypes
 import multiprocessing as mp
+import os
+import queue
+import socket
+import struct
 import sys
+import tempfile
+import threading
+import time
 import unittest
+import warnings
+import weakref
 from unittest import mock
 
 from vpp_papi import vpp_papi
+from vpp_papi import vpp_papi_async
+from vpp_papi import vpp_serializer
+from vpp_papi import vpp_transport_socket
 from vpp_papi import vpp_transport_shmem
 
+# Other tests replace the module's VppTransport with a mock.
+ShmemTransport = vpp_transport_shmem.VppTransport
+
 
 class TestVppPapiVPPApiClient(unittest.TestCase):
     def test_getcontext(self):
@@ -55,6 +71,63 @@ class TestVppPapiVPPApiClientMp(unittest.TestCase):
         self.assertEqual(11, c.get_context())
 
 
+class TestVppTransportShmem(unittest.TestCase):
+    def setUp(self):
+        # Registers vl_api_address_family_t, checked by the client
+        vpp_papi.VPPApiJSONFiles.process_json_str(test_api_json)
+
+    def client(self):
+        vpp_papi.VPPApiClient.apidir = '.'
+        with mock.patch.object(vpp_transport_shmem, 'VppTransport',
+                               ShmemTransport):
+            return vpp_papi.VPPApiClient(testmode=True, use_socket=False)
+
+    def test_fallback(self):
+        error = vpp_transport_shmem.VppTransportShmemIOError(1, 'missing')
+        with mock.patch.object(vpp_transport_shmem, 'load_library',
+                               side_effect=error):
+            c = self.client()
+        self.assertIsInstance(c.transport, vpp_transport_socket.VppTransport)
+
+    def test_read_write(self):
+        lib = mock.MagicMock()
+        lib.vac_connect.return_value = 0
+        lib.vac_write.return_value = 0
+        with mock.patch.object(vpp_transport_shmem, 'load_library',
+                               return_value=lib):
+            c = self.client()
+        t = c.transport
+        self.assertIsInstance(t, ShmemTransport)
+        self.assertEqual(t.connect('test', None, None, 32), 0)
+        t.write_many([b'\x00\x01', bytearray(b'\x00\x02')])
+        self.assertEqual(lib.vac_write.call_args_list,
+                         [mock.call(b'\x00\x01', 2),
+                          mock.call(b'\x00\x02', 2)])
+
+        lib.vac_read.return_value = vpp_transport_shmem.VAC_TIMEOUT
+        self.assertIsNone(t.read(timeout=0.5))
+        # Rounded up, 0 would wait forever
+        self.assertEqual(lib.vac_read.call_args[0][2], 1)
+        lib.vac_read.return_value = -3
+        with self.assertRaises(vpp_transport_shmem.VppTransportShmemIOError):
+            t.read()
+
+        # The callback hands messages to the client
+        with mock.patch.object(c, 'msg_handler_async') as handler:
+            t.get_callback(True)(b'\x00\x03\x00', 3)
+        handler.assert_called_once_with(b'\x00\x03\x00')
+
+        lib.vac_get_msg_index.side_effect = \
+            lambda name: 7 if name.startswith(b'foo_add_reply_') else -1
+        c.messages.update(vpp_papi.VPPApiJSONFiles.process_json_str(
+            test_api_json)[0])
+        table = c.dump_message_table()
+        self.assertEqual(list(table.values()), [7])
+        self.assertTrue(list(table)[0].startswith('foo_add_reply_'))
+        t.disconnect()
+        self.assertFalse(t.connected)
+
+
 class TestVppTypes(unittest.TestCase):
     def test_enum_from_json(self):
         json_api = """\
@@ -230,6 +303,746 @@ class TestVppTypes(unittest.TestCase):
         self.assertTrue(str(t).startswith("VPPEnumType"))
         self.assertEqual(t.name, type_name)
 
+    def test_lazy_field_defaults(self):
+        json_api = """\
+{
+    "aliases": {
+        "lazy_index": {"type": "u32"}
+    },
+    "messages": [
+        ["lazy_a", ["u16", "_vl_msg_id"],
+         ["vl_api_lazy_index_t", "sw_if_index"], {"crc": "0x1"}],
+        ["lazy_b", ["u16", "_vl_msg_id"],
+         ["vl_api_lazy_index_t", "sw_if_index", {"default": 4294967295}],
+         {"crc": "0x2"}]
+    ]
+}
+"""
+        m, s = vpp_papi.VPPApiJSONFiles.process_json_str(json_api)
+        # Same default as when all messages were built on loading,
+        # whichever message is built first
+        self.assertEqual(m['lazy_a'].pack({}), b'\x00\x00\xff\xff\xff\xff')
+        self.assertEqual(m['lazy_b'].pack({}), b'\x00\x00\xff\xff\xff\xff')
+
+
+test_api_json = """\
+{
+    "enums": [
+        ["address_family", ["ADDRESS_IP4", 0], ["ADDRESS_IP6", 1],
+         {"enumtype": "u8"}]
+    ],
+    "messages": [
+        ["control_ping", ["u16", "_vl_msg_id"], ["u32", "client_index"],
+         ["u32", "context"], {"crc": "0x51077d14"}],
+        ["control_ping_reply", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["i32", "retval"], ["u32", "client_index"], ["u32", "vpe_pid"],
+         {"crc": "0xf6b0b8ca"}],
+        ["foo_add", ["u16", "_vl_msg_id"], ["u32", "client_index"],
+         ["u32", "context"], ["u32", "value"], {"crc": "0x11111111"}],
+        ["foo_add_reply", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["i32", "retval"], ["u32", "value"], {"crc": "0x22222222"}],
+        ["foo_dump", ["u16", "_vl_msg_id"], ["u32", "client_index"],
+         ["u32", "context"], ["u32", "count"], {"crc": "0x33333333"}],
+        ["foo_details", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["u32", "value"], {"crc": "0x44444444"}],
+        ["foo_get", ["u16", "_vl_msg_id"], ["u32", "client_index"],
+         ["u32", "context"], ["u32", "cursor"], {"crc": "0x55555555"}],
+        ["foo_get_reply", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["i32", "retval"], ["u32", "cursor"], {"crc": "0x66666666"}]
+    ],
+    "services": {
+        "control_ping": {"reply": "control_ping_reply"},
+        "foo_add": {"reply": "foo_add_reply"},
+        "foo_dump": {"reply": "foo_details", "stream": true},
+        "foo_get": {"reply": "foo_get_reply", "stream": true,
+                    "stream_msg": "foo_details"}
+    }
+}
+"""
+
+
+class TestVppPapiApiCache(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.cache_dir = os.path.join(tmpdir.name, 'cache')
+        self.apifile = os.path.join(tmpdir.name, 'foo.api.json')
+        with open(self.apifile, 'w') as f:
+            f.write(test_api_json)
+
+    def process(self, cache_dir):
+        return vpp_papi.VPPApiJSONFiles.process_json_files(
+            [self.apifile], cache_dir)
+
+    def test_cache(self):
+        m, s = self.process(self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        with mock.patch.object(vpp_papi.json, 'load') as load:
+            m2, s2 = self.process(self.cache_dir)
+        load.assert_not_called()
+        self.assertEqual(sorted(m2), sorted(m))
+        self.assertEqual(s2, s)
+
+        # Changing the file invalidates the entry
+        st = os.stat(self.apifile)
+        os.utime(self.apifile, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        with mock.patch.object(vpp_papi.json, 'load',
+                               wraps=vpp_papi.json.load) as load:
+            self.process(self.cache_dir)
+        load.assert_called_once()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_cache_prune(self):
+        apifiles = []
+        for i in range(6):
+            apifile = os.path.join(os.path.dirname(self.apifile),
+                                   'foo%d.api.json' % i)
+            with open(apifile, 'w') as f:
+                f.write(test_api_json)
+            apifiles.append(apifile)
+        self.process(self.cache_dir)
+        first = os.listdir(self.cache_dir)
+        for apifile in apifiles:
+            vpp_papi.VPPApiJSONFiles.process_json_files(
+                [self.apifile, apifile], self.cache_dir)
+            # The first entry is used again, and kept
+            time.sleep(0.01)
+            self.process(self.cache_dir)
+        cached = os.listdir(self.cache_dir)
+        self.assertEqual(len(cached), vpp_papi._API_CACHE_ENTRIES)
+        self.assertIn(first[0], cached)
+
+    def test_cache_disabled(self):
+        m, s = self.process(False)
+        self.assertIn('foo_add', m)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache_dir(self):
+        with mock.patch.dict(os.environ, {'VPP_API_CACHE_DIR': ''}):
+            del os.environ['VPP_API_CACHE_DIR']
+            # Off unless enabled
+            self.assertIsNone(vpp_papi.VPPApiJSONFiles.find_cache_dir())
+            self.process(None)
+            self.assertFalse(os.path.exists(self.cache_dir))
+            os.environ['VPP_API_CACHE_DIR'] = ''
+            self.assertIsNone(vpp_papi.VPPApiJSONFiles.find_cache_dir())
+            os.environ['VPP_API_CACHE_DIR'] = self.cache_dir
+            self.process(None)
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_cache_corrupt(self):
+        self.process(self.cache_dir)
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                f.write(b'garbage')
+        m, s = self.process(self.cache_dir)
+        self.assertIn('foo_add', m)
+
+
+class FakeTransport:
+    """Transport answering API calls in process, without VPP."""
+    connected = True
+    socket_index = 1
+
+    def __init__(self, parent, read_timeout=None, server_address=None):
+        self.parent = parent
+        self.message_table = {}
+        self.replies = []
+        self.writes = []
+        self.rx_limits = []
+        self.rx_limit = 0
+
+    def connect(self, name, pfx, msg_handler, rx_qlen):
+        for i, (n, m) in enumerate(sorted(self.parent.messages.items())):
+            self.message_table[n + '_' + m.crc[2:]] = i + 1
+        return 0
+
+    def disconnect(self):
+        return 0
+
+    def get_callback(self, do_async):
+        return None
+
+    def get_msg_index(self, name):
+        return self.message_table.get(name, 0)
+
+    def msg_table_max_index(self):
+        return len(self.message_table)
+
+    def suspend(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def flow_control(self, limit):
+        self.rx_limits.append(limit)
+        previous, self.rx_limit = self.rx_limit, limit
+        return previous
+
+    def _reply(self, name, **kwargs):
+        msg = self.parent.messages[name]
+        kwargs['_vl_msg_id'] = self.get_msg_index(
+            name + '_' + msg.crc[2:])
+        self.replies.append(msg.pack(kwargs))
+
+    def _handle(self, buf):
+        i = struct.unpack_from('>H', buf)[0]
+        name = self.parent.id_names[i]
+        r, _ = self.parent.messages[name].unpack(buf)
+        if name == 'control_ping':
+            self._reply('control_ping_reply', context=r.context)
+        elif name == 'foo_add':
+            self._reply('foo_add_reply', context=r.context, value=r.value,
+                        retval=-1 if r.value == 13 else 0)
+        elif name == 'foo_dump':
+            for v in range(r.count):
+                self._reply('foo_details', context=r.context, value=v)
+        elif name == 'foo_get':
+            # Three details per page, nine in all
+            for v in range(r.cursor, r.cursor + 3):
+                self._reply('foo_details', context=r.context, value=v)
+            self._reply('foo_get_reply', context=r.context,
+                        cursor=r.cursor + 3,
+                        retval=-165 if r.cursor < 6 else 0)
+
+    def write(self, buf):
+        self.writes.append([buf])
+        self._handle(buf)
+
+    def write_many(self, bufs):
+        self.writes.append(bufs)
+        for buf in bufs:
+            self._handle(buf)
+
+    def read(self, timeout=None):
+        if not self.replies:
+            return None
+        return self.replies.pop(0)
+
+
+class TestVppPapiBatch(unittest.TestCase):
+    def setUp(self):
+        m, s = vpp_papi.VPPApiJSONFiles.process_json_str(test_api_json)
+        self.vpp = vpp_papi.VPPApiClient(apifiles=[], testmode=True,
+                                         async_thread=False)
+        self.vpp.messages.update(m)
+        self.vpp.services.update(s)
+        self.vpp.transport = FakeTransport(self.vpp)
+        self.vpp.connect('test')
+
+    def test_call(self):
+        r = self.vpp.api.foo_add(value=5)
+        self.assertEqual(r.value, 5)
+        self.assertEqual(len(self.vpp.api.foo_dump(count=3)), 3)
+
+    def test_lazy(self):
+        api = self.vpp.api
+        self.assertNotIn('foo_add', vars(api))
+        self.assertIn('foo_add', dir(api))
+        self.assertIsInstance(self.vpp.messages['foo_add_reply'],
+                              vpp_serializer.VPPLazyMessage)
+        self.assertEqual(api.foo_add(value=1).value, 1)
+        self.assertIn('foo_add', vars(api))
+        self.assertIs(type(self.vpp.messages['foo_add_reply']),
+                      vpp_serializer.VPPMessage)
+        with self.assertRaises(AttributeError):
+            api.no_such_function
+
+    def test_iter(self):
+        it = self.vpp.api.foo_dump.iter(count=5)
+        self.assertEqual(self.vpp.transport.writes, [])
+        self.assertEqual([d.value for d in it], list(range(5)))
+        self.assertEqual(self.vpp.transport.rx_limits, [256, 0])
+        with self.assertRaises(vpp_papi.VPPValueError):
+            next(self.vpp.api.foo_add.iter(value=1))
+
+    def test_iter_nested(self):
+        values = []
+        for d in self.vpp.api.foo_dump.iter(count=5):
+            values.append(d.value)
+            self.assertEqual(self.vpp.api.foo_add(value=d.value).value,
+                             d.value)
+            self.assertEqual(len(self.vpp.api.foo_dump(count=2)), 2)
+        self.assertEqual(values, list(range(5)))
+
+        # An inner iterator restores the bound of the outer one
+        self.vpp.transport.rx_limits = []
+        self.vpp.stream_buffer = 8
+        for d in self.vpp.api.foo_dump.iter(count=2):
+            self.vpp.stream_buffer = 4
+            self.assertEqual(len(list(self.vpp.api.foo_dump.iter(count=2))),
+                             2)
+        self.assertEqual(self.vpp.transport.rx_limits, [8, 4, 8, 4, 8, 0])
+        self.assertTrue(self.vpp.message_queue.empty())
+        self.assertEqual(self.vpp._waiters, {})
+
+    def test_iter_paged(self):
+        self.assertEqual([d.value for d in self.vpp.api.foo_get.iter()],
+                         list(range(9)))
+        self.assertEqual(len(self.vpp.transport.writes), 3)
+
+    def test_iter_stopped(self):
+        it = self.vpp.api.foo_dump.iter(count=5)
+        self.assertEqual(next(it).value, 0)
+        it.close()
+        # The rest of the dump is dropped, not passed on as events
+        self.assertEqual(self.vpp.transport.replies, [])
+        self.assertTrue(self.vpp.message_queue.empty())
+        self.assertEqual(self.vpp.api.foo_add(value=5).value, 5)
+
+    def test_msg_header(self):
+        transport = self.vpp.transport
+        transport._reply('foo_details', context=5, value=1)
+        transport._reply('foo_add', client_index=3, context=6, value=2)
+        reply, request = transport.replies
+        self.assertTrue(self.vpp.has_context(reply))
+        self.assertEqual(self.vpp._msg_header(reply)[1], 5)
+        self.assertEqual(self.vpp._msg_header(request)[1], 6)
+        self.assertEqual(self.vpp._msg_header(reply[:4])[1], 0)
+        self.assertFalse(self.vpp.has_context(reply[:4]))
+
+    def test_read_reply(self):
+        transport = self.vpp.transport
+        for context in (7, 0, 8, 9):
+            transport._reply('foo_details', context=context, value=context)
+        first = self.vpp._wait_replies((7,))
+        second = self.vpp._wait_replies((8,))
+        msg = self.vpp._read_reply(second)
+        self.assertEqual(self.vpp.decode_incoming_msg(msg).value, 8)
+        # Replies to other calls are kept for them, the rest are events
+        self.assertEqual(len(first), 1)
+        self.assertEqual(self.vpp.message_queue.get_nowait().value, 0)
+        self.vpp._stop_waiting((8,))
+        msg = self.vpp._read_reply(first)
+        self.assertEqual(self.vpp.decode_incoming_msg(msg).value, 7)
+        self.assertIsNone(self.vpp._read_reply(first))
+        self.assertEqual(self.vpp.message_queue.get_nowait().value, 9)
+        self.vpp._stop_waiting((7,))
+        self.assertEqual(self.vpp._waiters, {})
+
+    def test_compact(self):
+        self.vpp.compact = True
+        details = self.vpp.api.foo_dump(count=3)
+        self.assertIsInstance(details[0], vpp_serializer.VPPCompactRecord)
+        self.assertEqual([d.value for d in details], [0, 1, 2])
+        r = self.vpp.api.foo_add(value=5, _no_type_conversion=True)
+        self.assertNotIsInstance(r, vpp_serializer.VPPCompactRecord)
+
+    def test_batch(self):
+        transport = self.vpp.transport
+        with self.vpp.batch() as batch:
+            contexts = [batch.api.foo_add(value=v) for v in range(5)]
+            batch.api.foo_dump(count=2)
+            self.assertEqual(len(batch), 6)
+            self.assertEqual(transport.writes, [])
+        self.assertEqual(len(set(contexts)), 5)
+        # Six requests and the control ping ending the dump, one write
+        self.assertEqual(len(transport.writes), 1)
+        self.assertEqual(len(transport.writes[0]), 7)
+        self.assertEqual([r.value for r in batch.results[:5]],
+                         list(range(5)))
+        self.assertEqual([r.value for r in batch.results[5]], [0, 1])
+
+    def test_batch_options(self):
+        transport = self.vpp.transport
+        with self.vpp.batch() as batch:
+            batch.api.foo_add(value=1, _no_type_conversion=True,
+                              _timeout=1)
+            batch.api.foo_add(value=2)
+        self.assertEqual([r.value for r in batch.results], [1, 2])
+
+        # The transport is resumed when the replies cannot be read
+        with mock.patch.object(transport, 'read', return_value=None), \
+                mock.patch.object(transport, 'resume') as resume:
+            with self.assertRaises(vpp_papi.VPPIOError):
+                with self.vpp.batch() as batch:
+                    batch.api.foo_add(value=1)
+        resume.assert_called_once_with()
+        self.assertEqual(self.vpp._waiters, {})
+
+    def test_batch_errors(self):
+        with self.assertRaises(vpp_papi.VPPApiBatchError) as ctx:
+            with self.vpp.batch() as batch:
+                for v in (12, 13, 14, 13):
+                    batch.api.foo_add(value=v)
+        self.assertEqual([e[0] for e in ctx.exception.errors], [1, 3])
+        self.assertEqual(len(ctx.exception.results), 4)
+
+        with self.vpp.batch(check_retval=False) as batch:
+            batch.api.foo_add(value=13)
+        self.assertEqual(batch.results[0].retval, -1)
+
+
+class FakeAsyncTransport(FakeTransport):
+    """FakeTransport delivering the replies from a reader task."""
+    read_timeout = 1
+    # As for VppAsyncTransport once the event loop is closed.
+    connected = False
+
+    async def connect(self, name, pfx, msg_handler, rx_qlen):
+        self.reader_task = None
+        return super(FakeAsyncTransport, self).connect(name, pfx,
+                                                       msg_handler, rx_qlen)
+
+    async def disconnect(self):
+        return 0
+
+    async def drain(self):
+        if self.reader_task is None or self.reader_task.done():
+            self.reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        while self.replies:
+            waiter = self.parent.msg_received(self.replies.pop(0))
+            if waiter is not None:
+                await waiter
+
+
+class TestVppPapiAsync(unittest.TestCase):
+    def setUp(self):
+        m, s = vpp_papi.VPPApiJSONFiles.process_json_str(test_api_json)
+        self.vpp = vpp_papi_async.AsyncVPPApiClient(apifiles=[],
+                                                    testmode=True,
+                                                    stream_buffer=2)
+        self.vpp.messages.update(m)
+        self.vpp.services.update(s)
+        self.vpp.transport = FakeAsyncTransport(self.vpp)
+
+    def run_client(self, coro):
+        async def run():
+            await self.vpp.connect('test')
+            return await coro()
+        return asyncio.run(run())
+
+    def test_call(self):
+        async def calls():
+            return await asyncio.gather(
+                *[self.vpp.api.foo_add(value=v) for v in range(10)],
+                self.vpp.api.foo_dump(count=3))
+        r = self.run_client(calls)
+        self.assertEqual([x.value for x in r[:10]], list(range(10)))
+        self.assertEqual([x.value for x in r[10]], [0, 1, 2])
+        self.assertEqual(self.vpp._pending, {})
+
+    def test_iter(self):
+        async def dump():
+            values = []
+            async for d in self.vpp.api.foo_dump.iter(count=10):
+                values.append(d.value)
+                await asyncio.sleep(0)
+            return values
+        self.assertEqual(self.run_client(dump), list(range(10)))
+
+        async def not_a_dump():
+            async for d in self.vpp.api.foo_add.iter(value=1):
+                pass
+        with self.assertRaises(vpp_papi.VPPValueError):
+            self.run_client(not_a_dump)
+
+    def test_iter_paged(self):
+        async def dump():
+            return [d.value async for d in self.vpp.api.foo_get.iter()]
+        self.assertEqual(self.run_client(dump), list(range(9)))
+        self.assertEqual(len(self.vpp.transport.writes), 3)
+        self.assertEqual(self.vpp._pending, {})
+
+    def test_transport(self):
+        vpp = vpp_papi_async.AsyncVPPApiClient(apifiles=[], testmode=True)
+        self.assertIsInstance(vpp.transport,
+                              vpp_papi_async.VppAsyncTransport)
+
+    def test_iter_break(self):
+        async def dump():
+            async for d in self.vpp.api.foo_dump.iter(count=10):
+                break
+            # The reader is not left waiting for room for the details
+            r = await self.vpp.api.foo_add(value=1, _timeout=1)
+            return d.value, r.value
+        self.assertEqual(self.run_client(dump), (0, 1))
+        self.assertEqual(self.vpp._pending, {})
+        self.assertTrue(self.vpp._events.empty())
+
+    def test_events(self):
+        async def event():
+            self.vpp.transport._reply('foo_details', context=0, value=7)
+            await self.vpp.api.foo_add(value=1)
+            return await self.vpp.events().__anext__()
+        self.assertEqual(self.run_client(event).value, 7)
+
+    def test_connection_lost(self):
+        async def lost():
+            self.vpp.transport.drain = mock.AsyncMock()
+            f = asyncio.ensure_future(self.vpp.api.foo_add(value=1))
+            await asyncio.sleep(0)
+            self.vpp.connection_lost(vpp_papi.VPPIOError(2, 'lost'))
+            return await f
+        with self.assertRaises(vpp_papi.VPPIOError):
+            self.run_client(lost)
+
+
+memclnt_api_json = """\
+{
+    "types": [
+        ["message_table_entry", ["u16", "index"], ["string", "name", 64]]
+    ],
+    "messages": [
+        ["sockclnt_create", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["string", "name", 64], {"crc": "0x455fb9c4"}],
+        ["sockclnt_create_reply", ["u16", "_vl_msg_id"],
+         ["u32", "client_index"], ["u32", "context"], ["i32", "response"],
+         ["u32", "index"], ["u16", "count"],
+         ["vl_api_message_table_entry_t", "message_table", 0, "count"],
+         {"crc": "0x35166268"}],
+        ["sockclnt_delete", ["u16", "_vl_msg_id"], ["u32", "client_index"],
+         ["u32", "context"], ["u32", "index"], {"crc": "0x8ac76db6"}],
+        ["sockclnt_delete_reply", ["u16", "_vl_msg_id"], ["u32", "context"],
+         ["i32", "response"], {"crc": "0x8f38b1ee"}]
+    ],
+    "services": {
+        "sockclnt_create": {"reply": "sockclnt_create_reply"},
+        "sockclnt_delete": {"reply": "sockclnt_delete_reply"}
+    }
+}
+"""
+
+
+class FakeVppServer(FakeTransport):
+    """Answers one client on a Unix socket, as VPP does."""
+    header = struct.Struct('>QII')
+
+    def __init__(self, parent, server_address):
+        super(FakeVppServer, self).__init__(parent)
+        names = [n + '_' + m.crc[2:]
+                 for n, m in sorted(parent.messages.items())
+                 if not n.startswith('sockclnt_create')]
+        # Dense as in VPP, with the connect messages at 15 and 16
+        names += ['unused_%d' % i for i in range(14 - len(names))]
+        names[14:14] = ['sockclnt_create_455fb9c4',
+                        'sockclnt_create_reply_35166268']
+        self.message_table = {n: i + 1 for i, n in enumerate(names)}
+        self.requests = []
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(server_address)
+        self.sock.listen(1)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def recv(self, conn, n):
+        buf = b''
+        while len(buf) < n:
+            data = conn.recv(n - len(buf))
+            if not data:
+                return None
+            buf += data
+        return buf
+
+    def serve(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            while True:
+                hdr = self.recv(conn, 16)
+                if hdr is None:
+                    break
+                buf = self.recv(conn, self.header.unpack(hdr)[1])
+                i = struct.unpack_from('>H', buf)[0]
+                name = ('sockclnt_create' if i == 15 else
+                        self.parent.id_names[i])
+                self.requests.append(name)
+                r, _ = self.parent.messages[name].unpack(buf)
+                if name == 'sockclnt_create':
+                    table = [{'index': v, 'name': k}
+                             for k, v in self.message_table.items()]
+                    self._reply('sockclnt_create_reply', context=r.context,
+                                index=5, count=len(table),
+                                message_table=table)
+                elif name == 'sockclnt_delete':
+                    self._reply('sockclnt_delete_reply', context=r.context)
+                else:
+                    self._handle(buf)
+                conn.sendall(b''.join(self.header.pack(0, len(b), 0) + b
+                                      for b in self.replies))
+                self.replies = []
+        self.sock.close()
+
+
+class TestVppAsyncTransport(unittest.TestCase):
+    """AsyncVPPApiClient over a Unix socket."""
+    def setUp(self):
+        apis = [vpp_papi.VPPApiJSONFiles.process_json_str(api_json)
+                for api_json in (test_api_json, memclnt_api_json)]
+        self.vpp = vpp_papi_async.AsyncVPPApiClient(
+            apifiles=[], testmode=True,
+            server_address=os.path.join(tempfile.mkdtemp(), 'api.sock'))
+        for m, s in apis:
+            self.vpp.messages.update(m)
+            self.vpp.services.update(s)
+        self.server = FakeVppServer(self.vpp, self.vpp.server_address)
+
+    def tearDown(self):
+        self.server.thread.join(1)
+        os.unlink(self.vpp.server_address)
+        os.rmdir(os.path.dirname(self.vpp.server_address))
+
+    def test_connect(self):
+        async def run():
+            await self.vpp.connect('test')
+            r = await self.vpp.api.foo_add(value=3)
+            values = [d.value async for d in self.vpp.api.foo_get.iter()]
+            rv = await self.vpp.disconnect()
+            return r.value, values, rv.response
+        self.assertEqual(asyncio.run(run()), (3, list(range(9)), 0))
+        transport = self.vpp.transport
+        self.assertEqual(transport.socket_index, 5)
+        self.assertEqual(transport.message_table, {})
+        self.assertEqual(self.server.requests,
+                         ['sockclnt_create', 'foo_add', 'foo_get', 'foo_get',
+                          'foo_get', 'sockclnt_delete'])
+
+    def test_atexit(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.vpp.connect('test'))
+            self.assertTrue(self.vpp.transport.connected)
+            # Not awaiting disconnect() would warn, and leave it undone
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                self.vpp.vpp_atexit(weakref.ref(self.vpp))
+            self.assertFalse(self.vpp.transport.connected)
+            # The server sees the socket closed
+            self.server.thread.join(1)
+            self.assertFalse(self.server.thread.is_alive())
+        finally:
+            loop.close()
+
+
+class CountingSocket:
+    """Counts sendmsg() calls, each sending at most limit bytes."""
+    def __init__(self, sock, limit=None):
+        self._sock = sock
+        self.sendmsg = mock.Mock(side_effect=self._sendmsg)
+        self.limit = limit
+
+    def _sendmsg(self, parts):
+        if self.limit is None:
+            return self._sock.sendmsg(parts)
+        return self._sock.send(b''.join(parts)[:self.limit])
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TestVppTransportSocket(unittest.TestCase):
+    """Message thread of the socket transport on a socketpair."""
+    def start(self, **kwargs):
+        class Parent:
+            def has_context(self, msg):
+                return True
+
+        transport = vpp_transport_socket.VppTransport(
+            Parent(), read_timeout=1, server_address=None, **kwargs)
+        transport.connected = True
+        transport.socket, self.vpp = socket.socketpair()
+        transport.wakeup = socket.socketpair()
+        self.thread = threading.Thread(target=transport.msg_thread_func)
+        self.thread.start()
+        self.addCleanup(self.stop, transport)
+        return transport
+
+    def stop(self, transport):
+        transport.flow_control(0)
+        transport.wakeup[1].send(b'\0')
+        self.thread.join()
+        self.assertIsNone(transport.read())
+        for s in (self.vpp, transport.socket) + transport.wakeup:
+            s.close()
+
+    def send(self, transport, msgs):
+        for msg in msgs:
+            self.vpp.sendall(transport.header.pack(0, len(msg), 0) + msg)
+
+    def test_in_process_queue(self):
+        transport = self.start()
+        self.assertIsInstance(transport.q, queue.SimpleQueue)
+        self.send(transport, [b'\x00\x01hello', b'\x00\x02world'])
+        self.assertEqual(bytes(transport.read()), b'\x00\x01hello')
+        self.assertEqual(bytes(transport.read()), b'\x00\x02world')
+
+    def test_multiprocess_queue(self):
+        transport = self.start(multiprocess=True)
+        self.assertNotIsInstance(transport.q, queue.SimpleQueue)
+        self.send(transport, [b'\x00\x01hello'])
+        self.assertEqual(bytes(transport.read()), b'\x00\x01hello')
+
+    def test_flow_control(self):
+        transport = self.start()
+        transport.flow_control(2)
+        msgs = [struct.pack('>HI', 1, n) for n in range(5)]
+        self.send(transport, msgs)
+        while transport.rx_space.is_set():
+            time.sleep(0.01)
+        self.assertEqual(transport.q.qsize(), 2)
+        self.assertEqual([bytes(transport.read()) for m in msgs], msgs)
+        self.assertEqual(transport.flow_control(3), 2)
+
+    def test_flow_control_wait(self):
+        transport = self.start()
+        transport.rx_wait = 0.05
+        transport.flow_control(2)
+        msgs = [struct.pack('>HI', 1, n) for n in range(5)]
+        self.send(transport, msgs)
+        # Queued past the limit once nothing was read for rx_wait
+        deadline = time.time() + 5
+        while transport.q.qsize() < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(transport.q.qsize(), 5)
+        self.assertEqual([bytes(transport.read()) for m in msgs], msgs)
+
+    def received(self, transport, size):
+        data = b''
+        while len(data) < size:
+            data += self.vpp.recv(size - len(data))
+        return data
+
+    def test_write(self):
+        transport = self.start()
+        msgs = [b'\x00\x01hello', bytearray(b'\x00\x02world')]
+        expected = b''.join(transport.header.pack(0, len(m), 0) + m
+                            for m in msgs)
+        transport.socket = CountingSocket(transport.socket)
+        m = transport.socket.sendmsg
+        transport.write(msgs[0])
+        self.assertEqual(m.call_count, 1)
+        transport.write_many(msgs)
+        self.assertEqual(m.call_count, 2)
+
+        transport.cork()
+        for msg in msgs:
+            transport.write(msg)
+        self.assertEqual(m.call_count, 2)
+        transport.uncork()
+        self.assertEqual(m.call_count, 3)
+
+        # A read sends the gathered messages
+        transport.cork()
+        transport.write(msgs[0])
+        self.assertIsNone(transport.read(timeout=0.01))
+        self.assertEqual(m.call_count, 4)
+        self.assertEqual(transport.pending, [])
+        self.assertEqual(self.received(transport, 3 * len(expected)),
+                         expected[:23] + expected + expected + expected[:23])
+
+    def test_write_partial(self):
+        transport = self.start()
+        transport.socket = CountingSocket(transport.socket, limit=7)
+        m = transport.socket.sendmsg
+        transport.write_many([b'\x00\x01hello', b'\x00\x02world'])
+        self.assertEqual(m.call_count, 7)
+        self.assertEqual(self.received(transport, 46),
+                         transport.header.pack(0, 7, 0) + b'\x00\x01hello' +
+                         transport.header.pack(0, 7, 0) + b'\x00\x02world')
+
 
 class TestVppPapiLogging(unittest.TestCase):
     def test_logger(self):
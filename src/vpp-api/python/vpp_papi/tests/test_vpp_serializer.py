@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
+import threading
 import unittest
+from unittest import mock
 from vpp_papi.vpp_serializer import VPPType, VPPEnumType, VPPEnumFlagType
 from vpp_papi.vpp_serializer import VPPUnionType, VPPMessage
+from vpp_papi.vpp_serializer import VPPLazyMessage, types, vpp_get_type
 from vpp_papi.vpp_serializer import VPPTypeAlias, VPPSerializerValueError
 from vpp_papi import MACAddress
+from vpp_papi import vpp_serializer
+from vpp_papi.vpp_serializer import np
 from socket import inet_pton, AF_INET, AF_INET6
 import logging
 import sys
@@ -608,6 +613,413 @@ class TestAddType(unittest.TestCase):
         self.assertEqual(str(nt.address.mac), 'aa:bb:cc:dd:ee:ff')
         self.assertIsNone(nt.address.prefix)
 
+    def test_compiled_struct(self):
+        VPPEnumType('vl_api_compiled_enum_t', [["FOO", 0],
+                                               ["BAR", 1],
+                                               {"enumtype": "u8"}])
+        VPPUnionType('vl_api_compiled_union_t',
+                     [["u8", "small"],
+                      ["u32", "large"]])
+        inner = VPPType('vl_api_compiled_inner_t',
+                        [['vl_api_compiled_enum_t', 'e'],
+                         ['f64', 'f'],
+                         ['u8', 'mac', 6],
+                         ['vl_api_compiled_union_t', 'un']])
+        fixed = VPPMessage('compiled_fixed',
+                           [['u16', '_vl_msg_id'],
+                            ['u32', 'context'],
+                            ['vl_api_compiled_inner_t', 'inner', 2],
+                            ['string', 'name', 8]])
+        vla = VPPMessage('compiled_vla',
+                         [['u16', '_vl_msg_id'],
+                          ['u8', 'count'],
+                          ['vl_api_compiled_inner_t', 'inners', 0, 'count'],
+                          ['u32', 'trailer']])
+
+        # Fixed size messages are packed with a single struct
+        self.assertEqual(len(fixed._runs), 1)
+        self.assertEqual(fixed._struct.size, 2 + 4 + 2 * 19 + 8)
+        self.assertIsNone(vla._struct)
+        self.assertEqual(len(vla._runs), 3)
+
+        i = {'e': 1, 'f': 1.5, 'mac': b'\x01\x02', 'un': {'large': 7}}
+        b = fixed.pack({'_vl_msg_id': 1, 'context': 2, 'inner': [i, {}],
+                        'name': 'foo'})
+        self.assertEqual(len(b), fixed._struct.size)
+        nt, size = fixed.unpack(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual(nt.name, 'foo')
+        self.assertEqual(nt.inner[0].e, 1)
+        self.assertEqual(nt.inner[0].f, 1.5)
+        self.assertEqual(nt.inner[0].mac, b'\x01\x02\x00\x00\x00\x00')
+        self.assertEqual(nt.inner[0].un.large, 7)
+        self.assertEqual(nt.inner[1].f, 0)
+        args = {'_vl_msg_id': 1, 'context': 2, 'inner': [i, {}],
+                'name': 'foo'}
+        self.assertEqual(b, fixed._pack_fields(args, args))
+
+        b = vla.pack({'_vl_msg_id': 1, 'count': 2, 'inners': [i, i],
+                      'trailer': 5})
+        self.assertEqual(len(b), 2 + 1 + 2 * 19 + 4)
+        nt, size = vla.unpack(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual(nt.inners[1].un.large, 7)
+        self.assertEqual(nt.trailer, 5)
+
+        # Short buffers still report through the per field packers
+        with self.assertRaises(VPPSerializerValueError):
+            inner.unpack(b'\x00' * 12)
+
+    def test_unpack_view(self):
+        VPPTypeAlias('vl_api_ip4_address_t', {'type': 'u8',
+                                              'length': 4})
+        inner = VPPType('vl_api_view_inner_t',
+                        [['u32', 'a'],
+                         ['vl_api_ip4_address_t', 'address']])
+        msg = VPPMessage('view_msg',
+                         [['u16', '_vl_msg_id'],
+                          ['u32', 'context'],
+                          ['vl_api_view_inner_t', 'inner'],
+                          ['string', 'name', 0],
+                          ['u8', 'count'],
+                          ['u8', 'data', 0, 'count']])
+        b = msg.pack({'_vl_msg_id': 1, 'context': 7,
+                      'inner': {'a': 3, 'address': '1.2.3.4'},
+                      'name': 'foo', 'count': 2, 'data': b'xy'})
+        nt, size = msg.unpack(b)
+
+        buf = bytearray(b)
+        r = msg.unpack_view(memoryview(buf))
+        self.assertEqual(type(r).__name__, 'view_msg')
+        self.assertEqual(r.context, 7)
+        self.assertEqual(r.inner.a, 3)
+        self.assertEqual(str(r.inner.address), '1.2.3.4')
+        self.assertIsNone(r._tuple)
+        # Fields after a variable length field decode the full record
+        self.assertEqual(r.data, b'xy')
+        self.assertEqual(r.name, 'foo')
+        self.assertIsNotNone(r._tuple)
+        self.assertEqual(r, nt)
+        self.assertEqual(r._asdict(), nt._asdict())
+
+        r = msg.unpack_view(memoryview(buf), ntc=True)
+        self.assertEqual(r.inner.address, b'\x01\x02\x03\x04')
+
+    def test_lazy_message(self):
+        msgdef = [['u16', '_vl_msg_id'], ['u32', 'context'],
+                  ['u8', 'flag'], {'crc': '0x12345678'}]
+        msg = VPPLazyMessage('lazy_msg', msgdef)
+        self.assertIs(type(msg), VPPLazyMessage)
+        self.assertEqual(msg.crc, '0x12345678')
+        self.assertIs(vpp_get_type('lazy_msg'), msg)
+        b = msg.pack({'_vl_msg_id': 1, 'context': 2, 'flag': 3})
+        self.assertIs(type(msg), VPPMessage)
+        self.assertEqual(len(b), 7)
+
+        msg = VPPLazyMessage('lazy_msg_unpack', msgdef)
+        nt, size = msg.unpack(b)
+        self.assertEqual((nt.context, nt.flag, size), (2, 3, 7))
+
+        msg = VPPLazyMessage('lazy_msg_fields', msgdef)
+        self.assertEqual(msg.fields, ['_vl_msg_id', 'context', 'flag'])
+        self.assertIs(type(msg), VPPMessage)
+
+        # A build waits for one in progress in another thread
+        msg = VPPLazyMessage('lazy_msg_threads', msgdef)
+        results = []
+        with vpp_serializer._build_lock:
+            t = threading.Thread(target=lambda: results.append(
+                msg.unpack(b)[0].flag))
+            t.start()
+            t.join(0.05)
+            self.assertTrue(t.is_alive())
+            self.assertIs(type(msg), VPPLazyMessage)
+        t.join()
+        self.assertEqual(results, [3])
+        self.assertIs(type(msg), VPPMessage)
+
+    def test_raw(self):
+        ip4 = VPPTypeAlias('vl_api_raw_ip4_t', {'type': 'u8', 'length': 4})
+        union = VPPUnionType('vl_api_raw_union_t',
+                             [['u32', 'a'], ['vl_api_raw_ip4_t', 'b'],
+                              ['u64', 'c']])
+        pair = VPPType('vl_api_raw_pair_t',
+                       [['u16', 'x'], ['vl_api_raw_ip4_t', 'ip']])
+        msg = VPPType('raw_msg', [['u8', 'a'],
+                                  ['vl_api_raw_pair_t', 'pair'],
+                                  ['vl_api_raw_pair_t', 'pairs', 2],
+                                  ['vl_api_raw_union_t', 'un'],
+                                  ['u8', 'n'],
+                                  ['vl_api_raw_pair_t', 'vla', 0, 'n']])
+        args = {'a': 1, 'pair': {'x': 2, 'ip': b'\x01\x02\x03\x04'},
+                'pairs': [{'x': 3}, {'x': 4}], 'un': {'a': 5}, 'n': 2,
+                'vla': [{'x': 6}, {'x': 7}]}
+        b = msg.pack(args)
+
+        packed_pair = pair.pack(args['pair'])
+        self.assertEqual(pair.pack(packed_pair), packed_pair)
+        self.assertEqual(pair.pack(bytearray(packed_pair)), packed_pair)
+        raw = dict(args,
+                   pair=packed_pair,
+                   pairs=b''.join(pair.pack(p) for p in args['pairs']),
+                   un=union.pack(args['un']),
+                   vla=[pair.pack(p) for p in args['vla']])
+        self.assertEqual(msg.pack(raw), b)
+        # Unions are padded like when packing a member
+        self.assertEqual(msg.pack(dict(raw, un=b'\x00\x00\x00\x05')), b)
+
+        with self.assertRaises(VPPSerializerValueError):
+            pair.pack(packed_pair[1:])
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack(dict(raw, pair=packed_pair + b'\x00'))
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack(dict(raw, pairs=packed_pair))
+
+        # Fixed strings are part of the packed size
+        entry = VPPType('vl_api_raw_entry_t',
+                        [['u16', 'index'], ['string', 'name', 64]])
+        holder = VPPType('raw_entry_msg', [['vl_api_raw_entry_t', 'e'],
+                                           ['vl_api_raw_entry_t', 'es', 2]])
+        packed_entry = entry.pack({'index': 1, 'name': 'foo'})
+        self.assertEqual(len(packed_entry), 66)
+        self.assertEqual(entry.pack(packed_entry), packed_entry)
+        self.assertEqual(holder.pack({'e': packed_entry,
+                                      'es': packed_entry * 2}),
+                         packed_entry * 3)
+        self.assertEqual(holder.unpack(packed_entry * 3)[0].es[1].name,
+                         'foo')
+        with self.assertRaises(VPPSerializerValueError):
+            entry.pack(packed_entry[:3])
+
+    def test_unpack_compact(self):
+        VPPTypeAlias('vl_api_ip4_address_t', {'type': 'u8',
+                                              'length': 4})
+        flags = VPPEnumType('vl_api_compact_flags_t',
+                            [['NONE', 0], ['UP', 1],
+                             {'enumtype': 'u8'}])
+        label = VPPType('vl_api_compact_label_t',
+                        [['u32', 'label'], ['u8', 'ttl']])
+        path = VPPType('vl_api_compact_path_t',
+                       [['u32', 'sw_if_index'],
+                        ['vl_api_ip4_address_t', 'nh'],
+                        ['vl_api_compact_flags_t', 'flags'],
+                        ['vl_api_compact_label_t', 'labels', 2]])
+        msg = VPPMessage('compact_msg',
+                         [['u16', '_vl_msg_id'],
+                          ['u32', 'context'],
+                          ['vl_api_compact_path_t', 'first'],
+                          ['string', 'name', 0],
+                          ['u8', 'n_paths'],
+                          ['vl_api_compact_path_t', 'paths', 0,
+                           'n_paths']])
+        p1 = {'sw_if_index': 1, 'nh': '1.2.3.4', 'flags': 1,
+              'labels': [{'label': 16, 'ttl': 64}, {'label': 17}]}
+        p2 = {'sw_if_index': 2, 'nh': '5.6.7.8',
+              'labels': [{}, {'label': 18}]}
+        b = msg.pack({'_vl_msg_id': 1, 'context': 7, 'first': p1,
+                      'name': 'foo', 'n_paths': 2, 'paths': [p1, p2]})
+        nt, size = msg.unpack(b)
+
+        r, compact_size = msg.unpack_compact(b)
+        self.assertEqual(compact_size, size)
+        self.assertEqual(type(r).__name__, 'compact_msg')
+        self.assertEqual(r.context, 7)
+        self.assertEqual(r.first.sw_if_index, 1)
+        self.assertEqual(str(r.first.nh), '1.2.3.4')
+        self.assertEqual(r.first.flags, flags.UP)
+        self.assertEqual(r.first.labels[1].label, 17)
+        self.assertEqual(r.name, 'foo')
+        self.assertEqual(r.paths[1].labels[1].label, 18)
+        self.assertEqual(r.paths[1]._astuple(), nt.paths[1])
+        self.assertEqual(r.first.labels[0]._asdict(),
+                         nt.first.labels[0]._asdict())
+        self.assertEqual(repr(r), repr(nt))
+        # The first path is inline in the message record
+        self.assertEqual(len(r), 2 + 3 + 2 * 2 + 3)
+
+        p, size = path.unpack_compact(path.pack(p2))
+        self.assertEqual(size, path.size)
+        self.assertEqual(p._astuple(), path.unpack(path.pack(p2))[0])
+
+    def test_unpack_compact_string(self):
+        VPPType('vl_api_compact_entry_t',
+                [['u16', 'index'], ['string', 'name', 64]])
+        msg = VPPMessage('compact_sockclnt_create_reply',
+                         [['u16', '_vl_msg_id'], ['u32', 'client_index'],
+                          ['u32', 'context'], ['i32', 'response'],
+                          ['u32', 'index'], ['u16', 'count'],
+                          ['vl_api_compact_entry_t', 'message_table',
+                           0, 'count']])
+        table = [{'index': i, 'name': 'msg_%d_12345678' % i}
+                 for i in range(1, 4)]
+        b = msg.pack({'_vl_msg_id': 16, 'context': 1, 'count': 3,
+                      'message_table': table})
+        r, size = msg.unpack_compact(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual([(e.index, e.name) for e in r.message_table],
+                         [(e['index'], e['name']) for e in table])
+
+    def test_unpack_array(self):
+        VPPTypeAlias('vl_api_ip4_address_t', {'type': 'u8',
+                                              'length': 4})
+        VPPEnumType('vl_api_array_action_t',
+                    [['DENY', 0], ['PERMIT', 1], {'enumtype': 'u8'}])
+        rule = VPPType('vl_api_array_rule_t',
+                       [['vl_api_array_action_t', 'action'],
+                        ['vl_api_ip4_address_t', 'src'],
+                        ['u16', 'port']])
+        msg = VPPType('array_msg', [['u32', 'ids', 3],
+                                    ['vl_api_array_rule_t', 'fixed', 2],
+                                    ['u32', 'count'],
+                                    ['vl_api_array_rule_t', 'rules', 0,
+                                     'count'],
+                                    ['u16', 'ports', 0, 'count']])
+        rules = [{'action': i % 2, 'src': '10.0.0.%d' % i, 'port': i}
+                 for i in range(5)]
+        b = msg.pack({'ids': [1, 2, 3], 'fixed': rules[:2], 'count': 5,
+                      'rules': rules, 'ports': list(range(5))})
+        nt, size = msg.unpack(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual(nt.ids, [1, 2, 3])
+        self.assertEqual(nt.fixed[1].src, IPv4Address('10.0.0.1'))
+        self.assertEqual([r.port for r in nt.rules], list(range(5)))
+        self.assertEqual(nt.rules[3].action, 1)
+        self.assertEqual(nt.rules[3], rule.unpack(rule.pack(rules[3]))[0])
+        self.assertEqual(nt.ports, list(range(5)))
+        nt, size = msg.unpack(b, ntc=True)
+        self.assertEqual(nt.rules[2].src, b'\x0a\x00\x00\x02')
+
+        legacy = VPPType('array_legacy_msg',
+                         [['u8', 'n'], ['vl_api_array_rule_t', 'rules', 0]])
+        nt, size = legacy.unpack(legacy.pack({'n': 2, 'rules': rules[:2]}))
+        self.assertEqual([r.port for r in nt.rules], [0, 1])
+
+        with self.assertRaises(VPPSerializerValueError):
+            msg.unpack(b[:-4])
+
+    def test_unpack_array_string(self):
+        entry = VPPType('vl_api_message_table_entry_t',
+                        [['u16', 'index'], ['string', 'name', 64]])
+        msg = VPPMessage('sockclnt_create_reply',
+                         [['u16', '_vl_msg_id'], ['u32', 'client_index'],
+                          ['u32', 'context'], ['i32', 'response'],
+                          ['u32', 'index'], ['u16', 'count'],
+                          ['vl_api_message_table_entry_t', 'message_table',
+                           0, 'count']])
+        self.assertEqual(entry.size, 66)
+        table = [{'index': i, 'name': 'msg_%d_12345678' % i}
+                 for i in range(1, 4)]
+        b = msg.pack({'_vl_msg_id': 16, 'context': 1, 'count': 3,
+                      'message_table': table})
+        self.assertEqual(len(b), 20 + 3 * 66)
+        nt, size = msg.unpack(b)
+        self.assertEqual(size, len(b))
+        self.assertEqual([(e.index, e.name) for e in nt.message_table],
+                         [(e['index'], e['name']) for e in table])
+
+    @unittest.skipIf(np is None, 'requires NumPy')
+    def test_unpack_numpy(self):
+        VPPTypeAlias('vl_api_ip4_address_t', {'type': 'u8',
+                                              'length': 4})
+        rule = VPPType('vl_api_numpy_rule_t',
+                       [['u8', 'action'],
+                        ['vl_api_ip4_address_t', 'src'],
+                        ['u16', 'ports', 2]])
+        b = b''.join(rule.pack({'action': i, 'src': '10.0.0.%d' % i,
+                                'ports': [i, i + 1]}) for i in range(4))
+        a = rule.unpack_numpy(b)
+        self.assertEqual(len(a), 4)
+        self.assertEqual(a['action'].tolist(), [0, 1, 2, 3])
+        self.assertEqual(bytes(a['src'][2]), b'\x0a\x00\x00\x02')
+        self.assertEqual(a['ports'][3].tolist(), [3, 4])
+        self.assertEqual(len(rule.unpack_numpy(b, rule.size, 2)), 2)
+
+    def test_pack_array(self):
+        item = VPPType('vl_api_pack_item_t', [['u16', 'a'], ['u32', 'b']])
+        msg = VPPType('pack_array_msg', [['vl_api_pack_item_t', 'fixed', 2],
+                                         ['u32', 'count'],
+                                         ['vl_api_pack_item_t', 'items', 0,
+                                          'count'],
+                                         ['u32', 'ids', 0, 'count']])
+        items = [{'a': i, 'b': i * 1000} for i in range(3)]
+        b = msg.pack({'fixed': items[:2], 'count': 3, 'items': items,
+                      'ids': [7, 8, 9]})
+        self.assertEqual(b, b''.join(
+            [item.pack(i) for i in items[:2]] + [b'\x00\x00\x00\x03'] +
+            [item.pack(i) for i in items] +
+            [b'\x00\x00\x00\x07\x00\x00\x00\x08\x00\x00\x00\x09']))
+        nt, size = msg.unpack(b)
+        self.assertEqual([i.b for i in nt.items], [0, 1000, 2000])
+
+        packed = b''.join(item.pack(i) for i in items)
+        self.assertEqual(msg.pack({'fixed': packed[:2 * item.size],
+                                   'count': 3, 'items': packed,
+                                   'ids': [7, 8, 9]}), b)
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack({'fixed': items[:2], 'count': 2, 'items': packed,
+                      'ids': [7, 8]})
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack({'fixed': items[:2], 'count': 3,
+                      'items': packed[:-1], 'ids': [7, 8, 9]})
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack({'fixed': items, 'count': 3, 'items': items,
+                      'ids': [7, 8, 9]})
+
+        if np is not None:
+            a = np.array([(i['a'], i['b']) for i in items],
+                         dtype=[('a', np.uint16), ('b', np.uint32)])
+            self.assertEqual(msg.pack({'fixed': a[:2], 'count': 3,
+                                       'items': a,
+                                       'ids': np.array([7, 8, 9])}), b)
+
+    def test_pack_array_string(self):
+        entry = VPPType('vl_api_pack_entry_t',
+                        [['u16', 'index'], ['string', 'name', 20]])
+        msg = VPPType('pack_entry_msg', [['u32', 'count'],
+                                         ['vl_api_pack_entry_t', 'entries',
+                                          0, 'count']])
+        entries = [{'index': 1, 'name': 'foo'}, {'index': 2, 'name': 'bar'}]
+        packed = b''.join(entry.pack(e) for e in entries)
+        self.assertEqual(len(packed), 44)
+        b = msg.pack({'count': 2, 'entries': entries})
+        self.assertEqual(b, b'\x00\x00\x00\x02' + packed)
+        self.assertEqual(msg.pack({'count': 2, 'entries': packed}), b)
+        # Packed in the preallocated buffer, not element by element
+        with mock.patch.object(entry, 'pack') as pack:
+            self.assertEqual(msg.pack({'count': 2, 'entries': entries}), b)
+        pack.assert_not_called()
+        with self.assertRaises(VPPSerializerValueError):
+            msg.pack({'count': 2, 'entries': packed[:-1]})
+
+    def test_lazy_type(self):
+        built = []
+
+        def factory():
+            built.append('vl_api_lazy_t')
+            return VPPType('vl_api_lazy_t', [['u32', 'a'], ['u32', 'b']])
+
+        types.define('vl_api_lazy_t', factory)
+        self.assertIn('vl_api_lazy_t', types)
+        self.assertEqual(built, [])
+
+        user = VPPType('lazy_user', [['vl_api_lazy_t', 'x']])
+        self.assertEqual(built, ['vl_api_lazy_t'])
+        b = user.pack({'x': {'a': 1, 'b': 2}})
+        self.assertEqual(user.unpack(b)[0].x.b, 2)
+
+        # Defining an existing type has no effect
+        types.define('vl_api_lazy_t', factory)
+        vpp_get_type('vl_api_lazy_t')
+        self.assertEqual(built, ['vl_api_lazy_t'])
+
+        # A failed build can be retried
+        types.define('vl_api_lazy_broken_t', lambda: VPPType(
+            'vl_api_lazy_broken_t', [['vl_api_undefined_t', 'x']]))
+        for i in range(2):
+            with self.assertRaises(VPPSerializerValueError):
+                vpp_get_type('vl_api_lazy_broken_t')
+        self.assertIn('vl_api_lazy_broken_t', types)
+
 
 class TestVppSerializerLogging(unittest.TestCase):
 
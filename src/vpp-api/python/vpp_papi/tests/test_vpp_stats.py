@@ -0,0 +1,529 @@
+#  Copyright (c) 2021 Cisco and/or its affiliates.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+import mmap
+import re
+import struct
+import threading
+import unittest
+from unittest import mock
+
+from vpp_papi import vpp_stats
+
+np = vpp_stats.np
+
+
+class FakeSegment:
+    '''Epoch and in progress flag of a stats segment'''
+    in_progress = False
+    epoch = 1
+
+
+class FakeStatsSegment:
+    '''Stats segment, version 2, built in anonymous memory'''
+    base = 0x7f0000000000
+    header = vpp_stats.VPPStats.shared_headerfmt
+    entry = struct.Struct(vpp_stats.VPPStats.elementfmt)
+
+    def __init__(self, size=1 << 20, threads=2):
+        self.size = size
+        self.threads = threads
+        self.mmap = mmap.mmap(-1, size)
+        self.top = 4096
+        self.entries = []
+        self.header.pack_into(self.mmap, 0, 2, self.base, 1, 0, 0, 0)
+        self.error_rows = [self.vector(bytes(8 * 64), 64)
+                           for _ in range(threads)]
+        self._set_header(5, self.pointers(self.error_rows))
+
+    def _set_header(self, field, value):
+        header = list(self.header.unpack_from(self.mmap))
+        header[field] = value
+        self.header.pack_into(self.mmap, 0, *header)
+
+    @property
+    def epoch(self):
+        return self.header.unpack_from(self.mmap)[2]
+
+    @epoch.setter
+    def epoch(self, epoch):
+        self._set_header(2, epoch)
+
+    def vector(self, data, length):
+        '''Copy data into a new vector of length elements, return its
+        pointer'''
+        offset = (self.top + 16 + 15) & ~15
+        vpp_stats.VEC_LEN_FMT.pack_into(self.mmap, offset - 8, length)
+        self.mmap[offset:offset + len(data)] = data
+        self.top = offset + len(data)
+        return self.base + offset
+
+    def pointers(self, pointers):
+        return self.vector(struct.pack('%dP' % len(pointers), *pointers),
+                           len(pointers))
+
+    def simple(self, rows):
+        '''Pointer of a simple counter, rows of values by thread'''
+        return self.pointers([self.vector(struct.pack('%dQ' % len(row),
+                                                      *row), len(row))
+                              for row in rows])
+
+    def combined(self, rows):
+        '''Pointer of a combined counter, rows of (packets, octets)'''
+        return self.pointers([
+            self.vector(struct.pack('%dQ' % (2 * len(row)),
+                                    *[v for pair in row for v in pair]),
+                        len(row))
+            for row in rows])
+
+    def set_error(self, index, values):
+        '''Set error counter index to values by thread'''
+        for row, value in zip(self.error_rows, values):
+            struct.pack_into('Q', self.mmap, row - self.base + 8 * index,
+                             value)
+
+    def write(self, pointer, fmt, *values):
+        struct.pack_into(fmt, self.mmap, pointer - self.base, *values)
+
+    def set_directory(self, entries):
+        '''Write a new directory of (type, value, name) entries and
+        change the epoch'''
+        self.entries = list(entries)
+        data = b''.join(self.entry.pack(t, v, name.encode())
+                        for t, v, name in self.entries)
+        self._set_header(4, self.vector(data, len(self.entries)))
+        self.epoch += 1
+
+
+class FakeStats(vpp_stats.VPPStats):
+    '''VPPStats reading a FakeStatsSegment'''
+
+    def __init__(self, segment, **kwargs):
+        super().__init__(**kwargs)
+        self.segment = segment
+
+    def connect(self):
+        self.statseg = self.segment.mmap
+        self.size = self.segment.size
+        self.refresh()
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+
+class TestStatsLock(unittest.TestCase):
+    def test_nested(self):
+        segment = FakeSegment()
+        lock = vpp_stats.StatsLock(segment)
+        with self.assertRaises(IOError):
+            with lock:
+                with lock:
+                    segment.epoch += 1
+                # Only the outermost with block validates the read
+                self.assertEqual(lock.depth, 1)
+        self.assertEqual(lock.depth, 0)
+
+    def test_threads(self):
+        segment = FakeSegment()
+        lock = vpp_stats.StatsLock(segment)
+        entered = threading.Event()
+        done = threading.Event()
+        errors = []
+
+        def reader():
+            try:
+                with lock:
+                    entered.set()
+                    done.wait()
+            except IOError as err:
+                errors.append(err)
+
+        t = threading.Thread(target=reader)
+        with lock:
+            t.start()
+            entered.wait()
+            # The other thread's read is invalidated, not skipped
+            segment.epoch += 1
+            done.set()
+            t.join()
+            self.assertEqual(len(errors), 1)
+            self.assertEqual(lock.depth, 1)
+            segment.epoch -= 1
+
+
+class TestStatsDirectory(unittest.TestCase):
+    def check(self, stats, entries):
+        self.assertEqual(stats.directory_by_idx,
+                         {i: name for i, (_, _, name) in enumerate(entries)})
+        self.assertEqual(sorted(stats.directory),
+                         sorted(name for _, _, name in entries))
+        for t, v, name in entries:
+            self.assertEqual(stats.directory[name].type, t)
+            self.assertEqual(stats[name], v)
+
+    def test_update(self):
+        segment = FakeStatsSegment()
+        # More than a block of 64 entries compared at once
+        entries = [(1, i, '/sys/counter-%d' % i) for i in range(150)]
+        segment.set_directory(entries)
+        stats = FakeStats(segment)
+        stats.connect()
+        self.check(stats, entries)
+        unchanged = stats.directory['/sys/counter-100']
+
+        # Added at the end, the value of one changed
+        entries += [(1, 1000, '/sys/added-1'), (1, 1001, '/sys/added-2')]
+        entries[3] = (1, 33, '/sys/counter-3')
+        segment.set_directory(entries)
+        self.assertEqual(stats['/sys/added-2'], 1001)
+        self.check(stats, entries)
+        self.assertIs(stats.directory['/sys/counter-100'], unchanged)
+
+        # Renamed in place and removed from the end
+        entries[70] = (1, 70, '/sys/renamed')
+        del entries[-3:]
+        segment.set_directory(entries)
+        self.assertEqual(stats['/sys/renamed'], 70)
+        self.check(stats, entries)
+        self.assertNotIn('/sys/counter-70', stats.directory)
+        self.assertNotIn('/sys/added-1', stats.directory)
+        self.assertIs(stats.directory['/sys/counter-100'], unchanged)
+
+        # Moved to another index, as when an entry before it was freed
+        entries[5], entries[6] = entries[6], entries[5]
+        segment.set_directory(entries)
+        self.assertEqual(stats['/sys/counter-5'], 5)
+        self.check(stats, entries)
+
+        # Removed entries are freed in place, the name cleared
+        entries[8] = (0, 0, '')
+        segment.set_directory(entries)
+        stats.refresh()
+        self.assertNotIn('/sys/counter-8', stats.directory)
+        self.assertEqual(stats.directory_by_idx[8], '')
+
+
+class TestStatsLs(unittest.TestCase):
+    def setUp(self):
+        segment = FakeStatsSegment()
+        names = ['/if/tx', '/if/rx', '/err/ip4-input/drops', '/if/rx-miss',
+                 '/sys/heartbeat', '/if/names', '/iface/up']
+        segment.set_directory([(1, i, name) for i, name in
+                               enumerate(names)])
+        self.stats = FakeStats(segment)
+
+    def test_ls(self):
+        interfaces = ['/if/names', '/if/rx', '/if/rx-miss', '/if/tx']
+        # Sorted, not in directory order
+        self.assertEqual(self.stats.ls('^/if/'), interfaces)
+        self.assertEqual(self.stats.ls(['/if/', '/if/rx']), interfaces)
+        self.assertEqual(self.stats.ls('/if/rx'), ['/if/rx', '/if/rx-miss'])
+        self.assertEqual(self.stats.ls('/if'),
+                         interfaces + ['/iface/up'])
+        self.assertEqual(self.stats.ls('^/if/.*x$'), ['/if/rx', '/if/tx'])
+        self.assertEqual(self.stats.ls('.*drops'), ['/err/ip4-input/drops'])
+        self.assertEqual(self.stats.ls(['/sys', '/err|/iface']),
+                         ['/err/ip4-input/drops', '/iface/up',
+                          '/sys/heartbeat'])
+        self.assertEqual(self.stats.ls('/if/r?x', glob=True), [])
+        self.assertEqual(self.stats.ls('/if/r*', glob=True),
+                         ['/if/rx', '/if/rx-miss'])
+        self.assertEqual(self.stats.ls('/if/rx', glob=True), ['/if/rx'])
+        self.assertEqual(self.stats.ls('/foobar*', glob=True), [])
+        self.assertEqual(self.stats.ls('/foobar'), [])
+
+        # The names re.match() finds in the directory
+        for pattern in ['^/i', '/if/rx$', '/if/(rx|tx)', '/if/rx+',
+                        '/if/rx?', '/if/[rt]x', '/(sys|err)/', '^$',
+                        re.compile('/if/.*s')]:
+            self.assertEqual(self.stats.ls(pattern),
+                             sorted(k for k in self.stats.directory
+                                    if re.match(pattern, k)), pattern)
+
+
+class TestStatsErrors(unittest.TestCase):
+    def setUp(self):
+        self.segment = FakeStatsSegment(threads=3)
+        self.segment.set_error(0, [1, 2, 3])
+        self.segment.set_error(2, [0, 0, 5])
+        self.segment.set_error(4, [7, 0, 0])
+        self.segment.set_error(63, [0, 1, 0])
+        self.segment.set_directory([
+            (4, 0, '/err/ip4-input/drops'),
+            (4, 1, '/err/ip4-input/zero'),
+            (4, 2, '/err/ip6-input/drops'),
+            # Not an error counter name, left out
+            (4, 4, '/sys/errors'),
+            (4, 63, '/err/last/counter'),
+        ])
+        self.expected = {'/err/ip4-input/drops': 6,
+                         '/err/ip6-input/drops': 5,
+                         '/err/last/counter': 1}
+
+    def test_set_errors(self):
+        stats = FakeStats(self.segment)
+        errors = stats.set_errors()
+        self.assertEqual(errors, self.expected)
+        self.assertEqual(list(map(type, errors.values())), [int] * 3)
+        for name, total in errors.items():
+            self.assertEqual(total, stats.get_err_counter(name))
+        self.assertIn('/err/ip6-input/drops', stats.set_errors_str())
+
+        # Names are looked up again after an epoch change
+        self.segment.set_directory(self.segment.entries[:1])
+        self.assertEqual(stats.set_errors(), {'/err/ip4-input/drops': 6})
+
+    def test_set_errors_without_numpy(self):
+        stats = FakeStats(self.segment)
+        with mock.patch.object(vpp_stats, 'np', None):
+            self.assertEqual(stats.set_errors(), self.expected)
+
+
+@unittest.skipIf(np is None, 'requires NumPy')
+class TestStatsArrays(unittest.TestCase):
+    def setUp(self):
+        self.segment = FakeStatsSegment()
+        self.rx_miss = self.segment.simple([[1, 2, 3], [4, 5, 6]])
+        self.rx = self.segment.combined([[(1, 64), (2, 128)],
+                                         [(3, 192), (4, 256)]])
+        self.segment.set_error(3, [7, 8])
+        self.segment.set_directory([
+            (2, self.rx_miss, '/if/rx-miss'),
+            (3, self.rx, '/if/rx'),
+            (4, 3, '/err/ip4-input/drops'),
+        ])
+        self.stats = FakeStats(self.segment)
+
+    def test_get_array(self):
+        rx_miss = self.stats.get_array('/if/rx-miss')
+        self.assertEqual(rx_miss.dtype, np.uint64)
+        self.assertEqual(rx_miss.tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(rx_miss.tolist(), self.stats['/if/rx-miss'])
+        rx = self.stats.get_array('/if/rx')
+        self.assertEqual(rx.dtype, vpp_stats.COMBINED_DTYPE)
+        self.assertEqual(rx['octets'][:, 1].tolist(), [128, 256])
+        self.assertEqual(rx['packets'][:, 1].sum(),
+                         self.stats['/if/rx'][:, 1].sum_packets())
+        self.assertEqual(
+            self.stats.get_array('/err/ip4-input/drops').tolist(), [7, 8])
+
+        # Arrays are copies
+        self.segment.write(self.stats.directory['/if/rx-miss'].value, 'P',
+                           self.segment.vector(struct.pack('2Q', 9, 9), 2))
+        self.assertEqual(rx_miss.tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(self.stats.get_array('/if/rx-miss').tolist(),
+                         [[9, 9, 0], [4, 5, 6]])
+
+        stats = FakeStats(self.segment, use_numpy=True)
+        self.assertEqual(stats['/if/rx'].dtype, vpp_stats.COMBINED_DTYPE)
+
+    def test_get_views(self):
+        views = self.stats.get_views('/if/rx-miss')
+        self.assertEqual([v.tolist() for v in views], [[1, 2, 3], [4, 5, 6]])
+        # Views follow the counters in the segment
+        row = struct.unpack_from('P', self.segment.mmap,
+                                 self.rx_miss - self.segment.base)[0]
+        self.segment.write(row, 'Q', 11)
+        self.assertEqual(views[0][0], 11)
+        views = self.stats.get_views('/if/rx')
+        self.assertEqual(views[1]['octets'].tolist(), [192, 256])
+        with self.assertRaises(ValueError):
+            self.stats.get_views('/err/ip4-input/drops')
+        del views
+
+    def test_overrun(self):
+        # Length of the first thread's vector beyond the segment end
+        row = struct.unpack_from('P', self.segment.mmap,
+                                 self.rx_miss - self.segment.base)[0]
+        vpp_stats.VEC_LEN_FMT.pack_into(self.segment.mmap,
+                                        row - self.segment.base - 8,
+                                        self.segment.size)
+        self.stats.connect()
+        with self.assertRaises(IOError):
+            self.stats.get_array('/if/rx-miss', blocking=False)
+        with self.assertRaises(IOError):
+            self.stats.get_views('/if/rx-miss')
+
+        # Checked for the size of the elements of the view
+        vector = vpp_stats.StatsVector(self.stats, self.segment.vector(
+            bytes(8), 1), 'Q')
+        vector.vec_len = (self.segment.size - vector.vec_start) // 16 + 1
+        with self.assertRaises(IOError):
+            vector.array(vpp_stats.COMBINED_DTYPE)
+
+
+@unittest.skipIf(np is None, 'requires NumPy')
+class TestStatsPoller(unittest.TestCase):
+    def setUp(self):
+        self.segment = FakeStatsSegment()
+        self.rx_miss = self.segment.simple([[0, 0], [0, 0]])
+        self.rx = self.segment.combined([[(0, 0)], [(0, 0)]])
+        self.segment.set_directory([
+            (2, self.rx_miss, '/if/rx-miss'),
+            (3, self.rx, '/if/rx'),
+            (4, 3, '/err/ip4-input/drops'),
+            (1, 5, '/sys/heartbeat'),
+        ])
+        self.stats = FakeStats(self.segment)
+
+    def row(self, counter, thread):
+        return struct.unpack_from('P', self.segment.mmap,
+                                  counter - self.segment.base + 8 * thread)[0]
+
+    def test_snapshot(self):
+        self.segment.write(self.row(self.rx_miss, 1), '2Q', 3, 4)
+        snapshot = self.stats.snapshot(['/if/rx-miss', '/sys/heartbeat'])
+        self.assertEqual(snapshot, {'/if/rx-miss': [[0, 0], [3, 4]],
+                                    '/sys/heartbeat': 5})
+        self.assertEqual(snapshot.epoch, self.segment.epoch)
+        self.assertGreater(snapshot.timestamp, 0)
+        snapshot = self.stats.snapshot(['/if/rx-miss'], use_numpy=True)
+        self.assertEqual(snapshot['/if/rx-miss'].tolist(), [[0, 0], [3, 4]])
+        self.assertEqual(self.stats.dump(['/sys/heartbeat']),
+                         {'/sys/heartbeat': 5})
+        with self.assertRaises(KeyError):
+            self.stats.snapshot(['/if/rx-miss', 'foobar'])
+
+    def test_snapshot_retry(self):
+        # The counters change while the snapshot is read, all of them
+        # are read again
+        self.stats.connect()
+        entry = self.stats.directory['/sys/heartbeat']
+        scalar = entry.function
+        reads = []
+
+        def read_scalar(stats):
+            reads.append(stats.lock.epoch)
+            if len(reads) == 1:
+                self.segment.write(self.row(self.rx_miss, 0), 'Q', 7)
+                self.segment.epoch += 1
+            return scalar(stats)
+
+        entry.function = read_scalar
+        snapshot = self.stats.snapshot(['/if/rx-miss', '/sys/heartbeat'])
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(snapshot['/if/rx-miss'], [[7, 0], [0, 0]])
+        self.assertEqual(snapshot.epoch, self.segment.epoch)
+
+    def test_poll(self):
+        poller = vpp_stats.StatsPoller(self.stats, ['^/'])
+        first = poller.poll()
+        self.assertEqual(len(first), 0)
+        self.assertIsNone(first.interval)
+
+        self.segment.write(self.row(self.rx_miss, 1), '2Q', 3, 4)
+        self.segment.write(self.row(self.rx, 0), '2Q', 2, 128)
+        self.segment.set_error(3, [1, 0])
+        deltas = poller.poll()
+        self.assertGreater(deltas.interval, 0)
+        self.assertEqual(sorted(deltas), ['/err/ip4-input/drops', '/if/rx',
+                                          '/if/rx-miss'])
+        self.assertEqual(deltas['/if/rx-miss'].delta.tolist(),
+                         [[0, 0], [3, 4]])
+        self.assertEqual(deltas['/if/rx'].delta['octets'].tolist(),
+                         [[128], [0]])
+        self.assertAlmostEqual(deltas['/if/rx'].rate['packets'][0, 0],
+                               2 / deltas.interval)
+        self.assertEqual(deltas['/err/ip4-input/drops'].delta.tolist(),
+                         [1, 0])
+        self.assertEqual(len(poller.poll()), 0)
+
+        # Cleared, counts from zero
+        self.segment.write(self.row(self.rx_miss, 1), '2Q', 1, 4)
+        deltas = poller.poll()
+        self.assertEqual(deltas['/if/rx-miss'].delta.tolist(),
+                         [[0, 0], [1, 0]])
+
+        # A new interface and a new counter after an epoch change
+        rx_miss = self.segment.simple([[0, 0, 2], [1, 4, 0]])
+        tx = self.segment.simple([[5], [0]])
+        entries = self.segment.entries
+        entries[0] = (2, rx_miss, '/if/rx-miss')
+        self.segment.set_directory(entries + [(2, tx, '/if/tx')])
+        deltas = poller.poll()
+        self.assertEqual(deltas['/if/rx-miss'].delta.tolist(),
+                         [[0, 0, 2], [0, 0, 0]])
+        self.assertEqual(deltas['/if/tx'].delta.tolist(), [[5], [0]])
+        self.assertNotIn('/sys/heartbeat', deltas)
+
+
+class TestStatsWatch(unittest.TestCase):
+    def setUp(self):
+        self.segment = FakeStatsSegment()
+        self.rx_miss = self.segment.simple([[0], [0]])
+        self.segment.set_directory([(1, 0, '/sys/heartbeat'),
+                                    (2, self.rx_miss, '/if/rx-miss')])
+        self.stats = FakeStats(self.segment)
+        self.stats.connect()
+
+    def later(self, delay, f, *args):
+        timer = threading.Timer(delay, f, args)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def set_heartbeat(self, value):
+        entries = self.segment.entries
+        entries[0] = (1, value, '/sys/heartbeat')
+        self.segment.set_directory(entries)
+
+    def test_backoff(self):
+        backoff = vpp_stats.Backoff(0.001, 0.004)
+        self.assertEqual([backoff.next() for _ in range(4)],
+                         [0.001, 0.002, 0.004, 0.004])
+        backoff.reset()
+        self.assertEqual(backoff.next(), 0.001)
+
+    def test_wait_epoch(self):
+        self.assertIsNone(self.stats.wait_epoch(timeout=0.01))
+        epoch = self.segment.epoch
+        self.later(0.05, self.set_heartbeat, 1)
+        self.assertEqual(self.stats.wait_epoch(timeout=5), epoch + 1)
+        # The directory is refreshed for the new epoch
+        self.assertEqual(self.stats.last_epoch, epoch + 1)
+        self.assertEqual(self.stats.directory['/sys/heartbeat'].value, 1)
+
+        async def wait():
+            asyncio.get_running_loop().call_later(0.05, self.set_heartbeat,
+                                                  2)
+            return await self.stats.async_wait_epoch(timeout=5)
+        self.assertEqual(asyncio.run(wait()), epoch + 2)
+
+    def test_watch(self):
+        counters = ['/sys/heartbeat', '/if/rx-miss']
+        row = struct.unpack_from('P', self.segment.mmap,
+                                 self.rx_miss - self.segment.base)[0]
+        # Counters change in place, without an epoch change
+        self.later(0.05, self.segment.write, row, 'Q', 3)
+        snapshots = list(self.stats.watch(counters, timeout=0.3,
+                                          max_delay=0.01))
+        self.assertEqual(snapshots, [{'/sys/heartbeat': 0,
+                                      '/if/rx-miss': [[3], [0]]}])
+
+        async def watch():
+            asyncio.get_running_loop().call_later(0.05, self.set_heartbeat,
+                                                  2)
+            return [snapshot async for snapshot in
+                    self.stats.async_watch(counters, timeout=0.3,
+                                           max_delay=0.01)]
+        self.assertEqual(asyncio.run(watch()), [{'/sys/heartbeat': 2,
+                                                 '/if/rx-miss': [[3], [0]]}])
+
+        # Nothing changes
+        self.assertEqual(list(self.stats.watch(counters, timeout=0.05)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#  Copyright (c) 2021 Cisco and/or its affiliates.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+import time
+import unittest
+
+from vpp_papi import vpp_stats
+from vpp_papi import vpp_stats_exporter
+
+
+class FakeEntry:
+    def __init__(self, stattype, value):
+        self.type = stattype
+        self.value = value
+
+
+class FakeStats:
+    '''Directory and counters of a VPPStats, as lists'''
+    connected = True
+
+    def __init__(self, entries):
+        self.epoch = 1
+        self.last_epoch = 1
+        self.directory = entries
+        self.snapshots = 0
+        self.ls_calls = 0
+
+    def refresh(self):
+        self.last_epoch = self.epoch
+
+    def ls(self, patterns):
+        self.ls_calls += 1
+        return [k for k in self.directory
+                if any(re.match(p, k) for p in patterns)]
+
+    def snapshot(self, counters, blocking=True, use_numpy=None):
+        self.snapshots += 1
+        snapshot = vpp_stats.StatsSnapshot(time.time(), self.epoch)
+        for name in counters:
+            snapshot[name] = self.directory[name].value
+        return snapshot
+
+
+class TestStatsExporter(unittest.TestCase):
+    def setUp(self):
+        self.stats = FakeStats({
+            '/if/rx': FakeEntry(3, [[{'packets': 1, 'bytes': 64}],
+                                    [{'packets': 2, 'bytes': 128}]]),
+            '/if/rx-miss': FakeEntry(2, [[0, 3], [4, 5]]),
+            '/if/names': FakeEntry(5, ['local0']),
+            '/err/ip4-input/no error': FakeEntry(4, [7, 8]),
+            '/sys/vector_rate': FakeEntry(1, 1.5),
+        })
+
+    def test_render(self):
+        exporter = vpp_stats_exporter.StatsExporter(self.stats, ['^/'])
+        lines = exporter.render().decode().splitlines()
+        self.assertIn('# TYPE _if_rx_packets counter', lines)
+        self.assertIn('_if_rx_packets{thread="1",interface="0"} 2', lines)
+        self.assertIn('_if_rx_bytes{thread="0",interface="0"} 64', lines)
+        self.assertIn('_if_rx_miss{thread="1",interface="1"} 5', lines)
+        self.assertIn('_err_ip4_input_no_error{thread="1"} 8', lines)
+        self.assertIn('# TYPE _sys_vector_rate gauge', lines)
+        self.assertIn('_sys_vector_rate 1.50', lines)
+        self.assertIn('vpp_stats_exporter_scrapes_total 1', lines)
+        self.assertFalse([l for l in lines if 'names' in l])
+
+    def test_max_age(self):
+        exporter = vpp_stats_exporter.StatsExporter(self.stats, ['^/if'],
+                                                    max_age=60)
+        first = exporter.render()
+        self.assertIs(exporter.render(), first)
+        self.assertEqual(self.stats.snapshots, 1)
+
+        exporter.max_age = 0
+        self.stats.directory['/if/rx-miss'].value = [[0, 3, 9], [4, 5, 6]]
+        lines = exporter.render().decode().splitlines()
+        self.assertEqual(self.stats.snapshots, 2)
+        self.assertIn('_if_rx_miss{thread="0",interface="2"} 9', lines)
+        self.assertIn('vpp_stats_exporter_scrapes_total 2', lines)
+
+    def test_epoch(self):
+        exporter = vpp_stats_exporter.StatsExporter(self.stats, ['^/if'],
+                                                    max_age=0)
+        exporter.render()
+        exporter.render()
+        self.assertEqual(self.stats.ls_calls, 1)
+
+        self.stats.directory['/if/tx'] = FakeEntry(2, [[11]])
+        self.stats.epoch += 1
+        lines = exporter.render().decode().splitlines()
+        self.assertEqual(self.stats.ls_calls, 2)
+        self.assertIn('_if_tx{thread="0",interface="0"} 11', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
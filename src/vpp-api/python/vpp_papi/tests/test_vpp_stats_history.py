@@ -0,0 +1,214 @@
+#  Copyright (c) 2021 Cisco and/or its affiliates.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+import tempfile
+import unittest
+
+from vpp_papi import vpp_stats
+from vpp_papi import vpp_stats_history
+
+np = vpp_stats.np
+
+
+class FakeEntry:
+    def __init__(self, stattype, value):
+        self.type = stattype
+        self.value = value
+
+
+class FakeStats:
+    '''Directory and counters of a VPPStats, as arrays'''
+    connected = True
+
+    def __init__(self, entries):
+        self.epoch = 1
+        self.last_epoch = 1
+        self.directory = entries
+        self.time = 1000.0
+
+    def refresh(self):
+        self.last_epoch = self.epoch
+
+    def ls(self, patterns):
+        return [k for k in self.directory
+                if any(re.match(p, k) for p in patterns)]
+
+    def snapshot(self, counters, blocking=True, use_numpy=None):
+        self.time += 1
+        snapshot = vpp_stats.StatsSnapshot(self.time, self.epoch)
+        for name in counters:
+            snapshot[name] = self.directory[name].value
+        return snapshot
+
+
+@unittest.skipIf(np is None, 'requires NumPy')
+class TestStatsHistory(unittest.TestCase):
+    def setUp(self):
+        rx = np.zeros((2, 3), vpp_stats.COMBINED_DTYPE)
+        self.stats = FakeStats({
+            '/if/rx': FakeEntry(3, rx),
+            '/if/rx-miss': FakeEntry(2, np.zeros((2, 3), np.uint64)),
+            '/if/names': FakeEntry(5, ['local0', 'eth0', 'eth1']),
+            '/sys/heartbeat': FakeEntry(1, 7),
+        })
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def record(self, count, **kwargs):
+        recorder = vpp_stats_history.StatsRecorder(
+            self.stats, ['^/'], self.path, header_size=4096, **kwargs)
+        for i in range(count):
+            self.stats.directory['/if/rx-miss'].value[0, 1] = i
+            self.stats.directory['/if/rx'].value['octets'][1, 2] = i * 64
+            recorder.record()
+        recorder.close()
+
+    def test_record(self):
+        self.record(5)
+        history = vpp_stats_history.StatsHistory(self.path)
+        self.assertEqual(sorted(history.counters()),
+                         ['/if/rx', '/if/rx-miss', '/sys/heartbeat'])
+        timestamps, values = history.get('/if/rx-miss')
+        self.assertEqual(timestamps.tolist(),
+                         [1001.0, 1002.0, 1003.0, 1004.0, 1005.0])
+        self.assertEqual(values.shape, (5, 2, 3))
+        self.assertEqual(values[:, 0, 1].tolist(), [0, 1, 2, 3, 4])
+        _, values = history.get('/if/rx')
+        self.assertEqual(values.dtype, vpp_stats.COMBINED_DTYPE)
+        self.assertEqual(values['octets'][:, 1, 2].tolist(),
+                         [0, 64, 128, 192, 256])
+        _, values = history.get('/sys/heartbeat')
+        self.assertEqual(values.tolist(), [7.0] * 5)
+        with self.assertRaises(KeyError):
+            history.get('/if/names')
+        history.close()
+
+    def test_ring(self):
+        self.record(3, size=4096 + 4 * 4096, slot_size=4096)
+        # Appends to the existing file, keeping the last 4 snapshots
+        self.record(3)
+        history = vpp_stats_history.StatsHistory(self.path)
+        timestamps, values = history.get('/if/rx-miss')
+        self.assertEqual(timestamps.tolist(),
+                         [1003.0, 1004.0, 1005.0, 1006.0])
+        self.assertEqual(values[:, 0, 1].tolist(), [2, 0, 1, 2])
+        history.close()
+
+    def test_layout(self):
+        self.record(2)
+        self.stats.directory['/if/rx-miss'].value = np.ones((2, 4),
+                                                            np.uint64)
+        del self.stats.directory['/sys/heartbeat']
+        self.stats.epoch += 1
+        self.record(1)
+        history = vpp_stats_history.StatsHistory(self.path)
+        _, values = history.get('/if/rx-miss')
+        self.assertEqual(values.shape, (3, 2, 4))
+        self.assertEqual(values[:, 0, 3].tolist(), [0, 0, 1])
+        timestamps, _ = history.get('/sys/heartbeat')
+        self.assertEqual(len(timestamps), 2)
+        history.close()
+
+    def test_grow(self):
+        self.record(3)
+        ring = vpp_stats_history.StatsRingFile(self.path)
+        slot_size = ring.slot_size
+        ring.close()
+        # New interfaces, the snapshot no longer fits the slots
+        self.stats.directory['/if/rx-miss'].value = np.ones((2, 600),
+                                                            np.uint64)
+        self.stats.epoch += 1
+        self.record(1)
+        history = vpp_stats_history.StatsHistory(self.path)
+        self.assertGreater(history.ring.slot_size, slot_size)
+        timestamps, values = history.get('/if/rx-miss')
+        self.assertEqual(timestamps.tolist(),
+                         [1001.0, 1002.0, 1003.0, 1004.0])
+        self.assertEqual(values.shape, (4, 2, 600))
+        self.assertEqual(values[:, 0, 1].tolist(), [0, 1, 2, 0])
+        self.assertEqual(values[3, 1, 599], 1)
+        history.close()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_skip(self):
+        self.record(1, size=4096 + 4096, slot_size=4096)
+        self.stats.directory['/if/rx-miss'].value = np.ones((2, 600),
+                                                            np.uint64)
+        recorder = vpp_stats_history.StatsRecorder(
+            self.stats, ['^/'], self.path, header_size=4096)
+        with self.assertLogs('vpp_papi.stats_history', 'WARNING'):
+            self.assertIsNone(recorder.record())
+        recorder.close()
+        history = vpp_stats_history.StatsHistory(self.path)
+        self.assertEqual(len(history.timestamps()), 1)
+        history.close()
+
+    def test_layout_churn(self):
+        recorder = vpp_stats_history.StatsRecorder(
+            self.stats, ['^/'], self.path, size=4096 + 8 * 4096,
+            slot_size=4096, header_size=4096)
+        for i in range(40):
+            # A new layout each time, each about 1 KB of JSON
+            self.stats.directory = {
+                '/err/node-%d/counter-%d' % (i, j):
+                FakeEntry(2, np.full((1, 1 + i % 3), i, np.uint64))
+                for j in range(20)}
+            self.stats.epoch += 1
+            self.assertEqual(recorder.record(), i)
+        recorder.close()
+        history = vpp_stats_history.StatsHistory(self.path)
+        self.assertLessEqual(len(history.ring.layouts), 4)
+        timestamps = history.timestamps()
+        self.assertGreater(len(timestamps), 0)
+        self.assertEqual(timestamps[-1], 1040.0)
+        _, values = history.get('/err/node-39/counter-0')
+        self.assertEqual(values.tolist(), [[[39]]])
+        history.close()
+
+        # A single layout too large for the header is skipped
+        self.stats.directory = {
+            '/err/too-large/counter-%d' % j: FakeEntry(2, np.zeros((1, 1)))
+            for j in range(200)}
+        self.stats.epoch += 1
+        recorder = vpp_stats_history.StatsRecorder(
+            self.stats, ['^/'], self.path, header_size=4096)
+        with self.assertLogs('vpp_papi.stats_history', 'WARNING'):
+            self.assertIsNone(recorder.record())
+        recorder.close()
+
+    def test_byte_order(self):
+        self.stats.directory['/if/rx-miss'].value = np.arange(
+            6, dtype='>u8').reshape(2, 3)
+        self.record(1)
+        history = vpp_stats_history.StatsHistory(self.path)
+        _, values = history.get('/if/rx-miss')
+        self.assertEqual(values[0].tolist(), [[0, 0, 2], [3, 4, 5]])
+        history.close()
+        with open(self.path, 'rb') as f:
+            self.assertIn((5).to_bytes(8, 'little'), f.read())
+
+    def test_too_small(self):
+        with self.assertRaises(ValueError):
+            self.record(1, size=4096, slot_size=4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
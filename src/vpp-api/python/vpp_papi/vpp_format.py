@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import collections
 import datetime
-from socket import inet_pton, AF_INET6, AF_INET
+import functools
+from socket import inet_pton, inet_ntop, AF_INET6, AF_INET
 import socket
 import ipaddress
 from . import macaddress
@@ -216,7 +218,7 @@ def unformat_api_ip6_address_with_prefix_t(o):
     return ipaddress.IPv6Interface((o.address, o.len))
 
 
-conversion_unpacker_table = {
+ipaddress_unpacker_table = {
     'vl_api_ip6_address_t': lambda o: ipaddress.IPv6Address(o),
     'vl_api_ip6_prefix_t': lambda o: ipaddress.IPv6Network((o.address, o.len)),
     'vl_api_ip4_address_t': lambda o: ipaddress.IPv4Address(o),
@@ -230,3 +232,145 @@ conversion_unpacker_table = {
     'vl_api_timestamp_t': lambda o: datetime.datetime.fromtimestamp(o),
     'vl_api_timedelta_t': lambda o: datetime.timedelta(seconds=o),
 }
+
+
+#
+# Packed addresses, formatted only when shown
+#
+
+
+class PackedAddress(bytes):
+    '''An IPv4, IPv6 or MAC address as returned by the API, in network
+    byte order. Cheaper to create than ipaddress objects, str() gives
+    the usual text form.'''
+    __slots__ = ()
+
+    @property
+    def packed(self):
+        return bytes(self)
+
+    @property
+    def version(self):
+        return {4: 4, 16: 6}.get(len(self))
+
+    def address(self):
+        '''The address as an ipaddress or MACAddress object'''
+        if len(self) == 6:
+            return macaddress.MACAddress(bytes(self))
+        return ipaddress.ip_address(bytes(self))
+
+    def __str__(self):
+        if len(self) == 4:
+            return inet_ntop(AF_INET, self)
+        if len(self) == 16:
+            return inet_ntop(AF_INET6, self)
+        return macaddress.mac_ntop(self)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self)
+
+
+class PackedPrefix(collections.namedtuple('PackedPrefix',
+                                          ['address', 'len'])):
+    '''A prefix or address with prefix length as returned by the API,
+    address is a PackedAddress.'''
+    __slots__ = ()
+
+    def network(self):
+        '''The prefix as an ipaddress network object'''
+        return ipaddress.ip_network((bytes(self.address), self.len), False)
+
+    def interface(self):
+        '''The prefix as an ipaddress interface object'''
+        return ipaddress.ip_interface((bytes(self.address), self.len))
+
+    def __str__(self):
+        return '%s/%s' % (self.address, self.len)
+
+
+def unformat_packed_address_t(o):
+    if o.af == 1:
+        return PackedAddress(o.un.ip6)
+    if o.af == 0:
+        return PackedAddress(o.un.ip4)
+    return None
+
+
+def unformat_packed_prefix_t(o):
+    address = unformat_packed_address_t(o.address)
+    if address is None:
+        return None
+    return PackedPrefix(address, o.len)
+
+
+packed_unpacker_table = dict(ipaddress_unpacker_table, **{
+    'vl_api_ip6_address_t': PackedAddress,
+    'vl_api_ip6_prefix_t': lambda o: PackedPrefix(PackedAddress(o.address),
+                                                  o.len),
+    'vl_api_ip4_address_t': PackedAddress,
+    'vl_api_ip4_prefix_t': lambda o: PackedPrefix(PackedAddress(o.address),
+                                                  o.len),
+    'vl_api_address_t': unformat_packed_address_t,
+    'vl_api_prefix_t': unformat_packed_prefix_t,
+    'vl_api_address_with_prefix_t': unformat_packed_prefix_t,
+    'vl_api_ip4_address_with_prefix_t':
+    lambda o: PackedPrefix(PackedAddress(o.address), o.len),
+    'vl_api_ip6_address_with_prefix_t':
+    lambda o: PackedPrefix(PackedAddress(o.address), o.len),
+    'vl_api_mac_address_t': PackedAddress,
+})
+
+#
+# Memoized unpackers. Dumps repeat the same addresses over and over,
+# the converted objects are looked up by the decoded value (the packed
+# address bytes, and the length for prefixes) instead of being built
+# again. The returned objects are shared, treat them as immutable.
+#
+
+UNPACKER_CACHE_SIZE = 4096
+
+# Types with few distinct values; timestamps are not worth caching
+cached_unpacker_types = (
+    'vl_api_ip6_address_t',
+    'vl_api_ip6_prefix_t',
+    'vl_api_ip4_address_t',
+    'vl_api_ip4_prefix_t',
+    'vl_api_address_t',
+    'vl_api_prefix_t',
+    'vl_api_address_with_prefix_t',
+    'vl_api_ip4_address_with_prefix_t',
+    'vl_api_ip6_address_with_prefix_t',
+    'vl_api_mac_address_t',
+)
+
+
+def cached_unpacker(unpacker, maxsize=UNPACKER_CACHE_SIZE):
+    '''Wrap unpacker in a bounded LRU cache keyed on its argument'''
+    cached = functools.lru_cache(maxsize=maxsize)(unpacker)
+
+    def unpack(o):
+        try:
+            return cached(o)
+        except TypeError:  # Unhashable, e.g. decoded into a list
+            return unpacker(o)
+    unpack.cache_info = cached.cache_info
+    unpack.cache_clear = cached.cache_clear
+    return unpack
+
+
+conversion_unpacker_table = {}
+
+
+def set_unpackers(packed=False, cache_size=UNPACKER_CACHE_SIZE):
+    '''Select how addresses in received messages are returned: as
+    ipaddress and MACAddress objects (the default), or if packed is
+    true as PackedAddress and PackedPrefix. cache_size bounds the
+    number of converted addresses kept per type, 0 disables caching.'''
+    table = packed_unpacker_table if packed else ipaddress_unpacker_table
+    for name, unpacker in table.items():
+        if cache_size and name in cached_unpacker_types:
+            unpacker = cached_unpacker(unpacker, cache_size)
+        conversion_unpacker_table[name] = unpacker
+
+
+set_unpackers()
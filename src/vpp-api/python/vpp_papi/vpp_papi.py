@@ -16,6 +16,8 @@
 
 from __future__ import print_function
 from __future__ import absolute_import
+import collections
+import contextlib
 import ctypes
 import ipaddress
 import sys
@@ -23,8 +25,12 @@ import multiprocessing as mp
 import os
 import queue
 import logging
+import struct
 import functools
 import json
+import hashlib
+import marshal
+import tempfile
 import threading
 import fnmatch
 import weakref
@@ -32,7 +38,9 @@ import atexit
 import time
 from . vpp_format import verify_enum_hint
 from . vpp_serializer import VPPType, VPPEnumType, VPPEnumFlagType, VPPUnionType
-from . vpp_serializer import VPPMessage, vpp_get_type, VPPTypeAlias
+from . vpp_serializer import vpp_get_type, VPPTypeAlias
+from . vpp_serializer import VPPLazyMessage, vpp_define_type
+from . vpp_serializer import vpp_apply_field_options
 
 try:
     import VppTransport
@@ -45,14 +53,29 @@ except ModuleNotFoundError:
     VppTransport = V
 
 from . vpp_transport_socket import VppTransport
+from . import vpp_transport_shmem
 
 logger = logging.getLogger('vpp_papi')
 logger.addHandler(logging.NullHandler())
 
+# Message id and context fields, read from received messages before
+# they are decoded.
+_msgid = struct.Struct('>H')
+_context = struct.Struct('>I')
+# Message id and the u32 at offsets 2 and 6, where replies (msgid,
+# context) and requests and events (msgid, client_index, context)
+# carry their context.
+_header = struct.Struct('>HII')
+
+# Bump when the format of the API definition cache changes.
+_API_CACHE_VERSION = 1
+# Cache files kept, the least recently used are removed.
+_API_CACHE_ENTRIES = 4
+
 __all__ = ('FuncWrapper', 'VppApiDynamicMethodHolder',
            'VppEnum', 'VppEnumType', 'VppEnumFlag',
            'VPPIOError', 'VPPRuntimeError', 'VPPValueError',
-           'VPPApiClient', )
+           'VPPApiClient', 'VPPApiBatch', 'VPPApiBatchError', )
 
 
 def metaclass(metaclass):
@@ -108,7 +131,25 @@ def add_convenience_methods():
 
 
 class VppApiDynamicMethodHolder:
-    pass
+    """Holds the API functions as attributes.
+
+    Functions added with _define() are only created on first access.
+    """
+    def _define(self, name, factory):
+        self.__dict__.setdefault('_factories', {})[name] = factory
+
+    def __getattr__(self, name):
+        try:
+            factory = self.__dict__['_factories'].pop(name)
+        except KeyError:
+            raise AttributeError(name)
+        f = factory()
+        setattr(self, name, f)
+        return f
+
+    def __dir__(self):
+        return sorted(set(super(VppApiDynamicMethodHolder, self).__dir__()) |
+                      set(self.__dict__.get('_factories', ())))
 
 
 class FuncWrapper:
@@ -120,6 +161,10 @@ class FuncWrapper:
     def __call__(self, **kwargs):
         return self._func(**kwargs)
 
+    def iter(self, **kwargs):
+        """Call a dump, returning an iterator over the details."""
+        return self._func.iter(**kwargs)
+
     def __repr__(self):
         return '<FuncWrapper(func=<%s(%s)>)>' % (self.__name__, self.__doc__)
 
@@ -144,6 +189,198 @@ class VPPValueError(ValueError):
     pass
 
 
+class VPPApiBatchError(VPPApiError):
+    """One or more calls in a batch returned a non-zero retval.
+
+    errors is a list of (index, message name, retval) tuples, results
+    holds the replies to all calls of the batch.
+    """
+    def __init__(self, errors, results):
+        super(VPPApiBatchError, self).__init__(
+            '{} of {} batched calls failed: {}'.format(
+                len(errors), len(results),
+                ', '.join('#{} {}: {}'.format(*e) for e in errors[:10])))
+        self.errors = errors
+        self.results = results
+
+
+class ReplyCollector:
+    """Collects the reply, or the replies for stream services, to a call.
+
+    add() is given the decoded messages carrying the call's context and
+    returns True once the call is complete, result then holds what the
+    API function returns.
+    """
+    def __init__(self, service):
+        self.msgreply = service['reply']
+        self.stream = True if 'stream' in service else False
+        self.stream_message = None
+        self.modern = False
+        self.needs_ping = False
+        if self.stream:
+            if 'stream_msg' in service:
+                # New service['reply'] = _reply and service['stream_message'] = _details
+                self.stream_message = service['stream_msg']
+                self.modern = True
+            else:
+                # Old  service['reply'] = _details
+                self.stream_message = self.msgreply
+                self.msgreply = 'control_ping_reply'
+                # Send a ping after the request - we use its response
+                # to detect that we have seen all results.
+                self.needs_ping = True
+        self.result = []
+
+    def add(self, r):
+        msgname = type(r).__name__
+        if msgname != self.msgreply and \
+                (self.stream and (msgname != self.stream_message)):
+            logger.warning('Reply mismatch: expected %s or %s, got %s',
+                           self.msgreply, self.stream_message, msgname)
+        if not self.stream:
+            self.result = r
+            return True
+        if msgname == self.msgreply:
+            if self.modern:  # Return both reply and list
+                self.result = r, self.result
+            return True
+        self.result.append(r)
+        return False
+
+    @property
+    def retval(self):
+        r = self.result
+        if self.modern:
+            r = r[0]
+        return getattr(r, 'retval', 0)
+
+
+class VppApiBatchMethodHolder:
+    """Mirrors VPPApiClient.api, the functions queue calls on a batch."""
+    def __init__(self, batch):
+        self._batch = batch
+
+    def __getattr__(self, name):
+        f = getattr(self._batch._client.api, name)
+        w = FuncWrapper(self._batch._make_function(f._func))
+        setattr(self, name, w)
+        return w
+
+
+class VPPApiBatch:
+    """Pipelined API calls.
+
+    Calls made through batch.api are queued rather than sent. flush(),
+    called on leaving the with block, packs the queued requests with
+    distinct contexts, writes them to VPP in one go and then matches the
+    replies back by context. The replies are returned, and stored in
+    results, in the order of the calls.
+
+        with vpp.batch() as batch:
+            for route in routes:
+                batch.api.ip_route_add_del(is_add=1, route=route)
+        replies = batch.results
+
+    If check_retval is true, the replies are checked once all of them
+    have arrived and any non-zero retvals are raised together in a
+    single VPPApiBatchError. no_type_conversion, zero_copy and timeout
+    apply to all replies of the batch, as for the corresponding
+    underscore arguments of a single call. _no_type_conversion and
+    _zero_copy can also be given to a call in the batch, its _timeout
+    is ignored.
+    """
+    def __init__(self, client, check_retval=True, no_type_conversion=False,
+                 zero_copy=False, timeout=None):
+        self._client = client
+        self.check_retval = check_retval
+        self.no_type_conversion = no_type_conversion
+        self.zero_copy = zero_copy
+        self.timeout = timeout
+        self._calls = []
+        self.results = []
+        self.api = VppApiBatchMethodHolder(self)
+
+    def _make_function(self, func):
+        def f(**kwargs):
+            return self._queue(func, kwargs)
+        f.__name__ = func.__name__
+        f.__doc__ = func.__doc__
+        return f
+
+    def _queue(self, func, kwargs):
+        if 'context' not in kwargs:
+            kwargs['context'] = self._client.get_context()
+        options = (kwargs.pop('_no_type_conversion', self.no_type_conversion),
+                   kwargs.pop('_zero_copy', self.zero_copy))
+        kwargs.pop('_timeout', None)
+        self._calls.append((func, kwargs, options))
+        return kwargs['context']
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._calls = []
+
+    def flush(self):
+        """Send all queued calls and wait for their replies."""
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+        client = self._client
+        bufs = []
+        collectors = {}
+        options = {}
+        ordered = []
+        for func, kwargs, call_options in calls:
+            context = kwargs['context']
+            if context in collectors:
+                raise VPPValueError('Duplicate context {} in batch'
+                                    .format(context))
+            bufs.append(client._pack_call(func.msg_index, func.msg, kwargs))
+            c = ReplyCollector(func.service)
+            if c.needs_ping:
+                bufs.append(client._pack_call(client.control_ping_index,
+                                              client.control_ping_msgdef,
+                                              {'context': context}))
+            collectors[context] = c
+            options[context] = call_options
+            ordered.append((func.__name__, c))
+
+        replies = client._wait_replies(collectors)
+        client.transport.suspend()
+        try:
+            client.transport.write_many(bufs)
+
+            outstanding = len(collectors)
+            while outstanding:
+                msg = client._read_reply(replies, self.timeout)
+                if msg is None:
+                    raise VPPIOError(2, 'VPP API client: read failed')
+                _, context = client._msg_header(msg)
+                r = client.decode_incoming_msg(msg, *options[context])
+                if collectors[context].add(r):
+                    outstanding -= 1
+        finally:
+            client._stop_waiting(collectors)
+            client.transport.resume()
+
+        results = [c.result for _, c in ordered]
+        self.results.extend(results)
+        if self.check_retval:
+            errors = [(n, name, c.retval)
+                      for n, (name, c) in enumerate(ordered) if c.retval]
+            if errors:
+                raise VPPApiBatchError(errors, results)
+        return results
+
+
 class VPPApiJSONFiles:
     @classmethod
     def find_api_dir(cls, dirs):
@@ -265,6 +502,116 @@ class VPPApiJSONFiles:
 
         return api_files
 
+    @classmethod
+    def find_cache_dir(cls):
+        """Return the directory parsed API definitions are cached in.
+
+        This is VPP_API_CACHE_DIR from the environment. The cache is off
+        unless it is set.
+        """
+        return os.environ.get('VPP_API_CACHE_DIR') or None
+
+    @classmethod
+    def process_json_files(cls, apifiles, cache_dir=None):
+        """Process a list of API definition files.
+
+        The parsed files are cached in cache_dir, find_cache_dir() if it
+        is None, keyed by the paths, modification times and sizes of all
+        the files. As long as none of them changed, the definitions are
+        read back from the cache instead of parsing the JSON again. Only
+        the _API_CACHE_ENTRIES most recently used sets of files are kept.
+        Passing False as cache_dir disables the cache.
+
+        :returns: The messages and services of all the files.
+        """
+        if cache_dir is None:
+            cache_dir = cls.find_cache_dir()
+        apis = None
+        if cache_dir and apifiles:
+            try:
+                key = [_API_CACHE_VERSION, marshal.version]
+                for file in apifiles:
+                    st = os.stat(file)
+                    key.append((file, st.st_mtime_ns, st.st_size))
+                # Named after the paths only, a changed file replaces
+                # the entry of the same files.
+                paths = [_API_CACHE_VERSION] + list(apifiles)
+                digest = hashlib.sha1(repr(paths).encode()).hexdigest()
+                cache_file = os.path.join(cache_dir,
+                                          'apidefs-{}.marshal'.format(digest))
+            except OSError:
+                cache_dir = None
+            else:
+                apis = cls._read_cache(cache_file, key)
+
+        if apis is None:
+            apis = []
+            for file in apifiles:
+                with open(file) as apidef_file:
+                    apis.append(json.load(apidef_file))
+            if cache_dir and apifiles:
+                # Written before processing, which modifies the definitions.
+                cls._write_cache(cache_dir, cache_file, key, apis)
+
+        messages = {}
+        services = {}
+        for api in apis:
+            m, s = cls._process_json(api)
+            messages.update(m)
+            services.update(s)
+        return messages, services
+
+    @staticmethod
+    def _read_cache(cache_file, key):
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, apis = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if cached_key != key:
+            return None
+        logger.debug('API definitions read from cache %s', cache_file)
+        try:
+            # Most recently used, for _prune_cache()
+            os.utime(cache_file)
+        except OSError:
+            pass
+        return apis
+
+    @staticmethod
+    def _write_cache(cache_dir, cache_file, key, apis):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    marshal.dump((key, apis), f)
+                os.replace(tmp, cache_file)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            VPPApiJSONFiles._prune_cache(cache_dir)
+        except (OSError, ValueError) as err:
+            logger.debug('Cannot cache API definitions: {!r}'.format(err))
+
+    @staticmethod
+    def _prune_cache(cache_dir):
+        """Remove all but the most recently used cache files."""
+        entries = []
+        for name in fnmatch.filter(os.listdir(cache_dir),
+                                   'apidefs-*.marshal'):
+            path = os.path.join(cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                pass
+        entries.sort(reverse=True)
+        for _, path in entries[_API_CACHE_ENTRIES:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
     @classmethod
     def process_json_file(self, apidef_file):
         api = json.load(apidef_file)
@@ -317,49 +664,28 @@ class VPPApiJSONFiles:
         except KeyError:
             pass
 
-        i = 0
-        while True:
-            unresolved = {}
-            for k, v in types.items():
-                t = v['data']
-                if not vpp_get_type(k):
-                    if v['type'] == 'enum':
-                        try:
-                            VPPEnumType(t[0], t[1:])
-                        except ValueError:
-                            unresolved[k] = v
-                if not vpp_get_type(k):
-                    if v['type'] == 'enumflag':
-                        try:
-                            VPPEnumFlagType(t[0], t[1:])
-                        except ValueError:
-                            unresolved[k] = v
-                    elif v['type'] == 'union':
-                        try:
-                            VPPUnionType(t[0], t[1:])
-                        except ValueError:
-                            unresolved[k] = v
-                    elif v['type'] == 'type':
-                        try:
-                            VPPType(t[0], t[1:])
-                        except ValueError:
-                            unresolved[k] = v
-                    elif v['type'] == 'alias':
-                        try:
-                            VPPTypeAlias(k, t)
-                        except ValueError:
-                            unresolved[k] = v
-            if len(unresolved) == 0:
-                break
-            if i > 3:
-                raise VPPValueError('Unresolved type definitions {}'
-                                    .format(unresolved))
-            types = unresolved
-            i += 1
+        # Types and messages are only built on first use.
+        for k, v in types.items():
+            t = v['data']
+            if v['type'] == 'enum':
+                factory = functools.partial(VPPEnumType, t[0], t[1:])
+            elif v['type'] == 'enumflag':
+                factory = functools.partial(VPPEnumFlagType, t[0], t[1:])
+            elif v['type'] == 'union':
+                factory = functools.partial(VPPUnionType, t[0], t[1:])
+            elif v['type'] == 'type':
+                factory = functools.partial(VPPType, t[0], t[1:])
+            elif v['type'] == 'alias':
+                factory = functools.partial(VPPTypeAlias, k, t)
+            vpp_define_type(k, factory)
+        for v in types.values():
+            if v['type'] == 'type':
+                vpp_apply_field_options(v['data'][1:])
         try:
             for m in api['messages']:
+                vpp_apply_field_options(m[1:])
                 try:
-                    messages[m[0]] = VPPMessage(m[0], m[1:])
+                    messages[m[0]] = VPPLazyMessage(m[0], m[1:])
                 except VPPNotImplementedError:
                     ### OLE FIXME
                     logger.error('Not implemented error for {}'.format(m[0]))
@@ -386,12 +712,16 @@ class VPPApiClient:
     VPPValueError = VPPValueError
     VPPNotImplementedError = VPPNotImplementedError
     VPPIOError = VPPIOError
+    FuncWrapper = FuncWrapper
+    VppTransport = VppTransport
+    vpp_atexit = staticmethod(vpp_atexit)
 
 
     def __init__(self, *, apifiles=None, testmode=False, async_thread=True,
                  logger=None, loglevel=None,
                  read_timeout=5, use_socket=True,
-                 server_address='/run/vpp/api.sock'):
+                 server_address='/run/vpp/api.sock', multiprocess=False,
+                 stream_buffer=256, compact=False):
         """Create a VPP API object.
 
         apifiles is a list of files containing API
@@ -403,6 +733,21 @@ class VPPApiClient:
         logger, if supplied, is the logging logger object to log to.
         loglevel, if supplied, is the log level this logger is set
         to report at (from the loglevels in the logging module).
+
+        use_socket, if false, attaches to VPP through the shared memory
+        API rings of libvppapiclient instead of the socket at
+        server_address. The socket is used if the library is missing.
+
+        multiprocess, if true, makes the transport pass replies through
+        a multiprocessing.Queue, for clients shared between processes.
+
+        stream_buffer bounds the number of replies buffered while the
+        details of a dump are read through its iter() function.
+
+        compact, if true, returns replies as VPPCompactRecord, which
+        keep nested types in a single flat tuple per message instead of
+        a namedtuple per type. Uses less memory for large dumps.
+        Replies without type conversion are still namedtuples.
         """
         if logger is None:
             logger = logging.getLogger(
@@ -415,8 +760,6 @@ class VPPApiClient:
         self.services = {}
         self.id_names = []
         self.id_msgdef = []
-        self.header = VPPType('header', [['u16', 'msgid'],
-                                         ['u32', 'client_index']])
         self.apifiles = []
         self.event_callback = None
         self.message_queue = queue.Queue()
@@ -427,6 +770,14 @@ class VPPApiClient:
         self.server_address = server_address
         self._apifiles = apifiles
         self.stats = {}
+        self.stream_buffer = stream_buffer
+        self.compact = compact
+        self._context_offsets = {}
+        # Buffers of the calls waiting for replies, by context. One
+        # caller at a time reads the transport, see _read_reply().
+        self._waiters = {}
+        self._reading = False
+        self._reply_cond = threading.Condition()
 
         if not apifiles:
             # Pick up API definitions from default directory
@@ -439,11 +790,9 @@ class VPPApiClient:
                 else:
                     raise VPPRuntimeError
 
-        for file in apifiles:
-            with open(file) as apidef_file:
-                m, s = VPPApiJSONFiles.process_json_file(apidef_file)
-                self.messages.update(m)
-                self.services.update(s)
+        m, s = VPPApiJSONFiles.process_json_files(apifiles)
+        self.messages.update(m)
+        self.services.update(s)
 
         self.apifiles = apifiles
 
@@ -454,10 +803,21 @@ class VPPApiClient:
             raise VPPRuntimeError("Invalid address family hints. "
                                   "Cannot continue.")
 
-        self.transport = VppTransport(self, read_timeout=read_timeout,
-                                      server_address=server_address)
+        self.transport = None
+        if not use_socket:
+            try:
+                self.transport = vpp_transport_shmem.VppTransport(
+                    self, read_timeout=read_timeout,
+                    server_address=server_address,
+                    multiprocess=multiprocess)
+            except vpp_transport_shmem.VppTransportShmemIOError as err:
+                self.logger.warning('%s, using the socket transport', err)
+        if self.transport is None:
+            self.transport = self.VppTransport(
+                self, read_timeout=read_timeout,
+                server_address=server_address, multiprocess=multiprocess)
         # Make sure we allow VPP to clean up the message rings.
-        atexit.register(vpp_atexit, weakref.ref(self))
+        atexit.register(self.vpp_atexit, weakref.ref(self))
 
         add_convenience_methods()
 
@@ -494,17 +854,28 @@ class VPPApiClient:
             def f(**kwargs):
                 return self._call_vpp(i, msg, multipart, **kwargs)
 
+            def f_iter(**kwargs):
+                return self._call_vpp_iter(i, msg, multipart, **kwargs)
+            f.iter = f_iter
+
         f.__name__ = str(msg.name)
         f.__doc__ = ", ".join(["%s %s" %
                                (msg.fieldtypes[j], k)
                                for j, k in enumerate(msg.fields)])
         f.msg = msg
+        f.msg_index = i
+        f.service = multipart
 
         return f
 
+    def _make_api_function(self, msg, i, multipart, do_async):
+        return self.FuncWrapper(self.make_function(msg, i, multipart,
+                                                   do_async))
+
     def _register_functions(self, do_async=False):
         self.id_names = [None] * (self.vpp_dictionary_maxid + 1)
         self.id_msgdef = [None] * (self.vpp_dictionary_maxid + 1)
+        self._context_offsets = {}
         self._api = VppApiDynamicMethodHolder()
         for name, msg in self.messages.items():
             n = name + '_' + msg.crc[2:]
@@ -515,8 +886,9 @@ class VPPApiClient:
 
                 # Create function for client side messages.
                 if name in self.services:
-                    f = self.make_function(msg, i, self.services[name], do_async)
-                    setattr(self._api, name, FuncWrapper(f))
+                    self._api._define(name, functools.partial(
+                        self._make_api_function, msg, i,
+                        self.services[name], do_async))
             else:
                 self.logger.debug(
                     'No such message type or failed CRC checksum: %s', n)
@@ -600,31 +972,110 @@ class VPPApiClient:
             raise VPPIOError(2, 'RPC reply message received in event handler')
 
     def has_context(self, msg):
-        if len(msg) < 10:
-            return False
-
-        header = VPPType('header_with_context', [['u16', 'msgid'],
-                                                 ['u32', 'client_index'],
-                                                 ['u32', 'context']])
-
-        (i, ci, context), size = header.unpack(msg, 0)
+        """True if msg is a reply, to be passed on to the caller waiting
+        for its context, false if it goes to the event path. Only the
+        header of the message is read."""
+        i, context = self._msg_header(msg)
         if self.id_names[i] == 'rx_thread_exit':
-            return
-
-        #
-        # Decode message and returns a tuple.
-        #
-        msgobj = self.id_msgdef[i]
-        if 'context' in msgobj.field_by_name and context >= 0:
-            return True
-        return False
+            return False
+        offset = self._context_offset(i)
+        return offset is not None and len(msg) >= offset + 4
 
-    def decode_incoming_msg(self, msg, no_type_conversion=False):
+    def _context_offset(self, i):
+        """Offset of the context field of message id i, or None."""
+        try:
+            return self._context_offsets[i]
+        except KeyError:
+            msgobj = self.id_msgdef[i] if i < len(self.id_msgdef) else None
+            offset = None
+            if msgobj is not None and 'context' in msgobj.field_by_name:
+                offset = msgobj._offsets[msgobj.fields.index('context')]
+            self._context_offsets[i] = offset
+            return offset
+
+    def _msg_header(self, msg):
+        """Message id and context of a received message, read before
+        decoding it. The context is 0 if the message has none."""
+        if len(msg) >= _header.size:
+            i, at2, at6 = _header.unpack_from(msg)
+            offset = self._context_offset(i)
+            if offset == 2:
+                return i, at2
+            if offset == 6:
+                return i, at6
+        else:
+            i = _msgid.unpack_from(msg)[0]
+        return i, self._msg_context(i, msg)
+
+    def _msg_context(self, i, msg):
+        """Context of a received message, read before decoding it."""
+        offset = self._context_offset(i)
+        if offset is None or len(msg) < offset + 4:
+            return 0
+        return _context.unpack_from(msg, offset)[0]
+
+    def _wait_replies(self, contexts):
+        """Register a buffer for the replies to contexts, to be read
+        with _read_reply(). Returns the buffer."""
+        replies = collections.deque()
+        with self._reply_cond:
+            for context in contexts:
+                self._waiters[context] = replies
+        return replies
+
+    def _stop_waiting(self, contexts):
+        """Unregister contexts, later replies go to the event path."""
+        with self._reply_cond:
+            for context in contexts:
+                self._waiters.pop(context, None)
+
+    def _read_reply(self, replies, timeout=None):
+        """Next received message for the call registered with replies,
+        undecoded, or None if none arrived within timeout.
+
+        Only one caller at a time reads the transport. Messages for the
+        contexts of other calls are appended to their buffers, messages
+        without a waiting call are decoded onto the event queue.
+        """
+        cond = self._reply_cond
+        with cond:
+            while not replies and self._reading:
+                # Another call reads the transport and hands over ours
+                if not cond.wait(timeout if timeout is not None
+                                 else self.transport.read_timeout):
+                    return None
+            if replies:
+                return replies.popleft()
+            self._reading = True
+        try:
+            while True:
+                msg = self.transport.read(timeout=timeout)
+                if not msg:
+                    return None
+                i, context = self._msg_header(msg)
+                waiter = self._waiters.get(context) if context else None
+                if waiter is replies:
+                    return msg
+                if waiter is not None:
+                    with cond:
+                        waiter.append(msg)
+                        cond.notify_all()
+                    continue
+                r = self.decode_incoming_msg(msg)
+                if r is not None:
+                    self.message_queue.put_nowait(r)
+        finally:
+            with cond:
+                self._reading = False
+                cond.notify_all()
+
+    def decode_incoming_msg(self, msg, no_type_conversion=False,
+                            zero_copy=False):
         if not msg:
             logger.warning('vpp_api.read failed')
             return
 
-        (i, ci), size = self.header.unpack(msg, 0)
+        i = _msgid.unpack_from(msg)[0]
         if self.id_names[i] == 'rx_thread_exit':
             return
 
@@ -635,6 +1086,11 @@ class VPPApiClient:
         if not msgobj:
             raise VPPIOError(2, 'Reply message undefined')
 
+        if zero_copy:
+            return msgobj.unpack_view(memoryview(msg), ntc=no_type_conversion)
+        if self.compact and not no_type_conversion:
+            r, size = msgobj.unpack_compact(msg)
+            return r
         r, size = msgobj.unpack(msg, ntc=no_type_conversion)
         return r
 
@@ -674,6 +1130,28 @@ class VPPApiClient:
             n = self.stats[name]['count']
             self.stats[name]['avg'] = self.stats[name]['avg'] * (n - 1) / n + ms / n
 
+    def batch(self, check_retval=True, **kwargs):
+        """Return a VPPApiBatch for pipelining many API calls.
+
+        check_retval - raise a VPPApiBatchError listing all the calls
+        that returned a non-zero retval once the batch is flushed.
+        """
+        return VPPApiBatch(self, check_retval=check_retval, **kwargs)
+
+    @contextlib.contextmanager
+    def corked(self):
+        """Gather the messages sent within the with block into as few
+        writes to the transport as possible.
+
+        Meant for calls that do not wait for their reply, when connected
+        with do_async. Reading a reply sends the gathered messages first.
+        """
+        self.transport.cork()
+        try:
+            yield self
+        finally:
+            self.transport.uncork()
+
     def get_stats(self):
         s = '\n=== API PAPI STATISTICS ===\n'
         s += '{:<30} {:>4} {:>6} {:>6}\n'.format('message', 'cnt', 'avg', 'max')
@@ -700,6 +1178,8 @@ class VPPApiClient:
         messages in return.
         context - context number - chosen at random if not
         supplied.
+        _zero_copy - if true, replies are returned as records decoding
+        their fields from the receive buffer on access.
         The remainder of the kwargs are the arguments to the API call.
 
         The return value is the message or message array containing
@@ -712,67 +1192,34 @@ class VPPApiClient:
             kwargs['context'] = context
         else:
             context = kwargs['context']
-        kwargs['_vl_msg_id'] = i
 
         no_type_conversion = kwargs.pop('_no_type_conversion', False)
+        zero_copy = kwargs.pop('_zero_copy', False)
         timeout = kwargs.pop('_timeout', None)
 
-        try:
-            if self.transport.socket_index:
-                kwargs['client_index'] = self.transport.socket_index
-        except AttributeError:
-            pass
-        self.validate_args(msgdef, kwargs)
-
-        s = 'Calling {}({})'.format(msgdef.name,
-            ','.join(['{!r}:{!r}'.format(k, v) for k, v in kwargs.items()]))
-        self.logger.debug(s)
-
-        b = msgdef.pack(kwargs)
+        b = self._pack_call(i, msgdef, kwargs)
+        replies = self._wait_replies((context,))
         self.transport.suspend()
+        try:
+            self.transport.write(b)
 
-        self.transport.write(b)
-
-        msgreply = service['reply']
-        stream = True if 'stream' in service else False
-        if stream:
-            if 'stream_msg' in service:
-                # New service['reply'] = _reply and service['stream_message'] = _details
-                stream_message = service['stream_msg']
-                modern =True
-            else:
-                # Old  service['reply'] = _details
-                stream_message = msgreply
-                msgreply = 'control_ping_reply'
-                modern = False
-                # Send a ping after the request - we use its response
-                # to detect that we have seen all results.
+            collector = ReplyCollector(service)
+            if collector.needs_ping:
                 self._control_ping(context)
 
-        # Block until we get a reply.
-        rl = []
-        while (True):
-            r = self.read_blocking(no_type_conversion, timeout)
-            if r is None:
-                raise VPPIOError(2, 'VPP API client: read failed')
-            msgname = type(r).__name__
-            if context not in r or r.context == 0 or context != r.context:
-                # Message being queued
-                self.message_queue.put_nowait(r)
-                continue
-            if msgname != msgreply and (stream and (msgname != stream_message)):
-                print('REPLY MISMATCH', msgreply, msgname, stream_message, stream)
-            if not stream:
-                rl = r
-                break
-            if msgname == msgreply:
-                if modern: # Return both reply and list
-                    rl = r, rl
-                break
-
-            rl.append(r)
-
-        self.transport.resume()
+            # Block until we get a reply.
+            while True:
+                msg = self._read_reply(replies, timeout)
+                if msg is None:
+                    raise VPPIOError(2, 'VPP API client: read failed')
+                r = self.decode_incoming_msg(msg, no_type_conversion,
+                                             zero_copy)
+                if collector.add(r):
+                    break
+        finally:
+            self._stop_waiting((context,))
+            self.transport.resume()
+        rl = collector.result
 
         s = 'Return value: {!r}'.format(r)
         if len(s) > 80:
@@ -782,6 +1229,95 @@ class VPPApiClient:
         self._add_stat(msgdef.name, (te - ts) * 1000)
         return rl
 
+    def _call_vpp_iter(self, i, msgdef, service, **kwargs):
+        """Given a dump, send the message and yield the details.
+
+        Takes the same arguments as _call_vpp. The details are yielded
+        as they are received, with at most stream_buffer of them queued
+        in the transport. Services paged with a cursor are called again
+        with the returned cursor for as long as VPP replies with
+        VNET_API_ERROR_EAGAIN.
+
+        If the iteration is stopped early, the remaining details are
+        read and dropped before the iterator is closed.
+
+        Other API calls can be made while iterating, the details they
+        read are kept for the iterator.
+        """
+        if 'stream' not in service:
+            raise VPPValueError('{} is not a dump'.format(msgdef.name))
+        paged = 'cursor' in msgdef.field_by_name
+        no_type_conversion = kwargs.pop('_no_type_conversion', False)
+        zero_copy = kwargs.pop('_zero_copy', False)
+        timeout = kwargs.pop('_timeout', None)
+
+        # Restored after, for an outer iterator to keep its bound
+        rx_limit = self.transport.flow_control(self.stream_buffer)
+        try:
+            while True:
+                if 'context' not in kwargs:
+                    kwargs['context'] = self.get_context()
+                context = kwargs.pop('context')
+                b = self._pack_call(i, msgdef, dict(kwargs, context=context))
+                replies = self._wait_replies((context,))
+                self.transport.suspend()
+                collector = None
+                reply = None
+                try:
+                    self.transport.write(b)
+                    collector = ReplyCollector(service)
+                    if collector.needs_ping:
+                        self._control_ping(context)
+
+                    while True:
+                        msg = self._read_reply(replies, timeout)
+                        if msg is None:
+                            raise VPPIOError(2, 'VPP API client: read failed')
+                        r = self.decode_incoming_msg(msg, no_type_conversion,
+                                                     zero_copy)
+                        if type(r).__name__ == collector.msgreply:
+                            reply = r
+                            break
+                        yield r
+                finally:
+                    if (reply is None and collector is not None and
+                            self.transport.connected):
+                        self._discard_replies(replies, collector.msgreply,
+                                              timeout)
+                    self._stop_waiting((context,))
+                    self.transport.resume()
+
+                if not paged or reply.retval != -165:
+                    break
+                kwargs['cursor'] = reply.cursor
+        finally:
+            self.transport.flow_control(rx_limit)
+
+    def _discard_replies(self, replies, msgreply, timeout):
+        """Read and drop the remaining replies to a call."""
+        while True:
+            msg = self._read_reply(replies, timeout)
+            if not msg:
+                return
+            if self.id_names[_msgid.unpack_from(msg)[0]] == msgreply:
+                return
+
+    def _pack_call(self, i, msgdef, kwargs):
+        """Fill in the message header fields and pack an API call."""
+        kwargs['_vl_msg_id'] = i
+        try:
+            if self.transport.socket_index:
+                kwargs['client_index'] = self.transport.socket_index
+        except AttributeError:
+            pass
+        self.validate_args(msgdef, kwargs)
+
+        s = 'Calling {}({})'.format(msgdef.name,
+            ','.join(['{!r}:{!r}'.format(k, v) for k, v in kwargs.items()]))
+        self.logger.debug(s)
+
+        return msgdef.pack(kwargs)
+
     def _call_vpp_async(self, i, msg, **kwargs):
         """Given a message, send the message and return the context.
 
@@ -811,7 +1347,8 @@ class VPPApiClient:
         self.transport.write(b)
         return context
 
-    def read_blocking(self, no_type_conversion=False, timeout=None):
+    def read_blocking(self, no_type_conversion=False, timeout=None,
+                      zero_copy=False):
         """Get next received message from transport within timeout, decoded.
 
         Note that notifications have context zero
@@ -830,6 +1367,9 @@ class VPPApiClient:
 
         :param no_type_conversion: If false, type conversions are applied.
         :type no_type_conversion: bool
+        :param zero_copy: If true, return a VPPLazyRecord decoding fields
+            from the receive buffer on access.
+        :type zero_copy: bool
         :returns: Decoded message, or None if no message (within timeout).
         :rtype: Whatever VPPType.unpack returns, depends on no_type_conversion.
         :raises VppTransportShmemIOError if timed out.
@@ -837,7 +1377,7 @@ class VPPApiClient:
         msg = self.transport.read(timeout=timeout)
         if not msg:
             return None
-        return self.decode_incoming_msg(msg, no_type_conversion)
+        return self.decode_incoming_msg(msg, no_type_conversion, zero_copy)
 
     def register_event_callback(self, callback):
         """Register a callback for async messages.
@@ -0,0 +1,335 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# asyncio VPP API client.
+#
+import asyncio
+import logging
+import time
+
+from .vpp_papi import (VPPApiClient, FuncWrapper, ReplyCollector,
+                       VPPIOError, VPPValueError)
+from .vpp_transport_asyncio import VppAsyncTransport
+
+logger = logging.getLogger('vpp_papi')
+logger.addHandler(logging.NullHandler())
+
+__all__ = ('AsyncVPPApiClient', 'AsyncFuncWrapper')
+
+
+def vpp_async_atexit(vpp_weakref):
+    """Close the VPP connection on shutdown.
+
+    disconnect() cannot be awaited at exit, the socket is closed instead.
+    """
+    vpp_instance = vpp_weakref()
+    if vpp_instance and vpp_instance.transport.connected:
+        logger.debug('Cleaning up VPP on exit')
+        vpp_instance.transport.close()
+        vpp_instance.connection_lost(VPPIOError(2, 'Disconnected'))
+
+
+class AsyncFuncWrapper(FuncWrapper):
+    """API function of an AsyncVPPApiClient.
+
+    Calling it returns a coroutine for the reply. iter() returns an
+    async iterator over the details of a dump instead of collecting
+    them in a list first.
+    """
+
+
+class _PendingCall:
+    """Outstanding call, replies are added by the reader task."""
+    closed = False
+
+    def __init__(self, service, no_type_conversion, zero_copy, loop):
+        self.collector = ReplyCollector(service)
+        self.no_type_conversion = no_type_conversion
+        self.zero_copy = zero_copy
+        self.future = loop.create_future()
+
+    def add(self, r):
+        if self.collector.add(r) and not self.future.done():
+            self.future.set_result(self.collector.result)
+
+    def fail(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class _PendingStream:
+    """Outstanding dump read through an async iterator.
+
+    Details are handed over in a bounded queue. When the consumer falls
+    behind, add() returns the put() to wait for and the reader task
+    stops reading the socket until there is room again. Once the
+    iterator is closed early, the rest of the dump is dropped.
+    """
+    _end = object()
+
+    def __init__(self, service, no_type_conversion, zero_copy, maxsize):
+        self.collector = ReplyCollector(service)
+        self.no_type_conversion = no_type_conversion
+        self.zero_copy = zero_copy
+        self.queue = asyncio.Queue(maxsize)
+        self.reply = None
+        self.closed = False
+
+    def add(self, r):
+        if self.closed:
+            return
+        if type(r).__name__ == self.collector.msgreply:
+            self.reply = r
+            r = self._end
+        try:
+            self.queue.put_nowait(r)
+        except asyncio.QueueFull:
+            return self.queue.put(r)
+
+    def fail(self, exc):
+        # The consumer gets the error ahead of anything still buffered.
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(exc)
+
+    def close(self):
+        """Stop buffering details, releasing a reader waiting in put()."""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class AsyncVPPApiClient(VPPApiClient):
+    """VPP interface for asyncio applications.
+
+    Works like VPPApiClient, with the API functions and connect() and
+    disconnect() being coroutines:
+
+        vpp = AsyncVPPApiClient(server_address='/run/vpp/api.sock')
+        await vpp.connect('my-client')
+        rv = await vpp.api.show_version()
+        async for d in vpp.api.sw_interface_dump.iter():
+            ...
+        async for event in vpp.events():
+            ...
+
+    Replies are matched to their calls by context, so any number of
+    calls from different tasks can be outstanding at the same time.
+    Messages without a pending context are delivered to the registered
+    event callback, or queued for events().
+
+    stream_buffer bounds the number of details buffered for each
+    iter() call.
+    """
+    FuncWrapper = AsyncFuncWrapper
+    VppTransport = VppAsyncTransport
+    vpp_atexit = staticmethod(vpp_async_atexit)
+
+    def __init__(self, **kwargs):
+        kwargs['async_thread'] = False
+        kwargs['use_socket'] = True
+        super(AsyncVPPApiClient, self).__init__(**kwargs)
+        self._pending = {}
+        self._events = None
+        self._loop = None
+
+    def make_function(self, msg, i, multipart, do_async):
+        async def f(**kwargs):
+            return await self._acall(i, msg, multipart, kwargs)
+
+        def f_iter(**kwargs):
+            return self._aiter(i, msg, multipart, kwargs)
+
+        f.__name__ = str(msg.name)
+        f.__doc__ = ", ".join(["%s %s" %
+                               (msg.fieldtypes[j], k)
+                               for j, k in enumerate(msg.fields)])
+        f.msg = msg
+        f.msg_index = i
+        f.service = multipart
+        f.iter = f_iter
+
+        return f
+
+    async def connect(self, name, chroot_prefix=None, rx_qlen=32):
+        """Attach to VPP.
+
+        name - the name of the client.
+        chroot_prefix - if VPP is chroot'ed, the prefix of the jail
+        rx_qlen - the length of the VPP message receive queue between
+        client and server.
+        """
+        pfx = chroot_prefix.encode('utf-8') if chroot_prefix else None
+
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        rv = await self.transport.connect(name, pfx, None, rx_qlen)
+        if rv != 0:
+            raise VPPIOError(2, 'Connect failed')
+        self.vpp_dictionary_maxid = self.transport.msg_table_max_index()
+        self._register_functions()
+
+        # Initialise control ping
+        crc = self.messages['control_ping'].crc
+        self.control_ping_index = self.transport.get_msg_index(
+            ('control_ping' + '_' + crc[2:]))
+        self.control_ping_msgdef = self.messages['control_ping']
+        return rv
+
+    def connect_sync(self, name, chroot_prefix=None, rx_qlen=32):
+        raise VPPValueError('AsyncVPPApiClient has no sync mode')
+
+    async def disconnect(self):
+        """Detach from VPP."""
+        rv = await self.transport.disconnect()
+        self.connection_lost(VPPIOError(2, 'Disconnected'))
+        return rv
+
+    def msg_received(self, msg):
+        """Called by the transport for every message from VPP.
+
+        Returns an awaitable if the reader has to wait for a consumer.
+        """
+        i, context = self._msg_header(msg)
+        pending = self._pending.get(context) if context else None
+        if pending is not None and pending.closed:
+            # Rest of a dump whose iterator was closed early
+            if self.id_names[i] == pending.collector.msgreply:
+                del self._pending[context]
+            return
+        if pending is None:
+            r = self.decode_incoming_msg(msg)
+            if r is None:
+                return
+            if self.event_callback:
+                self.event_callback(type(r).__name__, r)
+            else:
+                self._events.put_nowait(r)
+            return
+        r = self.decode_incoming_msg(msg, pending.no_type_conversion,
+                                     pending.zero_copy)
+        return pending.add(r)
+
+    def connection_lost(self, exc):
+        """Fail all outstanding calls."""
+        pending, self._pending = self._pending, {}
+        for p in pending.values():
+            p.fail(exc)
+
+    async def events(self):
+        """Async iterator over the messages not replying to a call."""
+        while True:
+            yield await self._events.get()
+
+    def _send(self, i, msgdef, kwargs, pending):
+        context = kwargs['context']
+        if context in self._pending:
+            raise VPPValueError('Context {} already in use'.format(context))
+        b = self._pack_call(i, msgdef, kwargs)
+        self._pending[context] = pending
+        if pending.collector.needs_ping:
+            self.transport.write_many([
+                b, self._pack_call(self.control_ping_index,
+                                   self.control_ping_msgdef,
+                                   {'context': context})])
+        else:
+            self.transport.write(b)
+
+    def _pop_options(self, kwargs):
+        if 'context' not in kwargs:
+            kwargs['context'] = self.get_context()
+        no_type_conversion = kwargs.pop('_no_type_conversion', False)
+        zero_copy = kwargs.pop('_zero_copy', False)
+        timeout = kwargs.pop('_timeout', None)
+        if timeout is None:
+            timeout = self.transport.read_timeout
+        return no_type_conversion, zero_copy, timeout
+
+    async def _acall(self, i, msgdef, service, kwargs):
+        """Send a message and await the reply.
+
+        Takes the same arguments as VPPApiClient._call_vpp.
+        """
+        ts = time.time()
+        no_type_conversion, zero_copy, timeout = self._pop_options(kwargs)
+        context = kwargs['context']
+        pending = _PendingCall(service, no_type_conversion, zero_copy,
+                               self._loop)
+        self._send(i, msgdef, kwargs, pending)
+        try:
+            await self.transport.drain()
+            rl = await asyncio.wait_for(pending.future, timeout)
+        except asyncio.TimeoutError:
+            raise VPPIOError(2, 'VPP API client: read timed out')
+        finally:
+            self._pending.pop(context, None)
+
+        s = 'Return value: {!r}'.format(rl)
+        if len(s) > 80:
+            s = s[:80] + "..."
+        self.logger.debug(s)
+        te = time.time()
+        self._add_stat(msgdef.name, (te - ts) * 1000)
+        return rl
+
+    async def _aiter(self, i, msgdef, service, kwargs):
+        """Send a dump and yield the details as they arrive.
+
+        As for VPPApiClient iter(), services paged with a cursor are
+        called again with the returned cursor for as long as VPP replies
+        with VNET_API_ERROR_EAGAIN.
+        """
+        if 'stream' not in service:
+            raise VPPValueError('{} is not a dump'.format(msgdef.name))
+        paged = 'cursor' in msgdef.field_by_name
+        no_type_conversion, zero_copy, timeout = self._pop_options(kwargs)
+        while True:
+            context = kwargs['context']
+            pending = _PendingStream(service, no_type_conversion, zero_copy,
+                                     self.stream_buffer)
+            self._send(i, msgdef, kwargs, pending)
+            try:
+                await self.transport.drain()
+                while True:
+                    try:
+                        r = await asyncio.wait_for(pending.queue.get(),
+                                                   timeout)
+                    except asyncio.TimeoutError:
+                        raise VPPIOError(2, 'VPP API client: read timed out')
+                    if r is pending._end:
+                        break
+                    if isinstance(r, Exception):
+                        raise r
+                    yield r
+            except GeneratorExit:
+                if (pending.reply is None and
+                        self._pending.get(context) is pending):
+                    # Stopped early, the reply ending the dump unregisters it
+                    pending.close()
+                raise
+            finally:
+                if not pending.closed:
+                    self._pending.pop(context, None)
+
+            if not paged or pending.reply.retval != -165:
+                break
+            kwargs['context'] = self.get_context()
+            kwargs['cursor'] = pending.reply.cursor
+
+    def __repr__(self):
+        return "<AsyncVPPApiClient apifiles=%s, testmode=%s, " \
+               "logger=%s, read_timeout=%s, " \
+               "server_address='%s'>" % (
+                   self._apifiles, self.testmode,
+                   self.logger, self.read_timeout, self.server_address)
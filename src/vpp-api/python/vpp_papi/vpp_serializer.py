@@ -15,12 +15,19 @@
 import collections
 from enum import IntFlag
 import logging
+import operator
 import socket
 import struct
 import sys
+import threading
 
 from . import vpp_format
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 #
 # Set log-level in application by doing e.g.:
@@ -34,6 +41,94 @@ def check(d):
     return type(d) is dict or type(d) is bytes
 
 
+# Pre-packed values of fixed size types, packed as they are
+RAW_TYPES = (bytes, bytearray, memoryview)
+
+
+def check_raw(name, data, size):
+    if len(data) != size:
+        raise VPPSerializerValueError(
+            'Packed value length error for "{}", got: {} expected: {}'
+            .format(name, len(data), size))
+
+
+def unpack_array(name, packer, data, offset, count, ntc=False):
+    """Unpack the array name of count consecutive elements of the fixed
+    size packer, with a single struct call. Returns the list of elements
+    and its size."""
+    size = struct.calcsize('>' + packer._fmt) * count
+    if len(data) - offset < size:
+        raise VPPSerializerValueError(
+            'Invalid array length for "{}" got {} expected {}'
+            .format(name, len(data) - offset, size))
+    if len(packer._fmt) == 1 and _is_plain(packer):
+        return list(struct.unpack_from('>%d%s' % (count, packer._fmt),
+                                       data, offset)), size
+    view = memoryview(data)[offset:offset + size]
+    flat_unpack = packer._flat_unpack
+    return [flat_unpack(values, 0, ntc)[0] for values in
+            struct.iter_unpack('>' + packer._fmt, view)], size
+
+
+def pack_array(name, packer, lst):
+    """Pack the array name of fixed size packer elements into a single
+    preallocated buffer. lst is a list of elements, the whole array
+    already packed as bytes, or a NumPy array. Returns the buffer and
+    the number of elements."""
+    st = struct.Struct('>' + packer._fmt)
+    size = st.size
+    if type(lst) in RAW_TYPES:
+        if len(lst) % size:
+            raise VPPSerializerValueError(
+                'Packed array length error for "{}", got: {} expected a '
+                'multiple of {}'.format(name, len(lst), size))
+        return bytes(lst), len(lst) // size
+    if np is not None and isinstance(lst, np.ndarray):
+        dtype = numpy_dtype(packer)
+        if lst.dtype != dtype:
+            lst = lst.astype(dtype)
+        return lst.tobytes(), len(lst)
+    buf = bytearray(size * len(lst))
+    try:
+        for offset, e in zip(range(0, len(buf), size), lst):
+            out = []
+            packer._flat_pack(e, out)
+            st.pack_into(buf, offset, *out)
+    except struct.error:
+        # Let the element packer report the offending field
+        return b''.join(packer.pack(e) for e in lst), len(lst)
+    return buf, len(lst)
+
+
+def numpy_dtype(packer):
+    """NumPy dtype of a fixed size packer, with the values as they are
+    on the wire: enums as integers, unions as opaque bytes and u8
+    arrays as arrays of uint8."""
+    if isinstance(packer, VPPType):
+        if packer._struct is None:
+            raise VPPSerializerValueError(
+                'Not a fixed size type: {}'.format(packer.name))
+        return np.dtype([(f, numpy_dtype(p)) for f, p in
+                         zip(packer.tuple._fields, packer.packers)])
+    if isinstance(packer, VPPTypeAlias):
+        return numpy_dtype(packer.packer)
+    if isinstance(packer, VPPEnumType):
+        return numpy_dtype(types[packer.enumtype])
+    if isinstance(packer, FixedList):
+        return np.dtype((numpy_dtype(packer.packer), packer.num))
+    if isinstance(packer, FixedList_u8):
+        return np.dtype((np.uint8, packer.num))
+    if isinstance(packer, String) and packer.fixed:
+        return np.dtype('S%d' % packer.num)
+    if isinstance(packer, VPPUnionType):
+        return np.dtype('V%d' % packer.size)
+    if isinstance(packer, BaseTypes) and packer._fmt is not None:
+        # struct formats of single values are valid dtype strings
+        return np.dtype(packer.packer.format)
+    raise VPPSerializerValueError(
+        'No NumPy dtype for {!r}'.format(packer))
+
+
 def conversion_required(data, field_type):
     if check(data):
         return False
@@ -58,6 +153,9 @@ def conversion_unpacker(data, field_type):
 
 class Packer:
     options = {}
+    # struct format (without byte order) of the values making up a fixed
+    # size packer, or None if the packer is variable length.
+    _fmt = None
 
     def pack(self, data, kwargs):
         raise NotImplementedError
@@ -65,6 +163,15 @@ class Packer:
     def unpack(self, data, offset, result=None, ntc=False):
         raise NotImplementedError
 
+    def _flat_pack(self, data, out):
+        """Append the struct values representing data to out."""
+        raise NotImplementedError
+
+    def _flat_unpack(self, values, i, ntc=False):
+        """Build a value from the struct values starting at values[i].
+        Returns the value and the index of the next unused struct value."""
+        raise NotImplementedError
+
     # override as appropriate in subclasses
     @staticmethod
     def _get_packer_with_options(f_type, options):
@@ -106,6 +213,16 @@ class BaseTypes(Packer):
         self.size = self.packer.size
         self.options = options
 
+        # Native byte order values (f64) cannot be part of a big endian
+        # struct, they are carried pre-packed as a byte string instead.
+        self._native = self.packer.format[0] != '>'
+        if type == 'header':
+            self._fmt = None
+        elif self._native:
+            self._fmt = '%ds' % self.size
+        else:
+            self._fmt = self.packer.format[1:]
+
     def pack(self, data, kwargs=None):
         if data is None:  # Default to zero if not specified
             if self.options and 'default' in self.options:
@@ -117,6 +234,21 @@ class BaseTypes(Packer):
     def unpack(self, data, offset, result=None, ntc=False):
         return self.packer.unpack_from(data, offset)[0], self.packer.size
 
+    def _flat_pack(self, data, out):
+        if data is None:  # Default to zero if not specified
+            if self.options and 'default' in self.options:
+                data = self.options['default']
+            else:
+                data = 0
+        if self._native:
+            data = self.packer.pack(data)
+        out.append(data)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        if self._native:
+            return self.packer.unpack(values[i])[0], i + 1
+        return values[i], i + 1
+
     @staticmethod
     def _get_packer_with_options(f_type, options):
         return BaseTypes(f_type, options=options)
@@ -131,7 +263,8 @@ class String(Packer):
     def __init__(self, name, num, options):
         self.name = name
         self.num = num
-        self.size = 1
+        # Size on the wire of fixed strings, as for other fixed size types
+        self.size = num if num else 1
         self.length_field_packer = BaseTypes('u32')
         self.limit = options['limit'] if 'limit' in options else num
         self.fixed = True if num else False
@@ -139,6 +272,10 @@ class String(Packer):
             raise VPPSerializerValueError(
                 "Invalid combination for: {}, {} fixed:{} limit:{}".
                 format(name, options, self.fixed, self.limit))
+        if self.fixed:
+            self.packer = BaseTypes('u8', num)
+            if self.limit == num:
+                self._fmt = '%ds' % num
 
     def pack(self, list, kwargs=None):
         if not list:
@@ -155,8 +292,7 @@ class String(Packer):
 
     def unpack(self, data, offset=0, result=None, ntc=False):
         if self.fixed:
-            p = BaseTypes('u8', self.num)
-            s = p.unpack(data, offset)
+            s = self.packer.unpack(data, offset)
             s2 = s[0].split(b'\0', 1)[0]
             return (s2.decode('ascii'), self.num)
 
@@ -164,17 +300,74 @@ class String(Packer):
                                                                     offset)
         if length == 0:
             return '', 0
-        p = BaseTypes('u8', length)
-        x, size = p.unpack(data, offset + length_field_size)
-        return (x.decode('ascii', errors='replace'), size + length_field_size)
+        offset += length_field_size
+        x = bytes(data[offset:offset + length])
+        if len(x) < length:
+            raise VPPSerializerValueError(
+                'Invalid string length for "{}" got {} expected {}'
+                .format(self.name, len(x), length))
+        return (x.decode('ascii', errors='replace'),
+                length + length_field_size)
 
+    def _flat_pack(self, data, out):
+        out.append(self.pack(data))
 
-types = {'u8': BaseTypes('u8'), 'i8': BaseTypes('i8'),
-         'u16': BaseTypes('u16'), 'i16': BaseTypes('i16'),
-         'u32': BaseTypes('u32'), 'i32': BaseTypes('i32'),
-         'u64': BaseTypes('u64'), 'i64': BaseTypes('i64'),
-         'f64': BaseTypes('f64'),
-         'bool': BaseTypes('bool'), 'string': String}
+    def _flat_unpack(self, values, i, ntc=False):
+        return values[i].split(b'\0', 1)[0].decode('ascii'), i + 1
+
+
+# Serializes building types and messages on first use, which may
+# happen in the reader thread and the caller's thread at once. Building
+# one type looks up, and so builds, the types of its fields.
+_build_lock = threading.RLock()
+
+
+class VPPTypeRegistry(dict):
+    """Type name to packer mapping.
+
+    Types can also be defined by a factory, which is only called to
+    build the type when it is first looked up.
+    """
+    def __init__(self, *args, **kwargs):
+        super(VPPTypeRegistry, self).__init__(*args, **kwargs)
+        self.factories = {}
+
+    def __missing__(self, name):
+        with _build_lock:
+            # Built by another thread while waiting for the lock
+            if dict.__contains__(self, name):
+                return dict.__getitem__(self, name)
+            factory = self.factories.pop(name)
+            try:
+                factory()
+            except BaseException:
+                self.factories[name] = factory
+                raise
+            return dict.__getitem__(self, name)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.factories
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def define(self, name, factory):
+        """Define type name, to be built by calling factory on first use.
+        Does nothing if the type already exists."""
+        if name not in self:
+            self.factories[name] = factory
+
+
+types = VPPTypeRegistry({
+    'u8': BaseTypes('u8'), 'i8': BaseTypes('i8'),
+    'u16': BaseTypes('u16'), 'i16': BaseTypes('i16'),
+    'u32': BaseTypes('u32'), 'i32': BaseTypes('i32'),
+    'u64': BaseTypes('u64'), 'i64': BaseTypes('i64'),
+    'f64': BaseTypes('f64'),
+    'bool': BaseTypes('bool'), 'string': String})
 
 class_types = {}
 
@@ -186,6 +379,27 @@ def vpp_get_type(name):
         return None
 
 
+def vpp_define_type(name, factory):
+    types.define(name, factory)
+
+
+def vpp_apply_field_options(msgdef):
+    """Build the packers with options of the fields of a type or message
+    definition, as building the type itself would.
+
+    A packer with options for an alias or enum replaces the registered
+    type, so that its default applies to all later users. For lazily
+    built types this is done up front, for the defaults not to depend on
+    the order in which types happen to be built."""
+    for f in msgdef:
+        if type(f) is not list:
+            continue
+        options = [x for x in f if type(x) is dict]
+        if (len(f) - len(options) == 2 and options and
+                'default' in options[0] and f[0] in types):
+            Packer().get_packer_with_options(f[0], options[0])
+
+
 class VPPSerializerValueError(ValueError):
     pass
 
@@ -197,6 +411,7 @@ class FixedList_u8(Packer):
         self.packer = BaseTypes(field_type, num)
         self.size = self.packer.size
         self.field_type = field_type
+        self._fmt = self.packer._fmt
 
     def pack(self, data, kwargs=None):
         """Packs a fixed length bytestring. Left-pads with zeros
@@ -218,13 +433,28 @@ class FixedList_u8(Packer):
                 .format(self.name, kwargs))
 
     def unpack(self, data, offset=0, result=None, ntc=False):
-        if len(data[offset:]) < self.num:
+        if len(data) - offset < self.num:
             raise VPPSerializerValueError(
                 'Invalid array length for "{}" got {}'
                 ' expected {}'
-                .format(self.name, len(data[offset:]), self.num))
+                .format(self.name, len(data) - offset, self.num))
         return self.packer.unpack(data, offset)
 
+    def _flat_pack(self, data, out):
+        if not data:
+            out.append(b'')  # struct pads with zeros
+            return
+
+        if len(data) > self.num:
+            raise VPPSerializerValueError(
+                'Fixed list length error for "{}", got: {}'
+                ' expected: {}'
+                .format(self.name, len(data), self.num))
+        out.append(data)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        return values[i], i + 1
+
     def __repr__(self):
         return "FixedList_u8(name=%s, field_type=%s, num=%s)" % (
             self.name, self.field_type, self.num
@@ -238,8 +468,21 @@ class FixedList(Packer):
         self.size = self.packer.size * num
         self.name = name
         self.field_type = field_type
+        if self.packer._fmt is not None:
+            self._fmt = self.packer._fmt * num
+            self._struct = struct.Struct('>' + self._fmt)
 
     def pack(self, list, kwargs):
+        if type(list) in RAW_TYPES and self._fmt is not None:
+            check_raw(self.name, list, self._struct.size)
+            return bytes(list)
+        if self._fmt is not None:
+            b, n = pack_array(self.name, self.packer, list)
+            if n != self.num:
+                raise VPPSerializerValueError(
+                    'Fixed list length error, got: {} expected: {}'
+                    .format(n, self.num))
+            return b
         if len(list) != self.num:
             raise VPPSerializerValueError(
                 'Fixed list length error, got: {} expected: {}'
@@ -251,6 +494,9 @@ class FixedList(Packer):
 
     def unpack(self, data, offset=0, result=None, ntc=False):
         # Return a list of arguments
+        if self._fmt is not None:
+            return unpack_array(self.name, self.packer, data, offset,
+                                self.num, ntc)
         result = []
         total = 0
         for e in range(self.num):
@@ -260,6 +506,27 @@ class FixedList(Packer):
             total += size
         return result, total
 
+    def _flat_pack(self, list, out):
+        if np is not None and isinstance(list, np.ndarray):
+            list = pack_array(self.name, self.packer, list)[0]
+        if type(list) in RAW_TYPES:
+            check_raw(self.name, list, self._struct.size)
+            out.extend(self._struct.unpack(list))
+            return
+        if len(list) != self.num:
+            raise VPPSerializerValueError(
+                'Fixed list length error, got: {} expected: {}'
+                .format(len(list), self.num))
+        for e in list:
+            self.packer._flat_pack(e, out)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        result = []
+        for e in range(self.num):
+            x, i = self.packer._flat_unpack(values, i, ntc)
+            result.append(x)
+        return result, i
+
     def __repr__(self):
         return "FixedList(name=%s, field_type=%s, num=%s)" % (
             self.name, self.field_type, self.num)
@@ -275,19 +542,31 @@ class VLAList(Packer):
         self.length_field = len_field_name
 
     def pack(self, lst, kwargs=None):
-        if not lst:
+        if lst is None or len(lst) == 0:
             return b""
-        if len(lst) != kwargs[self.length_field]:
-            raise VPPSerializerValueError(
-                'Variable length error, got: {} expected: {}'
-                .format(len(lst), kwargs[self.length_field]))
 
         # u8 array
         if self.packer.size == 1:
+            if len(lst) != kwargs[self.length_field]:
+                raise VPPSerializerValueError(
+                    'Variable length error, got: {} expected: {}'
+                    .format(len(lst), kwargs[self.length_field]))
             if isinstance(lst, list):
                 return b''.join(lst)
             return bytes(lst)
 
+        if self.packer._fmt is not None:
+            b, n = pack_array(self.name, self.packer, lst)
+            if n != kwargs[self.length_field]:
+                raise VPPSerializerValueError(
+                    'Variable length error, got: {} expected: {}'
+                    .format(n, kwargs[self.length_field]))
+            return b
+
+        if len(lst) != kwargs[self.length_field]:
+            raise VPPSerializerValueError(
+                'Variable length error, got: {} expected: {}'
+                .format(len(lst), kwargs[self.length_field]))
         b = bytes()
         for e in lst:
             b += self.packer.pack(e)
@@ -299,11 +578,19 @@ class VLAList(Packer):
 
         # u8 array
         if self.packer.size == 1:
-            if result[self.index] == 0:
+            length = result[self.index]
+            if length == 0:
                 return b'', 0
-            p = BaseTypes('u8', result[self.index])
-            return p.unpack(data, offset, ntc=ntc)
+            x = bytes(data[offset:offset + length])
+            if len(x) < length:
+                raise VPPSerializerValueError(
+                    'Invalid array length for "{}" got {} expected {}'
+                    .format(self.name, len(x), length))
+            return x, length
 
+        if self.packer._fmt is not None:
+            return unpack_array(self.name, self.packer, data, offset,
+                                result[self.index], ntc)
         r = []
         for e in range(result[self.index]):
             x, size = self.packer.unpack(data, offset, ntc=ntc)
@@ -329,6 +616,8 @@ class VLAList_legacy(Packer):
     def pack(self, list, kwargs=None):
         if self.packer.size == 1:
             return bytes(list)
+        if self.packer._fmt is not None:
+            return pack_array(self.name, self.packer, list)[0]
 
         b = bytes()
         for e in list:
@@ -342,6 +631,9 @@ class VLAList_legacy(Packer):
             raise VPPSerializerValueError(
                 'Legacy Variable Length Array length mismatch.')
         elements = int((len(data) - offset) / self.packer.size)
+        if self.packer._fmt is not None:
+            return unpack_array(self.name, self.packer, data, offset,
+                                elements, ntc)
         r = []
         for e in range(elements):
             x, size = self.packer.unpack(data, offset, ntc=ntc)
@@ -375,6 +667,7 @@ class VPPEnumType(Packer):
             ename, evalue = f
             e_hash[ename] = evalue
         self.enum = self.output_class(name, e_hash)
+        self._fmt = types[self.enumtype]._fmt
         types[name] = self
         class_types[name] = self.__class__
         self.options = options
@@ -398,6 +691,17 @@ class VPPEnumType(Packer):
         x, size = types[self.enumtype].unpack(data, offset)
         return self.enum(x), size
 
+    def _flat_pack(self, data, out):
+        if data is None:  # Default to zero if not specified
+            if self.options and 'default' in self.options:
+                data = self.options['default']
+            else:
+                data = 0
+        out.append(data)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        return self.enum(values[i]), i + 1
+
     @classmethod
     def _get_packer_with_options(cls, f_type, options):
         return cls(f_type, types[f_type].msgdef, options=options)
@@ -441,11 +745,20 @@ class VPPUnionType(Packer):
 
         types[name] = self
         self.tuple = collections.namedtuple(name, fields, rename=True)
+        # A union is carried as an opaque byte string of its full size
+        if all(p._fmt is not None for p in self.packers.values()):
+            self._fmt = '%ds' % self.size
+            self._members = [(struct.Struct('>' + p._fmt), p)
+                             for p in self.packers.values()]
 
     # Union of variable length?
     def pack(self, data, kwargs=None):
         if not data:
             return b'\x00' * self.size
+        if type(data) in RAW_TYPES:
+            if len(data) > self.size:
+                check_raw(self.name, data, self.size)
+            return bytes(data).ljust(self.size, b'\x00')
 
         for k, v in data.items():
             logger.debug("Key: {} Value: {}".format(k, v))
@@ -465,6 +778,20 @@ class VPPUnionType(Packer):
             r.append(x)
         return self.tuple._make(r), maxsize
 
+    def _flat_pack(self, data, out):
+        if type(data) in RAW_TYPES and len(data) == self.size:
+            out.append(bytes(data))
+            return
+        out.append(bytes(self.pack(data)))
+
+    def _flat_unpack(self, values, i, ntc=False):
+        raw = values[i]
+        r = []
+        for st, p in self._members:
+            x, _ = p._flat_unpack(st.unpack_from(raw), 0, ntc)
+            r.append(x)
+        return self.tuple._make(r), i + 1
+
     def __repr__(self):
         return"VPPUnionType(name=%s, msgdef=%r)" % (self.name, self.msgdef)
 
@@ -492,6 +819,7 @@ class VPPTypeAlias(Packer):
         types[name] = self
         self.toplevelconversion = False
         self.options = options
+        self._fmt = self.packer._fmt
 
     def pack(self, data, kwargs=None):
         if data and conversion_required(data, self.name):
@@ -523,11 +851,141 @@ class VPPTypeAlias(Packer):
             return conversion_unpacker(t, self.name), size
         return t, size
 
+    def _flat_pack(self, data, out):
+        if data and conversion_required(data, self.name):
+            try:
+                data = vpp_format.conversion_table[self.name][
+                    type(data).__name__](data)
+            # Python 2 and 3 raises different exceptions from inet_pton
+            except(OSError, socket.error, TypeError):
+                pass
+        if data is None:  # Default to zero if not specified
+            if self.options and 'default' in self.options:
+                data = self.options['default']
+            else:
+                data = 0
+        self.packer._flat_pack(data, out)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        if ntc is False and self.name in vpp_format.conversion_unpacker_table:
+            # Disable type conversion for dependent types
+            t, i = self.packer._flat_unpack(values, i, True)
+            return conversion_unpacker(t, self.name), i
+        return self.packer._flat_unpack(values, i, ntc)
+
     def __repr__(self):
         return "VPPTypeAlias(name=%s, msgdef=%s, options=%s)" % (
             self.name, self.msgdef, self.options)
 
 
+class VPPLazyRecord:
+    """A record decoded on demand from a buffer, typically a memoryview
+    of the receive buffer. Fields at a fixed offset are unpacked from
+    the buffer when they are accessed, nothing is copied up front. Any
+    other use decodes the complete record once, into the namedtuple
+    that VPPType.unpack would have returned.
+    """
+    __slots__ = ('_data', '_offset', '_ntc', '_tuple')
+    _type = None
+
+    def __init__(self, data, offset=0, ntc=False):
+        self._data = data
+        self._offset = offset
+        self._ntc = ntc
+        self._tuple = None
+
+    def _materialize(self):
+        if self._tuple is None:
+            self._tuple, _ = self._type.unpack(self._data, self._offset,
+                                               ntc=self._ntc)
+        return self._tuple
+
+    def _asdict(self):
+        return self._materialize()._asdict()
+
+    def __getitem__(self, item):
+        return self._materialize()[item]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._type.fields)
+
+    def __contains__(self, value):
+        return value in self._materialize()
+
+    def __eq__(self, other):
+        if isinstance(other, VPPLazyRecord):
+            other = other._materialize()
+        return self._materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._materialize())
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+
+class VPPCompactRecord(tuple):
+    """A decoded record kept as one flat tuple.
+
+    Nested fixed size types and fixed arrays of them do not get a
+    namedtuple of their own, their decoded fields are stored inline in
+    the record and a compact record of the nested type is made when
+    the field is accessed. Variable length fields take one slot each,
+    a list of compact records for arrays of types. Fields are read as
+    attributes; indexing and iteration give the flat values, use
+    _astuple() for the namedtuple of the fields.
+    """
+    __slots__ = ()
+    _type = None
+
+    def _astuple(self):
+        t = self._type.tuple
+        return t._make(getattr(self, f) for f in t._fields)
+
+    def _asdict(self):
+        return self._astuple()._asdict()
+
+    def __repr__(self):
+        return repr(self._astuple())
+
+
+def _compactable(p):
+    return isinstance(p, VPPType) and \
+        p.name not in vpp_format.conversion_unpacker_table
+
+
+def _compact_nested(p):
+    """The type stored inline by a fixed size field, or None"""
+    if p._fmt is None:
+        return None
+    if _compactable(p):
+        return p
+    if isinstance(p, FixedList) and _compactable(p.packer):
+        return p.packer
+    return None
+
+
+def _leaf_count(p):
+    """Number of struct values making up a fixed size packer"""
+    st = struct.Struct('>' + p._fmt)
+    return len(st.unpack(bytes(st.size)))
+
+
+def _is_plain(p):
+    """True if p decodes to its struct value as is"""
+    while isinstance(p, VPPTypeAlias) and \
+            p.name not in vpp_format.conversion_unpacker_table:
+        p = p.packer
+    return isinstance(p, FixedList_u8) or \
+        (type(p) is BaseTypes and not p._native)
+
+
 class VPPType(Packer):
     # Set everything up to be able to pack / unpack
     def __init__(self, name, msgdef):
@@ -596,16 +1054,137 @@ class VPPType(Packer):
         self.tuple = collections.namedtuple(name, self.fields, rename=True)
         types[name] = self
         self.toplevelconversion = False
+        self._lazy_class = None
+        self._compact_class = None
+        self._dtype = None
+        self._compile()
+
+    def _compile(self):
+        """Precompile the codec. Consecutive fixed size fields, including
+        nested fixed size types, enums and fixed arrays, are flattened
+        into a single struct.Struct. Only variable length fields are
+        left to their own packers."""
+        self._runs = []
+        start = 0
+        for i, p in enumerate(self.packers + [None]):
+            if p is not None and p._fmt is not None:
+                continue
+            if i > start:
+                fmt = ''.join(q._fmt for q in self.packers[start:i])
+                self._runs.append((struct.Struct('>' + fmt), start,
+                                   self.packers[start:i]))
+            if p is not None:
+                self._runs.append((None, i, p))
+            start = i + 1
+
+        if all(p._fmt is not None for p in self.packers):
+            self._fmt = ''.join(p._fmt for p in self.packers)
+            self._struct = struct.Struct('>' + self._fmt)
+        else:
+            self._struct = None
+
+        # Fields decoding to their struct value as is
+        self._plain = [_is_plain(p) for p in self.packers]
+
+        # Offsets of the fields preceding the first variable length field
+        self._offsets = []
+        offset = 0
+        for p in self.packers:
+            if offset is not None and p._fmt is None:
+                self._offsets.append(offset)
+                offset = None
+                continue
+            self._offsets.append(offset)
+            if offset is not None:
+                offset += struct.calcsize('>' + p._fmt)
+
+    def _get_arg(self, a, data):
+        if not data:
+            return None
+        if a not in data:
+            if type(data) is not dict:
+                raise VPPSerializerValueError(
+                    "Invalid argument: {} expected {}.{}".
+                    format(data, self.name, a))
+            return None  # Default to 0
+        return data[a]
+
+    def _flat_pack_fields(self, data, out):
+        for i, a in enumerate(self.fields):
+            self.packers[i]._flat_pack(self._get_arg(a, data), out)
+
+    def _flat_pack(self, data, out):
+        if type(data) in RAW_TYPES and self._struct is not None:
+            check_raw(self.name, data, self._struct.size)
+            out.extend(self._struct.unpack(data))
+            return
+        if data and conversion_required(data, self.name):
+            data = vpp_format.conversion_table[self.name][
+                type(data).__name__](data)
+        self._flat_pack_fields(data, out)
+
+    def _flat_unpack(self, values, i, ntc=False):
+        toplevelconversion = False
+        if ntc is False and self.name in vpp_format.conversion_unpacker_table:
+            # Disable type conversion for dependent types
+            ntc = True
+            toplevelconversion = True
+        result = []
+        for p, plain in zip(self.packers, self._plain):
+            if plain:
+                result.append(values[i])
+                i += 1
+                continue
+            x, i = p._flat_unpack(values, i, ntc)
+            result.append(x)
+        t = self.tuple._make(result)
+        if toplevelconversion:
+            t = conversion_unpacker(t, self.name)
+        return t, i
 
     def pack(self, data, kwargs=None):
         if not kwargs:
             kwargs = data
-        b = bytes()
+
+        # Already packed, fixed size types only
+        if type(data) in RAW_TYPES and self._struct is not None:
+            check_raw(self.name, data, self._struct.size)
+            return bytes(data)
 
         # Try one of the format functions
         if data and conversion_required(data, self.name):
             return conversion_packer(data, self.name)
 
+        try:
+            if self._struct is not None:
+                out = []
+                self._flat_pack_fields(data, out)
+                return self._struct.pack(*out)
+
+            b = []
+            for st, i, p in self._runs:
+                if st is None:
+                    b.append(self._pack_field(i, data, kwargs))
+                    continue
+                out = []
+                for j, q in enumerate(p, i):
+                    q._flat_pack(self._get_arg(self.fields[j], data), out)
+                b.append(st.pack(*out))
+            return b''.join(b)
+        except struct.error:
+            # Let the individual packers report the offending field
+            return self._pack_fields(data, kwargs)
+
+    def _pack_field(self, i, data, kwargs):
+        a = self.fields[i]
+        arg = self._get_arg(a, data)
+        if isinstance(self.packers[i], VPPType):
+            kwarg = kwargs[a] if arg is not None and a in kwargs else None
+            return self.packers[i].pack(arg, kwarg)
+        return self.packers[i].pack(arg, kwargs)
+
+    def _pack_fields(self, data, kwargs):
+        b = bytes()
         for i, a in enumerate(self.fields):
             if data and type(data) is not dict and a not in data:
                 raise VPPSerializerValueError(
@@ -630,11 +1209,41 @@ class VPPType(Packer):
         # Return a list of arguments
         result = []
         total = 0
+        toplevelconversion = False
         if ntc is False and self.name in vpp_format.conversion_unpacker_table:
             # Disable type conversion for dependent types
             ntc = True
-            self.toplevelconversion = True
+            toplevelconversion = True
 
+        try:
+            for st, i, p in self._runs:
+                if st is None:
+                    x, size = p.unpack(data, offset, result, ntc)
+                    if type(x) is tuple and len(x) == 1:
+                        x = x[0]
+                    result.append(x)
+                else:
+                    values = st.unpack_from(data, offset)
+                    j = 0
+                    for q in p:
+                        x, j = q._flat_unpack(values, j, ntc)
+                        result.append(x)
+                    size = st.size
+                offset += size
+                total += size
+        except struct.error:
+            # Let the individual packers report the offending field
+            return self._unpack_fields(data, offset - total, ntc,
+                                       toplevelconversion)
+        t = self.tuple._make(result)
+
+        if toplevelconversion:
+            t = conversion_unpacker(t, self.name)
+        return t, total
+
+    def _unpack_fields(self, data, offset, ntc, toplevelconversion):
+        result = []
+        total = 0
         for p in self.packers:
             x, size = p.unpack(data, offset, result, ntc)
             if type(x) is tuple and len(x) == 1:
@@ -644,11 +1253,189 @@ class VPPType(Packer):
             total += size
         t = self.tuple._make(result)
 
-        if self.toplevelconversion:
-            self.toplevelconversion = False
+        if toplevelconversion:
             t = conversion_unpacker(t, self.name)
         return t, total
 
+    def unpack_numpy(self, data, offset=0, count=-1):
+        """Decode count consecutive records of this fixed size type at
+        offset, all remaining ones by default, into a NumPy structured
+        array viewing data. Values are as on the wire, see numpy_dtype().
+        Requires NumPy."""
+        if self._dtype is None:
+            self._dtype = numpy_dtype(self)
+        return np.frombuffer(data, self._dtype, count, offset)
+
+    def unpack_view(self, data, offset=0, ntc=False):
+        """Zero copy unpack. Returns a VPPLazyRecord referring to data,
+        fields are only decoded when they are accessed. Pass a
+        memoryview to avoid copying slices of the buffer."""
+        if self._lazy_class is None:
+            self._lazy_class = self._make_lazy_class()
+        return self._lazy_class(data, offset, ntc)
+
+    def _lazy_getter(self, i):
+        p = self.packers[i]
+        field_offset = self._offsets[i]
+        if field_offset is None:
+            def get(record):
+                return record._materialize()[i]
+            return get
+
+        view = isinstance(p, VPPType) and \
+            p.name not in vpp_format.conversion_unpacker_table
+
+        def get(record):
+            if record._tuple is not None:
+                return record._tuple[i]
+            offset = record._offset + field_offset
+            if view:
+                return p.unpack_view(record._data, offset, record._ntc)
+            x, _ = p.unpack(record._data, offset, None, record._ntc)
+            if type(x) is tuple and len(x) == 1:
+                x = x[0]
+            return x
+        return get
+
+    def _make_lazy_class(self):
+        attrs = {'__slots__': (), '_type': self}
+        for i, f in enumerate(self.tuple._fields):
+            attrs[f] = property(self._lazy_getter(i))
+        return type(self.name, (VPPLazyRecord,), attrs)
+
+    def unpack_compact(self, data, offset=0):
+        """Unpack into a VPPCompactRecord, a single tuple holding the
+        fields of all nested fixed size types. Returns the record and
+        its size. Types are always converted."""
+        cls = self._get_compact_class()
+        if self._struct is not None:
+            values = self._struct.unpack_from(data, offset)
+            return cls(self._compact_decode(self._compact_ops, values)), \
+                self.size
+        out = []
+        total = 0
+        for (st, i, p), ops in zip(self._runs, self._compact_runs):
+            if st is None:
+                x, size = self._compact_field(p, data, offset, out)
+                if type(x) is tuple and len(x) == 1:
+                    x = x[0]
+                out.append(x)
+            else:
+                self._compact_decode(ops, st.unpack_from(data, offset), out)
+                size = st.size
+            offset += size
+            total += size
+        return cls(out), total
+
+    @staticmethod
+    def _compact_decode(ops, values, out=None):
+        """Decode struct values into record slots, see _compile_compact"""
+        if out is None:
+            out = []
+        for p, j, k in ops:
+            if p is None:
+                out.extend(values[j:j + k])
+            else:
+                out.append(p._flat_unpack(values, j)[0])
+        return out
+
+    def _compact_field(self, p, data, offset, out):
+        """Unpack a variable length field for unpack_compact. out holds
+        the record slots decoded so far."""
+        if isinstance(p, VLAList):
+            length = out[self._compact_index[p.index]]
+            if not _compactable(p.packer):
+                return p.unpack(data, offset, {p.index: length})
+        elif isinstance(p, VLAList_legacy) and _compactable(p.packer):
+            if (len(data) - offset) % p.packer.size:
+                raise VPPSerializerValueError(
+                    'Legacy Variable Length Array length mismatch.')
+            length = (len(data) - offset) // p.packer.size
+        elif _compactable(p):
+            return p.unpack_compact(data, offset)
+        else:
+            return p.unpack(data, offset)
+        q = p.packer
+        if q._struct is not None:
+            cls = q._get_compact_class()
+            size = q._struct.size * length
+            if len(data) - offset < size:
+                raise VPPSerializerValueError(
+                    'Invalid array length for "{}" got {} expected {}'
+                    .format(p.name, len(data) - offset, size))
+            view = memoryview(data)[offset:offset + size]
+            return [cls(q._compact_decode(q._compact_ops, values))
+                    for values in q._struct.iter_unpack(view)], size
+        r = []
+        total = 0
+        for _ in range(length):
+            x, size = q.unpack_compact(data, offset + total)
+            r.append(x)
+            total += size
+        return r, total
+
+    def _compile_compact(self, packers, j=0):
+        """Operations decoding the struct values of fixed size packers,
+        starting at value j, into record slots. (None, j, k) copies k
+        values as they are, (p, j, 1) stores p._flat_unpack() of the
+        values at j. Returns the operations and the next value index."""
+        ops = []
+        for p in packers:
+            nested = _compact_nested(p)
+            if nested is not None:
+                for _ in range(p.num if nested is not p else 1):
+                    o, j = nested._compile_compact(nested.packers, j)
+                    ops.extend(o)
+                continue
+            if _is_plain(p):
+                if ops and ops[-1][0] is None and \
+                        ops[-1][1] + ops[-1][2] == j:
+                    ops[-1] = (None, ops[-1][1], ops[-1][2] + 1)
+                else:
+                    ops.append((None, j, 1))
+            else:
+                ops.append((p, j, 1))
+            j += _leaf_count(p)
+        return ops, j
+
+    def _compact_getter(self, p, j):
+        """Getter of the field p stored from record slot j on"""
+        nested = _compact_nested(p)
+        if nested is None:
+            return operator.itemgetter(j)
+        cls = nested._get_compact_class()
+        n = nested._compact_slots
+        if nested is p:
+            return lambda record: cls(record[j:j + n])
+        return lambda record: [cls(record[k:k + n])
+                               for k in range(j, j + n * p.num, n)]
+
+    def _get_compact_class(self):
+        if self._compact_class is None:
+            self._compact_class = self._make_compact_class()
+        return self._compact_class
+
+    def _make_compact_class(self):
+        self._compact_runs = [None if st is None else
+                              self._compile_compact(p)[0]
+                              for st, i, p in self._runs]
+        if self._struct is not None:
+            self._compact_ops = self._compile_compact(self.packers)[0]
+        self._compact_index = []
+        attrs = {'__slots__': (), '_type': self}
+        j = 0
+        for f, p in zip(self.tuple._fields, self.packers):
+            self._compact_index.append(j)
+            attrs[f] = property(self._compact_getter(p, j))
+            nested = _compact_nested(p)
+            if nested is None:
+                j += 1
+            else:
+                nested._get_compact_class()
+                j += nested._compact_slots * (1 if nested is p else p.num)
+        self._compact_slots = j
+        return type(self.name, (VPPCompactRecord,), attrs)
+
     def __repr__(self):
         return "%s(name=%s, msgdef=%s)" % (
             self.__class__.__name__, self.name, self.msgdef
@@ -657,3 +1444,48 @@ class VPPType(Packer):
 
 class VPPMessage(VPPType):
     pass
+
+
+class VPPLazyMessage(VPPMessage):
+    """A VPPMessage built on first use.
+
+    Only the name and CRC are known up front. The packers and the
+    record class are built when the message is first packed, unpacked
+    or otherwise used, the object then turns into a plain VPPMessage.
+    """
+    def __init__(self, name, msgdef):
+        self.name = name
+        self.msgdef = msgdef
+        for f in msgdef:
+            if type(f) is dict and 'crc' in f:
+                self.crc = f['crc']
+        types[name] = self
+
+    def _build(self):
+        with _build_lock:
+            # Built by another thread while waiting for the lock
+            if type(self) is VPPLazyMessage:
+                VPPType.__init__(self, self.name, self.msgdef)
+                self.__class__ = VPPMessage
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        self._build()
+        return getattr(self, name)
+
+    def pack(self, data, kwargs=None):
+        self._build()
+        return self.pack(data, kwargs)
+
+    def unpack(self, data, offset=0, result=None, ntc=False):
+        self._build()
+        return self.unpack(data, offset, result, ntc)
+
+    def unpack_view(self, data, offset=0, ntc=False):
+        self._build()
+        return self.unpack_view(data, offset, ntc)
+
+    def unpack_compact(self, data, offset=0):
+        self._build()
+        return self.unpack_compact(data, offset)
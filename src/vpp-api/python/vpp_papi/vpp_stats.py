@@ -39,16 +39,35 @@ stat['/if/rx'][:, 1].sum_packets() - returns the sum of packet counters for
                                      interface 1 on all threads
 stat['/if/rx-miss'][:, 1].sum() - returns the sum of packet counters for
                                   interface 1 on all threads for simple counters
+
+If NumPy is available, counters can also be read as arrays, see
+get_array() and get_views(), or with VPPStats(use_numpy=True) from
+stat[...] directly.
+stat.get_array('/if/rx-miss') - returns a threads x indices array
+stat.get_array('/if/rx-miss').sum(axis=0) - returns the sum of packet
+                                            counters for each interface
+stat.get_array('/if/rx')['packets'] - combined counters have the
+                                      structured dtype COMBINED_DTYPE
+                                      with packets and octets fields
 '''
 
 import os
 import socket
 import array
+import asyncio
+import bisect
+import fnmatch
+import itertools
 import mmap
 from struct import Struct
+import threading
 import time
 import unittest
 import re
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 def recv_fd(sock):
     '''Get file descriptor for memory map'''
@@ -72,6 +91,44 @@ def get_string(stats, ptr):
         raise IOError('String overruns stats segment')
     return stats.statseg[namevector:namevector+namevectorlen-1].decode('ascii')
 
+REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+
+def regex_prefix(pattern):
+    '''Return (prefix, literal), the literal prefix of every name the
+    regular expression matches at its start, and if the expression is
+    that prefix only'''
+    if '|' in pattern:
+        return '', False
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    for i, c in enumerate(pattern):
+        if c in REGEX_SPECIAL:
+            if c in '*?{':
+                # The preceding character is optional
+                i = max(i - 1, 0)
+            return pattern[:i], False
+    return pattern, True
+
+def glob_prefix(pattern):
+    '''Return (prefix, literal), the literal prefix of a shell style
+    wildcard and if it has no wildcards'''
+    for i, c in enumerate(pattern):
+        if c in '*?[':
+            return pattern[:i], False
+    return pattern, True
+
+if np is not None:
+    COMBINED_DTYPE = np.dtype([('packets', np.uint64), ('octets', np.uint64)])
+    COMBINED_RATE_DTYPE = np.dtype([('packets', np.float64),
+                                    ('octets', np.float64)])
+
+def stack_vectors(vectors, dtype):
+    '''Copy per thread vectors into a threads x indices array'''
+    width = max((len(v) for v in vectors), default=0)
+    array = np.zeros((len(vectors), width), dtype)
+    for i, vector in enumerate(vectors):
+        array[i, :len(vector)] = vector
+    return array
 
 class StatsVector:
     '''A class representing a VPP vector'''
@@ -93,6 +150,19 @@ class StatsVector:
             return self.struct.iter_unpack(self.statseg[self.vec_start:self.vec_start +
                                                         self.elementsize*self.vec_len])
 
+    def raw(self):
+        '''Copy of the vector data'''
+        with self.stats.lock:
+            return self.statseg[self.vec_start:self.vec_start +
+                                self.elementsize * self.vec_len]
+
+    def array(self, dtype):
+        '''Zero copy NumPy view of the vector in the stats segment'''
+        dtype = np.dtype(dtype)
+        if self.vec_start + self.vec_len * dtype.itemsize >= self.stats.size:
+            raise IOError('Vector overruns stats segment')
+        return np.frombuffer(self.statseg, dtype, self.vec_len, self.vec_start)
+
     def __getitem__(self, index):
         if index > self.vec_len:
             raise IOError('Index beyond end of vector')
@@ -109,15 +179,25 @@ class VPPStats():
     shared_headerfmt = Struct('QPQQPP')
     default_socketname = '/run/vpp/stats.sock'
 
-    def __init__(self, socketname=default_socketname, timeout=10):
+    def __init__(self, socketname=default_socketname, timeout=10,
+                 use_numpy=False):
+        if use_numpy and np is None:
+            raise ImportError('use_numpy requires NumPy')
         self.socketname = socketname
         self.timeout = timeout
+        self.use_numpy = use_numpy
         self.directory = {}
+        self.directory_by_idx = {}
+        self.directory_raw = b''
+        self.names = []
+        self.names_directory = None
         self.lock = StatsLock(self)
         self.connected = False
         self.size = 0
         self.last_epoch = 0
         self.error_vectors = 0
+        self.error_names = {}
+        self.error_names_epoch = None
         self.statseg = 0
 
     def connect(self):
@@ -181,18 +261,19 @@ class VPPStats():
     elementfmt = 'IQ128s'
 
     def refresh(self, blocking=True):
-        '''Refresh directory vector cache (epoch changed)'''
-        directory = {}
-        directory_by_idx = {}
+        '''Refresh directory vector cache (epoch changed).
+        Only directory entries that differ from the previous refresh are
+        decoded again, the rest of the directory is kept.'''
         while True:
             try:
                 with self.lock:
                     self.last_epoch = self.epoch
-                    for i, direntry in enumerate(StatsVector(self, self.directory_vector, self.elementfmt)):
-                        path_raw = direntry[2].find(b'\x00')
-                        path = direntry[2][:path_raw].decode('ascii')
-                        directory[path] = StatsEntry(direntry[0], direntry[1])
-                        directory_by_idx[i] = path
+                    vector = StatsVector(self, self.directory_vector,
+                                         self.elementfmt)
+                    raw = vector.raw()
+                    directory, directory_by_idx = self._update_directory(
+                        vector, raw)
+                    self.directory_raw = raw
                     self.directory = directory
                     self.directory_by_idx = directory_by_idx
 
@@ -205,6 +286,38 @@ class VPPStats():
                 if not blocking:
                     raise
 
+    def _update_directory(self, vector, raw):
+        '''Return new directory dictionaries for the raw directory vector'''
+        old = self.directory_raw
+        size = vector.elementsize
+        directory = self.directory.copy()
+        directory_by_idx = self.directory_by_idx.copy()
+        # Compare blocks of entries first, most of the directory is
+        # unchanged between epochs.
+        block = size * 64
+        changed = []
+        for start in range(0, min(len(raw), len(old)), block):
+            if raw[start:start + block] == old[start:start + block]:
+                continue
+            end = min(start + block, len(raw), len(old))
+            changed.extend(i // size for i in range(start, end, size)
+                           if raw[i:i + size] != old[i:i + size])
+        # Drop entries that changed or are gone, before adding new ones,
+        # as a counter may have moved to another index.
+        for i in changed + list(range(len(raw) // size, len(old) // size)):
+            directory.pop(directory_by_idx.pop(i), None)
+        changed.extend(range(len(old) // size, len(raw) // size))
+        for i in changed:
+            stattype, value, name = vector.struct.unpack_from(raw, i * size)
+            end = (i + 1) * size
+            if old[end - len(name):end] == name:
+                path = self.directory_by_idx[i]
+            else:
+                path = name[:name.find(b'\x00')].decode('ascii')
+            directory[path] = StatsEntry(stattype, value)
+            directory_by_idx[i] = path
+        return directory, directory_by_idx
+
     def __getitem__(self, item, blocking=True):
         if not self.connected:
             self.connect()
@@ -213,11 +326,44 @@ class VPPStats():
                 if self.last_epoch != self.epoch:
                     self.refresh(blocking)
                 with self.lock:
+                    if self.use_numpy:
+                        return self.directory[item].get_array(self)
                     return self.directory[item].get_counter(self)
             except IOError:
                 if not blocking:
                     raise
 
+    def get_array(self, name, blocking=True):
+        '''Return a counter as a NumPy array, regardless of use_numpy.
+        Simple counters are a threads x indices array of uint64, combined
+        counters the same with COMBINED_DTYPE and error counters an array
+        of the per thread values. The values are copied out of the stats
+        segment while holding the lock.'''
+        if not self.connected:
+            self.connect()
+        while True:
+            try:
+                if self.last_epoch != self.epoch:
+                    self.refresh(blocking)
+                with self.lock:
+                    return self.directory[name].get_array(self)
+            except IOError:
+                if not blocking:
+                    raise
+
+    def get_views(self, name):
+        '''Return a simple or combined counter as a list of per thread
+        NumPy arrays which are views of the stats segment. Nothing is
+        copied and the views follow the counters as VPP updates them,
+        without any locking. They are only valid until the epoch changes,
+        and have to be deleted before disconnect().'''
+        if not self.connected:
+            self.connect()
+        if self.last_epoch != self.epoch:
+            self.refresh()
+        with self.lock:
+            return self.directory[name].get_views(self)
+
     def __iter__(self):
         return iter(self.directory.items())
 
@@ -225,26 +371,51 @@ class VPPStats():
         '''Return dictionary of error counters > 0'''
         if not self.connected:
             self.connect()
-
-        errors = {k:v for k, v in self.directory.items() if k.startswith("/err/")}
-        result = {}
         while True:
             try:
                 if self.last_epoch != self.epoch:
                     self.refresh(blocking)
                 with self.lock:
-                    for k, entry in errors.items():
-                        total = 0
-                        i = entry.value
-                        for per_thread in self.error_vectors:
-                            total += per_thread[i]
-                        if total:
-                            result[k] = total
-                    return result
+                    totals = self._error_totals()
+                    names = self._error_names()
+                    if np is not None:
+                        nonzero = np.flatnonzero(totals).tolist()
+                        totals = totals.tolist()
+                    else:
+                        nonzero = [i for i, total in enumerate(totals)
+                                   if total]
+                    return {names[i]: totals[i] for i in nonzero
+                            if i in names}
             except IOError:
                 if not blocking:
                     raise
 
+    def _error_totals(self):
+        '''Sum of the error counters of all threads, by error index.
+        Each thread's error vector is copied in one go and summed as a
+        NumPy array, or element wise with map() without NumPy.'''
+        if np is not None:
+            width = max((v.vec_len for v in self.error_vectors), default=0)
+            totals = np.zeros(width, np.uint64)
+            for vector in self.error_vectors:
+                totals[:vector.vec_len] += vector.array(np.uint64)
+            return totals
+        rows = []
+        for vector in self.error_vectors:
+            row = array.array('Q')
+            row.frombytes(vector.raw())
+            rows.append(row)
+        return list(map(sum, itertools.zip_longest(*rows, fillvalue=0)))
+
+    def _error_names(self):
+        '''Error index to /err/ counter name, cached per epoch'''
+        if self.error_names_epoch != self.last_epoch:
+            self.error_names = {entry.value: k
+                                for k, entry in self.directory.items()
+                                if entry.type == 4 and k.startswith('/err/')}
+            self.error_names_epoch = self.last_epoch
+        return self.error_names
+
     def set_errors_str(self, blocking=True):
         '''Return all errors counters > 0 pretty printed'''
         error_string = ['ERRORS:']
@@ -272,52 +443,346 @@ class VPPStats():
                     if not blocking:
                         raise
 
-    def ls(self, patterns):
-        '''Returns list of counters matching pattern'''
+    def _names(self):
+        '''Sorted directory names, rebuilt when the directory changed'''
+        if self.names_directory is not self.directory:
+            self.names = sorted(self.directory)
+            self.names_directory = self.directory
+        return self.names
+
+    def ls(self, patterns, glob=False):
+        '''Returns sorted list of counters matching pattern.
+        The names are sorted, not in directory order, and a name matched
+        by several patterns is listed once.
+        Patterns are regular expressions matched at the start of the
+        counter name, or shell style wildcards matched against all of it
+        if glob is set. Only the names starting with the literal prefix
+        of a pattern are looked at, found by bisecting the sorted names,
+        patterns without wildcards are not matched at all.'''
         # pylint: disable=invalid-name
         if not self.connected:
             self.connect()
         if not isinstance(patterns, list):
             patterns = [patterns]
-        regex = [re.compile(i) for i in patterns]
-        return [k for k, v in self.directory.items()
-                if any(re.match(pattern, k) for pattern in regex)]
+        names = self._names()
+        result = set()
+        for pattern in patterns:
+            if glob:
+                prefix, literal = glob_prefix(pattern)
+                if literal:
+                    if pattern in self.directory:
+                        result.add(pattern)
+                    continue
+                regex = re.compile(fnmatch.translate(pattern))
+            elif isinstance(pattern, str):
+                prefix, literal = regex_prefix(pattern)
+                regex = None if literal else re.compile(pattern)
+            else:
+                prefix, literal = '', False
+                regex = pattern
+            start = bisect.bisect_left(names, prefix)
+            end = len(names)
+            if prefix:
+                end = bisect.bisect_left(names, prefix[:-1] +
+                                         chr(ord(prefix[-1]) + 1), start)
+            if literal:
+                result.update(names[start:end])
+            else:
+                result.update(filter(regex.match, names[start:end]))
+        return sorted(result)
 
     def dump(self, counters, blocking=True):
         '''Given a list of counters return a dictionary of results'''
+        return self.snapshot(counters, blocking)
+
+    def snapshot(self, counters, blocking=True, use_numpy=None):
+        '''Read a list of counters as one consistent StatsSnapshot.
+        All counters are read under a single optimistic lock, if the
+        stats segment changed while reading, they are all read again.
+        Counters are read as arrays if use_numpy is set, by default if
+        this VPPStats was created with use_numpy.'''
+        if not self.connected:
+            self.connect()
+        if use_numpy is None:
+            use_numpy = self.use_numpy
+        while True:
+            try:
+                if self.last_epoch != self.epoch:
+                    self.refresh(blocking)
+                with self.lock:
+                    snapshot = StatsSnapshot(time.time(), self.lock.epoch)
+                    for cnt in counters:
+                        entry = self.directory[cnt]
+                        if use_numpy:
+                            snapshot[cnt] = entry.get_array(self)
+                        else:
+                            snapshot[cnt] = entry.get_counter(self)
+                    return snapshot
+            except IOError:
+                if not blocking:
+                    raise
+
+    def _wait_epoch(self, timeout, min_delay, max_delay):
+        '''Yield the delays to wait until the epoch changed, then the
+        new epoch, or None at timeout'''
         if not self.connected:
             self.connect()
-        result = {}
-        for cnt in counters:
-            result[cnt] = self.__getitem__(cnt,blocking)
+        epoch = self.last_epoch
+        deadline = None if timeout is None else time.monotonic() + timeout
+        backoff = Backoff(min_delay, max_delay)
+        while self.epoch == epoch:
+            delay = backoff.next()
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    yield None, 0
+                    return
+            yield None, delay
+        self.refresh()
+        yield self.last_epoch, 0
+
+    def wait_epoch(self, timeout=None, min_delay=0.001, max_delay=0.1):
+        '''Wait for the directory to change, polling the epoch with a
+        delay growing from min_delay to max_delay. Returns the new epoch,
+        or None at timeout.'''
+        for epoch, delay in self._wait_epoch(timeout, min_delay, max_delay):
+            if delay:
+                time.sleep(delay)
+        return epoch
+
+    async def async_wait_epoch(self, timeout=None, min_delay=0.001,
+                               max_delay=0.1):
+        '''wait_epoch() sleeping in asyncio'''
+        for epoch, delay in self._wait_epoch(timeout, min_delay, max_delay):
+            if delay:
+                await asyncio.sleep(delay)
+        return epoch
+
+    def _watch(self, counters, timeout, min_delay, max_delay):
+        '''Yield (snapshot, 0) when counters changed or (None, delay)
+        for the delay to wait before reading them again'''
+        previous = self.snapshot(counters)
+        backoff = Backoff(min_delay, max_delay)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = backoff.next()
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return
+            yield None, delay
+            snapshot = self.snapshot(counters)
+            if any(not counter_equal(value, previous.get(name))
+                   for name, value in snapshot.items()):
+                yield snapshot, 0
+                previous = snapshot
+                backoff.reset()
+                if timeout is not None:
+                    deadline = time.monotonic() + timeout
+
+    def watch(self, counters, timeout=None, min_delay=0.001, max_delay=0.1):
+        '''Generator yielding a StatsSnapshot of counters every time any
+        of them changed. The counters are read with a delay growing from
+        min_delay to max_delay while they do not change. Stops after
+        timeout seconds without change.'''
+        for snapshot, delay in self._watch(counters, timeout, min_delay,
+                                           max_delay):
+            if snapshot is None:
+                time.sleep(delay)
+            else:
+                yield snapshot
+
+    async def async_watch(self, counters, timeout=None, min_delay=0.001,
+                          max_delay=0.1):
+        '''watch() as asynchronous generator, sleeping in asyncio'''
+        for snapshot, delay in self._watch(counters, timeout, min_delay,
+                                           max_delay):
+            if snapshot is None:
+                await asyncio.sleep(delay)
+            else:
+                yield snapshot
+
+def counter_equal(a, b):
+    '''Compare counter values, lists or NumPy arrays'''
+    if np is not None and isinstance(a, np.ndarray):
+        return isinstance(b, np.ndarray) and np.array_equal(a, b)
+    return a == b
+
+class StatsSnapshot(dict):
+    '''Counter name to value dictionary read at a single point in time'''
+
+    def __init__(self, timestamp, epoch):
+        super().__init__()
+        self.timestamp = timestamp
+        self.monotonic = time.monotonic()
+        self.epoch = epoch
+
+def align_array(array, shape):
+    '''Return array cut or zero padded to shape'''
+    if array.shape == shape:
+        return array
+    aligned = np.zeros(shape, array.dtype)
+    common = tuple(slice(0, min(a, b)) for a, b in zip(shape, array.shape))
+    aligned[common] = array[common]
+    return aligned
+
+def counter_delta(current, previous):
+    '''Element wise current - previous of uint64 counters. A counter
+    that went down was reset (or its index reused), its delta is the
+    current value.'''
+    return np.where(current >= previous, current - previous, current)
+
+class StatsDelta():
+    '''Change of a counter between two polls, delta has the shape and
+    dtype of the counter array, rate is delta per second as float64.'''
+
+    def __init__(self, delta, rate):
+        self.delta = delta
+        self.rate = rate
+
+    def __repr__(self):
+        return 'StatsDelta(delta={!r}, rate={!r})'.format(self.delta,
+                                                          self.rate)
+
+class StatsPoller():
+    '''Poll the counters matching patterns and compute what changed.
+    Every poll() reads a snapshot of the counters as arrays and compares
+    it with the previous one, all threads and indices at once. Returns a
+    StatsSnapshot of StatsDelta for the counters that changed, with the
+    interval since the previous poll in seconds.
+
+    Counters that went down, because they were cleared or their index
+    was freed and reused after an epoch change, count from zero.
+    Counters that are new since the previous poll are compared with
+    zero, vectors that grew are compared with zeros for new indices.
+    Scalar and name entries are not counters and are left out.'''
+
+    def __init__(self, stats, patterns):
+        if np is None:
+            raise ImportError('StatsPoller requires NumPy')
+        self.stats = stats
+        self.patterns = patterns
+        self.previous = None
+        self.counters = None
+        self.epoch = None
+
+    def _counters(self):
+        '''Counter names, looked up again when the directory changed'''
+        if self.counters is None or self.epoch != self.stats.last_epoch:
+            self.epoch = self.stats.last_epoch
+            self.counters = [k for k in self.stats.ls(self.patterns)
+                             if self.stats.directory[k].type in (2, 3, 4, 7)]
+        return self.counters
+
+    def poll(self, blocking=True):
+        '''Return the counters that changed since the previous poll'''
+        stats = self.stats
+        if not stats.connected:
+            stats.connect()
+        while True:
+            try:
+                if stats.last_epoch != stats.epoch:
+                    stats.refresh(blocking)
+                snapshot = stats.snapshot(self._counters(), blocking,
+                                          use_numpy=True)
+                break
+            except KeyError:
+                # Directory changed between ls() and snapshot()
+                self.counters = None
+        previous = self.previous
+        self.previous = snapshot
+        result = StatsSnapshot(snapshot.timestamp, snapshot.epoch)
+        result.interval = None
+        if previous is None:
+            return result
+        result.interval = snapshot.monotonic - previous.monotonic
+        for name, current in snapshot.items():
+            last = previous.get(name)
+            if last is None:
+                last = np.zeros_like(current)
+            else:
+                last = align_array(last, current.shape)
+            if current.dtype.names:
+                delta = np.empty_like(current)
+                rate = np.empty(current.shape, COMBINED_RATE_DTYPE)
+                for field in current.dtype.names:
+                    delta[field] = counter_delta(current[field], last[field])
+                    rate[field] = delta[field] / result.interval
+                changed = any(delta[field].any()
+                              for field in current.dtype.names)
+            else:
+                delta = counter_delta(current, last)
+                rate = delta / result.interval
+                changed = delta.any()
+            if changed:
+                result[name] = StatsDelta(delta, rate)
         return result
 
+class Backoff():
+    '''Delays doubling from min_delay up to max_delay'''
+
+    def __init__(self, min_delay=0.001, max_delay=0.1):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+
+    def next(self):
+        '''Return the delay to wait next'''
+        delay = self.delay
+        self.delay = min(delay * 2, self.max_delay)
+        return delay
+
+    def reset(self):
+        '''Start from min_delay again'''
+        self.delay = self.min_delay
+
 class StatsLock():
-    '''Stat segment optimistic locking'''
+    '''Stat segment optimistic locking.
+    Nested with blocks are covered by the outermost acquire and release,
+    so that a read made of many steps is validated once. The nesting
+    depth and the epoch are kept per thread.'''
 
     def __init__(self, stats):
         self.stats = stats
-        self.epoch = 0
+        self.local = threading.local()
+
+    @property
+    def epoch(self):
+        '''Epoch recorded by the last acquire of this thread'''
+        return getattr(self.local, 'epoch', 0)
+
+    @property
+    def depth(self):
+        '''Nesting depth of with blocks in this thread'''
+        return getattr(self.local, 'depth', 0)
 
     def __enter__(self):
-        acquired = self.acquire(blocking=True)
-        assert acquired, "Lock wasn't acquired, but blocking=True"
+        depth = self.depth
+        if depth == 0:
+            acquired = self.acquire(blocking=True)
+            assert acquired, "Lock wasn't acquired, but blocking=True"
+        self.local.depth = depth + 1
         return self
 
     def __exit__(self, exc_type=None, exc_value=None, traceback=None):
-        self.release()
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            self.release()
 
     def acquire(self, blocking=True, timeout=-1):
-        '''Acquire the lock. Await in progress to go false. Record epoch.'''
-        self.epoch = self.stats.epoch
+        '''Acquire the lock. Await in progress to go false. Record epoch.
+        Waits with backoff, returns False if in progress and not blocking
+        or at timeout.'''
         if timeout > 0:
-            start = time.monotonic()
+            deadline = time.monotonic() + timeout
+        backoff = Backoff(0.00001, 0.01)
         while self.stats.in_progress:
             if not blocking:
-                time.sleep(0.01)
-                if timeout > 0:
-                    if start + time.monotonic() > timeout:
-                        return False
+                return False
+            if timeout > 0 and time.monotonic() >= deadline:
+                return False
+            time.sleep(backoff.next())
+        self.local.epoch = self.stats.epoch
         return True
 
     def release(self):
@@ -397,18 +862,26 @@ class StatsEntry():
         self.type = stattype
         self.value = statvalue
 
+        self.array_function = None
+        self.views_function = None
         if stattype == 1:
             self.function = self.scalar
         elif stattype == 2:
             self.function = self.simple
+            self.array_function = self.simple_array
+            self.views_function = self.simple_views
         elif stattype == 3:
             self.function = self.combined
+            self.array_function = self.combined_array
+            self.views_function = self.combined_views
         elif stattype == 4:
             self.function = self.error
+            self.array_function = self.error_array
         elif stattype == 5:
             self.function = self.name
         elif stattype == 7:
             self.function = self.symlink
+            self.array_function = self.symlink_array
         else:
             self.function = self.illegal
 
@@ -436,6 +909,28 @@ class StatsEntry():
             counter.append(clist)
         return counter
 
+    def simple_views(self, stats):
+        '''Simple counter, per thread views'''
+        return [StatsVector(stats, threads[0], 'Q').array(np.uint64)
+                for threads in StatsVector(stats, self.value, 'P')]
+
+    def simple_array(self, stats):
+        '''Simple counter as threads x indices array'''
+        return stack_vectors(self.simple_views(stats), np.uint64)
+
+    def combined_views(self, stats):
+        '''Combined counter, per thread views'''
+        return [StatsVector(stats, threads[0], 'QQ').array(COMBINED_DTYPE)
+                for threads in StatsVector(stats, self.value, 'P')]
+
+    def combined_array(self, stats):
+        '''Combined counter as threads x indices array'''
+        return stack_vectors(self.combined_views(stats), COMBINED_DTYPE)
+
+    def error_array(self, stats):
+        '''Error counter as array of per thread values'''
+        return np.array(self.error(stats), np.uint64)
+
     def error(self, stats):
         '''Error counter'''
         counter = SimpleList()
@@ -460,11 +955,34 @@ class StatsEntry():
         name = stats.directory_by_idx[index1]
         return stats[name][:,index2]
 
+    def symlink_array(self, stats):
+        '''Symlink counter as array of per thread values'''
+        b = self.SYMLINK_FMT2.pack(self.value)
+        index1, index2 = self.SYMLINK_FMT1.unpack(b)
+        name = stats.directory_by_idx[index1]
+        return stats.get_array(name)[:, index2]
+
     def get_counter(self, stats):
         '''Return a list of counters'''
         if stats:
             return self.function(stats)
 
+    def get_array(self, stats):
+        '''Return counters as NumPy array, other types as get_counter()'''
+        if np is None:
+            raise ImportError('NumPy is not available')
+        if self.array_function is None:
+            return self.get_counter(stats)
+        return self.array_function(stats)
+
+    def get_views(self, stats):
+        '''Return list of per thread views of a counter vector'''
+        if np is None:
+            raise ImportError('NumPy is not available')
+        if self.views_function is None:
+            raise ValueError('Not a simple or combined counter')
+        return self.views_function(stats)
+
 class TestStats(unittest.TestCase):
     '''Basic statseg tests'''
 
@@ -544,6 +1062,31 @@ class TestStats(unittest.TestCase):
         data = self.stat.dump(directory)
         print(data)
 
+    def test_watch(self):
+        '''Waiting for changes'''
+        self.assertIsNone(self.stat.wait_epoch(timeout=0.01))
+        for snapshot in self.stat.watch(['/if/rx', '/sys/vector_rate'],
+                                        timeout=0.5):
+            print('changed', snapshot)
+        snapshots = asyncio.run(self.async_watch())
+        print('changed', snapshots)
+
+    async def async_watch(self):
+        '''Collect changes with async_watch()'''
+        return [snapshot async for snapshot in
+                self.stat.async_watch(['/if/rx'], timeout=0.1)]
+
+    def test_ls(self):
+        '''Prefix, regular expression and glob lookups'''
+        interfaces = self.stat.ls('/if/')
+        self.assertEqual(interfaces, sorted(interfaces))
+        self.assertIn('/if/rx', interfaces)
+        self.assertEqual(self.stat.ls('^/if/.*x$'),
+                         [k for k in interfaces if k.endswith('x')])
+        self.assertEqual(self.stat.ls('/if/*', glob=True), interfaces)
+        self.assertEqual(self.stat.ls('/if/rx', glob=True), ['/if/rx'])
+        self.assertEqual(self.stat.ls('/foobar*', glob=True), [])
+
     def test_sys_nodes(self):
         '''Test /sys/nodes'''
         counters = self.stat.ls('^/sys/node')
@@ -551,6 +1094,52 @@ class TestStats(unittest.TestCase):
         print('/sys/node', self.stat.dump(counters))
         print('/net/route/to', self.stat['/net/route/to'])
 
+    @unittest.skipIf(np is None, 'NumPy not available')
+    def test_numpy(self):
+        '''NumPy arrays'''
+        rx = self.stat.get_array('/if/rx')
+        self.assertEqual(rx.dtype, COMBINED_DTYPE)
+        self.assertEqual(rx['packets'][:, 1].sum(),
+                         self.stat['/if/rx'][:, 1].sum_packets())
+        rx_miss = self.stat.get_array('/if/rx-miss')
+        self.assertEqual(rx_miss.tolist(), self.stat['/if/rx-miss'])
+        print('/if/rx-miss per interface', rx_miss.sum(axis=0))
+        views = self.stat.get_views('/if/rx')
+        self.assertEqual(len(views), len(rx))
+        print('/if/rx thread #0 view', views[0])
+        del views
+        print('/err/ethernet-input',
+              self.stat.get_array('/err/ethernet-input/no error'))
+
+    def test_snapshot(self):
+        '''Consistent snapshot of many counters'''
+        counters = self.stat.ls(['^/if', '^/err/ip4-input'])
+        snapshot = self.stat.snapshot(counters)
+        self.assertEqual(sorted(snapshot), sorted(counters))
+        self.assertGreater(snapshot.timestamp, 0)
+        print('snapshot at', snapshot.timestamp, 'epoch', snapshot.epoch)
+        with self.assertRaises(KeyError):
+            self.stat.snapshot(['/if/rx', 'foobar'])
+
+    def test_poller(self):
+        '''Counter deltas and rates'''
+        poller = StatsPoller(self.stat, ['^/if', '^/err/'])
+        self.assertEqual(len(poller.poll()), 0)
+        time.sleep(0.1)
+        deltas = poller.poll()
+        self.assertGreater(deltas.interval, 0)
+        for name, change in deltas.items():
+            print(name, change.delta, change.rate)
+            self.assertEqual(change.delta.shape,
+                             self.stat.get_array(name).shape)
+
+    def test_set_errors(self):
+        '''Error counter totals'''
+        errors = self.stat.set_errors()
+        for name, total in errors.items():
+            self.assertGreater(total, 0)
+            self.assertEqual(total, self.stat.get_err_counter(name))
+
     def test_symlink(self):
         '''Symbolic links'''
         print('/interface/local0/rx', self.stat['/interfaces/local0/rx'])
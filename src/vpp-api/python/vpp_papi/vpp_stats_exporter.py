@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+Prometheus exporter for the VPP statistics segment.
+
+Serves the counters matching a list of patterns on /metrics, in the
+Prometheus text format, with the same metric names and labels as
+vpp_prometheus_export. Scrapes are answered from a snapshot of the
+counters which is read again once it is older than max_age seconds.
+
+The counters to export and their metric names are looked up once per
+directory epoch, label strings are formatted once per counter index.
+The cost of reading and rendering is exported as well:
+vpp_stats_exporter_scrape_duration_seconds
+vpp_stats_exporter_scrapes_total
+
+python3 -m vpp_papi.vpp_stats_exporter [-s socket] [-p port] patterns...
+'''
+
+import argparse
+import http.server
+import operator
+import re
+import threading
+import time
+
+from . import vpp_stats
+from .vpp_stats import VPPStats
+
+SERVER_PORT = 9482
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAT_TYPE_SCALAR = 1
+STAT_TYPE_SIMPLE = 2
+STAT_TYPE_COMBINED = 3
+STAT_TYPE_ERROR = 4
+
+
+def metric_name(path):
+    '''Prometheus metric name of a stats segment path'''
+    return re.sub('[^0-9a-zA-Z]', '_', path)
+
+
+class StatsMetric():
+    '''A counter to export, with its preformatted label strings'''
+
+    def __init__(self, path, stattype):
+        self.path = path
+        self.type = stattype
+        self.name = metric_name(path)
+        if stattype == STAT_TYPE_COMBINED:
+            self.header = ['# TYPE {}_packets counter'.format(self.name),
+                           '# TYPE {}_bytes counter'.format(self.name)]
+        elif stattype == STAT_TYPE_SCALAR:
+            self.header = ['# TYPE {} gauge'.format(self.name)]
+        else:
+            self.header = ['# TYPE {} counter'.format(self.name)]
+        # Per thread lists of 'name{labels} ' for each index
+        self.labels = {}
+
+    def _labels(self, name, thread, width):
+        '''Label strings for indices 0..width of thread'''
+        key = (name, thread)
+        labels = self.labels.get(key)
+        if labels is None:
+            labels = self.labels[key] = []
+        for i in range(len(labels), width):
+            labels.append('{}{{thread="{}",interface="{}"}} '.format(
+                name, thread, i))
+        return labels
+
+    def _render_rows(self, name, rows, lines):
+        '''Append the lines of a threads x indices list of values'''
+        for thread, row in enumerate(rows):
+            lines.extend(map(operator.add,
+                             self._labels(name, thread, len(row)),
+                             map(str, row)))
+
+    def render(self, value, lines):
+        '''Append the exposition lines of value, a counter as returned
+        by VPPStats, either as lists or as NumPy arrays'''
+        lines.extend(self.header)
+        is_array = hasattr(value, 'tolist')
+        if self.type == STAT_TYPE_COMBINED:
+            if is_array:
+                packets = value['packets'].tolist()
+                octets = value['octets'].tolist()
+            else:
+                packets = [list(map(operator.itemgetter('packets'), row))
+                           for row in value]
+                octets = [list(map(operator.itemgetter('bytes'), row))
+                          for row in value]
+            self._render_rows(self.name + '_packets', packets, lines)
+            self._render_rows(self.name + '_bytes', octets, lines)
+            return
+        if is_array:
+            value = value.tolist()
+        if self.type == STAT_TYPE_SIMPLE:
+            self._render_rows(self.name, value, lines)
+        elif self.type == STAT_TYPE_ERROR:
+            labels = self.labels.get('error')
+            if labels is None or len(labels) < len(value):
+                labels = self.labels['error'] = [
+                    '{}{{thread="{}"}} '.format(self.name, thread)
+                    for thread in range(len(value))]
+            lines.extend(map(operator.add, labels, map(str, value)))
+        else:
+            lines.append('{} {:.2f}'.format(self.name, value))
+
+
+class StatsExporter():
+    '''Render the counters matching patterns in the Prometheus text
+    format, from a snapshot that is at most max_age seconds old.'''
+
+    exported_types = (STAT_TYPE_SCALAR, STAT_TYPE_SIMPLE,
+                      STAT_TYPE_COMBINED, STAT_TYPE_ERROR)
+
+    def __init__(self, stats, patterns, max_age=1.0):
+        self.stats = stats
+        self.patterns = patterns
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.epoch = None
+        self.metrics = {}
+        self.output = None
+        self.timestamp = 0
+        self.scrapes = 0
+        self.duration = 0.0
+
+    def _update_metrics(self):
+        '''Look up the counters to export, once per directory epoch'''
+        stats = self.stats
+        if stats.last_epoch != stats.epoch:
+            stats.refresh()
+        if self.epoch == stats.last_epoch:
+            return
+        metrics = {}
+        for path in stats.ls(self.patterns):
+            stattype = stats.directory[path].type
+            if stattype not in self.exported_types:
+                continue
+            metric = self.metrics.get(path)
+            if metric is None or metric.type != stattype:
+                metric = StatsMetric(path, stattype)
+            metrics[path] = metric
+        self.metrics = metrics
+        self.epoch = stats.last_epoch
+
+    def scrape(self):
+        '''Read the counters and render them'''
+        start = time.perf_counter()
+        if not self.stats.connected:
+            self.stats.connect()
+        while True:
+            self._update_metrics()
+            try:
+                snapshot = self.stats.snapshot(
+                    list(self.metrics), use_numpy=vpp_stats.np is not None)
+                break
+            except KeyError:
+                # Directory changed since the metrics were looked up
+                self.epoch = None
+        lines = []
+        for path, value in snapshot.items():
+            self.metrics[path].render(value, lines)
+        self.scrapes += 1
+        self.duration = time.perf_counter() - start
+        lines.append('# TYPE vpp_stats_exporter_scrape_duration_seconds '
+                     'gauge')
+        lines.append('vpp_stats_exporter_scrape_duration_seconds {:.6f}'
+                     .format(self.duration))
+        lines.append('# TYPE vpp_stats_exporter_scrapes_total counter')
+        lines.append('vpp_stats_exporter_scrapes_total {}'
+                     .format(self.scrapes))
+        lines.append('')
+        self.output = '\n'.join(lines).encode('ascii')
+        self.timestamp = time.monotonic()
+        return self.output
+
+    def render(self):
+        '''Return the metrics, scraping again if the cached ones are
+        older than max_age'''
+        with self.lock:
+            if (self.output is None or
+                    time.monotonic() - self.timestamp >= self.max_age):
+                return self.scrape()
+            return self.output
+
+
+class StatsExporterHandler(http.server.BaseHTTPRequestHandler):
+    '''Serves exporter.render() on /metrics'''
+    exporter = None
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.exporter.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+
+def serve(exporter, address=('', SERVER_PORT)):
+    '''Serve exporter over HTTP until interrupted'''
+    handler = type('Handler', (StatsExporterHandler,),
+                   {'exporter': exporter})
+    server = http.server.ThreadingHTTPServer(address, handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    '''Command line entry point'''
+    parser = argparse.ArgumentParser(
+        description='Prometheus exporter for VPP statistics.')
+    parser.add_argument('-s', '--socket-name',
+                        default=VPPStats.default_socketname,
+                        help='stats segment socket')
+    parser.add_argument('-a', '--address', default='',
+                        help='address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=SERVER_PORT,
+                        help='port to listen on')
+    parser.add_argument('-m', '--max-age', type=float, default=1.0,
+                        help='seconds a scrape is served from cache')
+    parser.add_argument('patterns', nargs='*', default=['^/'],
+                        help='regular expressions of the counters to export')
+    args = parser.parse_args()
+
+    stats = VPPStats(args.socket_name)
+    stats.connect()
+    try:
+        serve(StatsExporter(stats, args.patterns, args.max_age),
+              (args.address, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats.disconnect()
+
+
+if __name__ == '__main__':
+    main()
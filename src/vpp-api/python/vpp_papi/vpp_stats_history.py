@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+History of VPP statistics counters in a memory mapped ring file.
+
+StatsRecorder appends snapshots of the counters matching a list of
+patterns to a file of fixed size, overwriting the oldest ones once the
+file is full. StatsHistory reads them back as arrays indexed by time.
+
+The file starts with a header and the JSON encoded layouts of the
+recorded snapshots, the names, kinds and shapes of their counters.
+It is followed by a ring of fixed size slots, each holding a snapshot:
+a slot header (sequence number, time, epoch, layout hash, data length)
+and the raw counter arrays, uint64 for counters and float64 for
+scalars, little endian. Layouts are keyed by a hash of the directory,
+so a snapshot only costs its counter data unless the set of counters
+changed. When a snapshot outgrows the slots, the ring is rewritten
+with larger slots, keeping the most recent snapshots that still fit.
+When the layouts outgrow the header, the least recently used ones are
+dropped, with the snapshots recorded with them.
+
+Requires NumPy.
+
+python3 -m vpp_papi.vpp_stats_history -o history.ring [-i 1.0] patterns...
+'''
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+from struct import Struct
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import vpp_stats
+from .vpp_stats import VPPStats
+
+logger = logging.getLogger('vpp_papi.stats_history')
+logger.addHandler(logging.NullHandler())
+
+MAGIC = b'VPPSTATH'
+VERSION = 1
+FILE_HEADER = Struct('<8sIIIIQI')
+SLOT_HEADER = Struct('<QdQ8sI')
+LAYOUT_OFFSET = 64
+PAGE_SIZE = mmap.PAGESIZE
+
+# Directory entry types recorded, names and symlinks are not
+RECORDED_TYPES = (1, 2, 3, 4)
+
+
+def layout_hash(layout):
+    '''Directory hash identifying a layout'''
+    return hashlib.blake2b(json.dumps(layout).encode(),
+                           digest_size=8).digest()
+
+
+def counter_kind(array):
+    '''Kind of a counter array as stored in a layout'''
+    if array.dtype.names:
+        return 'combined'
+    if array.dtype.kind == 'f':
+        return 'f8'
+    return 'u8'
+
+
+def counter_dtype(kind):
+    '''NumPy dtype of a layout kind'''
+    if kind == 'combined':
+        return vpp_stats.COMBINED_DTYPE.newbyteorder('<')
+    return np.dtype('<' + kind)
+
+
+def slot_size_for(data_size):
+    '''Default slot size, twice a snapshot of data_size bytes'''
+    slot_size = 2 * (SLOT_HEADER.size + data_size)
+    return -(-slot_size // PAGE_SIZE) * PAGE_SIZE
+
+
+class StatsRingFile():
+    '''The ring file, shared by StatsRecorder and StatsHistory'''
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        flags = os.O_RDWR if writable else os.O_RDONLY
+        fd = os.open(path, flags)
+        try:
+            size = os.fstat(fd).st_size
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self.mmap = mmap.mmap(fd, size, access=access)
+        finally:
+            os.close(fd)
+        (magic, version, self.header_size, self.slot_size, self.nslots,
+         self.head, layouts_len) = FILE_HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != VERSION:
+            self.mmap.close()
+            raise ValueError('{} is not a stats history file'.format(path))
+        self.current = None
+        self.layouts = {}
+        if layouts_len:
+            raw = self.mmap[LAYOUT_OFFSET:LAYOUT_OFFSET + layouts_len]
+            self.layouts = {bytes.fromhex(k): v
+                            for k, v in json.loads(raw).items()}
+
+    @classmethod
+    def create(cls, path, size, slot_size, header_size):
+        '''Create an empty ring file'''
+        nslots = (size - header_size) // slot_size
+        if nslots < 1:
+            raise ValueError('File size too small for a single snapshot')
+        with open(path, 'wb') as f:
+            f.truncate(header_size + nslots * slot_size)
+            f.write(FILE_HEADER.pack(MAGIC, VERSION, header_size, slot_size,
+                                     nslots, 0, 0))
+        return cls(path, writable=True)
+
+    def close(self):
+        '''Unmap the file'''
+        self.mmap.close()
+
+    def slot_offset(self, seq):
+        '''File offset of the slot of sequence number seq'''
+        return self.header_size + (seq % self.nslots) * self.slot_size
+
+    def write_layouts(self):
+        '''Write the layouts, keeping only those still in the ring. The
+        least recently used are dropped if they do not fit the header,
+        and with them the snapshots recorded with them.'''
+        if len(self.layouts) > 1:
+            used = {self.read_slot_header(seq)[3]
+                    for seq in self.sequence_numbers()}
+            self.layouts = {k: v for k, v in self.layouts.items()
+                            if k in used or k == self.current}
+        while True:
+            raw = json.dumps({k.hex(): v
+                              for k, v in self.layouts.items()}).encode()
+            if LAYOUT_OFFSET + len(raw) <= self.header_size:
+                break
+            old = [k for k in self.layouts if k != self.current]
+            if not old:
+                raise ValueError('Counter layout does not fit the file '
+                                 'header, use a larger header_size')
+            del self.layouts[old[0]]
+            logger.info('%s: layouts do not fit the header, dropped the '
+                        'snapshots of the oldest', self.path)
+        self.mmap[LAYOUT_OFFSET:LAYOUT_OFFSET + len(raw)] = raw
+        self.write_header(layouts_len=len(raw))
+
+    def write_header(self, layouts_len=None):
+        '''Update the next sequence number and layouts length'''
+        if layouts_len is None:
+            layouts_len = FILE_HEADER.unpack_from(self.mmap)[6]
+        FILE_HEADER.pack_into(self.mmap, 0, MAGIC, VERSION, self.header_size,
+                              self.slot_size, self.nslots, self.head,
+                              layouts_len)
+
+    def read_slot_header(self, seq):
+        '''Slot header of sequence number seq'''
+        return SLOT_HEADER.unpack_from(self.mmap, self.slot_offset(seq))
+
+    def copy_slots(self, other):
+        '''Copy the most recent valid snapshots of other that fit'''
+        self.head = other.head
+        self.layouts = dict(other.layouts)
+        self.current = other.current
+        for seq in self.sequence_numbers():
+            if seq < other.head - other.nslots:
+                continue
+            header = other.read_slot_header(seq)
+            if header[0] != seq + 1:
+                continue
+            src = other.slot_offset(seq)
+            end = src + SLOT_HEADER.size + header[4]
+            dst = self.slot_offset(seq)
+            self.mmap[dst:dst + end - src] = other.mmap[src:end]
+        self.write_layouts()
+
+    def sequence_numbers(self):
+        '''Sequence numbers of the snapshots in the ring, oldest first'''
+        return range(max(0, self.head - self.nslots), self.head)
+
+
+class StatsRecorder():
+    '''Record snapshots of the counters matching patterns to a ring file.
+
+    The file is created with the given size, or appended to if it
+    already is a stats history file. Slots are slot_size bytes, by
+    default twice the size of the first snapshot. A snapshot larger
+    than the slots has the ring rewritten with slots twice its size,
+    or is skipped if the file cannot hold a single one.'''
+
+    def __init__(self, stats, patterns, path, size=64 << 20,
+                 interval=1.0, slot_size=None, header_size=1 << 20):
+        if np is None:
+            raise ImportError('StatsRecorder requires NumPy')
+        self.stats = stats
+        self.patterns = patterns
+        self.path = path
+        self.size = size
+        self.interval = interval
+        self.slot_size = slot_size
+        self.header_size = header_size
+        self.ring = None
+        self.counters = None
+        self.epoch = None
+
+    def _counters(self):
+        '''Counter names, looked up again when the directory changed'''
+        if self.counters is None or self.epoch != self.stats.last_epoch:
+            self.epoch = self.stats.last_epoch
+            self.counters = [k for k in self.stats.ls(self.patterns)
+                             if self.stats.directory[k].type in
+                             RECORDED_TYPES]
+        return self.counters
+
+    def _open(self, data_size):
+        '''Open the ring file, creating it on the first snapshot'''
+        try:
+            self.ring = StatsRingFile(self.path, writable=True)
+        except FileNotFoundError:
+            slot_size = self.slot_size
+            if slot_size is None:
+                slot_size = slot_size_for(data_size)
+            self.ring = StatsRingFile.create(self.path, self.size,
+                                             slot_size, self.header_size)
+
+    def _grow(self, data_size):
+        '''Rewrite the ring file with slots for data_size bytes'''
+        old = self.ring
+        tmp = self.path + '.tmp'
+        ring = None
+        try:
+            ring = StatsRingFile.create(tmp, len(old.mmap),
+                                        slot_size_for(data_size),
+                                        old.header_size)
+            ring.copy_slots(old)
+            ring.mmap.flush()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        finally:
+            if ring is not None:
+                ring.close()
+        os.replace(tmp, self.path)
+        old.close()
+        self.ring = StatsRingFile(self.path, writable=True)
+        self.ring.current = old.current
+        logger.info('%s: slots grown to %d bytes, keeping %d snapshots',
+                    self.path, self.ring.slot_size, self.ring.nslots)
+
+    def record(self):
+        '''Append a snapshot of the counters, return its sequence number,
+        or None if it was skipped'''
+        stats = self.stats
+        if not stats.connected:
+            stats.connect()
+        while True:
+            try:
+                if stats.last_epoch != stats.epoch:
+                    stats.refresh()
+                snapshot = stats.snapshot(self._counters(), use_numpy=True)
+                break
+            except KeyError:
+                # Directory changed between ls() and snapshot()
+                self.counters = None
+        layout = []
+        data = []
+        for name, value in snapshot.items():
+            if hasattr(value, 'dtype'):
+                value = np.ascontiguousarray(
+                    value, value.dtype.newbyteorder('<'))
+            else:
+                value = np.array(value, '<f8')
+            layout.append([name, counter_kind(value), list(value.shape)])
+            data.append(value.tobytes())
+        data = b''.join(data)
+
+        if self.ring is None:
+            self._open(len(data))
+        ring = self.ring
+        if SLOT_HEADER.size + len(data) > ring.slot_size:
+            try:
+                self._grow(len(data))
+            except ValueError:
+                logger.warning('%s: snapshot of %d bytes does not fit, '
+                               'skipped', self.path, len(data))
+                return None
+            ring = self.ring
+        dirhash = layout_hash(layout)
+        if ring.current != dirhash:
+            ring.current = dirhash
+            # Most recently used last, for write_layouts() to drop the
+            # least recently used ones first
+            ring.layouts[dirhash] = ring.layouts.pop(dirhash, layout)
+            try:
+                ring.write_layouts()
+            except ValueError:
+                del ring.layouts[dirhash]
+                ring.current = None
+                logger.warning('%s: layout of %d counters does not fit '
+                               'the header, skipped', self.path, len(layout))
+                return None
+
+        seq = ring.head
+        offset = ring.slot_offset(seq)
+        # Invalidate the slot while it is written
+        SLOT_HEADER.pack_into(ring.mmap, offset, 0, 0, 0, bytes(8), 0)
+        start = offset + SLOT_HEADER.size
+        ring.mmap[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(ring.mmap, offset, seq + 1, snapshot.timestamp,
+                              snapshot.epoch, dirhash, len(data))
+        ring.head = seq + 1
+        ring.write_header()
+        return seq
+
+    def run(self, count=None):
+        '''Record a snapshot every interval seconds, count times or
+        until interrupted'''
+        deadline = time.monotonic()
+        while count is None or count > 0:
+            self.record()
+            if count is not None:
+                count -= 1
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+    def close(self):
+        '''Flush and close the ring file'''
+        if self.ring is not None:
+            self.ring.mmap.flush()
+            self.ring.close()
+            self.ring = None
+
+
+class StatsHistory():
+    '''Read the snapshots of a ring file written by StatsRecorder, as
+    they are when it is opened'''
+
+    def __init__(self, path):
+        if np is None:
+            raise ImportError('StatsHistory requires NumPy')
+        self.ring = StatsRingFile(path)
+
+    def close(self):
+        '''Unmap the file'''
+        self.ring.close()
+
+    def _slots(self):
+        '''Yield (sequence number, timestamp, layout, offset of the
+        data) oldest first'''
+        ring = self.ring
+        for seq in ring.sequence_numbers():
+            valid, timestamp, _, dirhash, _ = ring.read_slot_header(seq)
+            if valid != seq + 1 or dirhash not in ring.layouts:
+                continue
+            yield (seq, timestamp, ring.layouts[dirhash],
+                   ring.slot_offset(seq) + SLOT_HEADER.size)
+
+    def counters(self):
+        '''Names of the counters recorded in any snapshot'''
+        names = {}
+        for layout in self.ring.layouts.values():
+            names.update((name, None) for name, _, _ in layout)
+        return list(names)
+
+    def timestamps(self):
+        '''Array of the snapshot times'''
+        return np.array([slot[1] for slot in self._slots()])
+
+    def get(self, name):
+        '''Return (timestamps, values) of a counter, values is an array
+        of the counter in each snapshot that has it, vectors that
+        changed size are zero padded to the largest one'''
+        timestamps = []
+        values = []
+        for seq, timestamp, layout, offset in self._slots():
+            for counter, kind, shape in layout:
+                dtype = counter_dtype(kind)
+                count = int(np.prod(shape))
+                if counter == name:
+                    value = np.frombuffer(self.ring.mmap, dtype, count,
+                                          offset).reshape(shape).copy()
+                    # Skip the slot if a recorder overwrote it meanwhile
+                    if self.ring.read_slot_header(seq)[0] == seq + 1:
+                        timestamps.append(timestamp)
+                        values.append(value)
+                    break
+                offset += count * dtype.itemsize
+        if not values:
+            raise KeyError(name)
+        shape = tuple(max(sizes) for sizes in
+                      zip(*(value.shape for value in values)))
+        array = np.stack([vpp_stats.align_array(value, shape)
+                          for value in values])
+        return np.array(timestamps), array
+
+
+def main():
+    '''Command line entry point'''
+    parser = argparse.ArgumentParser(
+        description='Record VPP statistics to a ring file.')
+    parser.add_argument('-s', '--socket-name',
+                        default=VPPStats.default_socketname,
+                        help='stats segment socket')
+    parser.add_argument('-o', '--output', required=True,
+                        help='ring file')
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        help='seconds between snapshots')
+    parser.add_argument('--size', type=int, default=64 << 20,
+                        help='ring file size in bytes')
+    parser.add_argument('patterns', nargs='*', default=['^/'],
+                        help='regular expressions of the counters to record')
+    args = parser.parse_args()
+
+    stats = VPPStats(args.socket_name)
+    stats.connect()
+    recorder = StatsRecorder(stats, args.patterns, args.output,
+                             size=args.size, interval=args.interval)
+    try:
+        recorder.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        stats.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# VPP Unix Domain Socket Transport for asyncio.
+#
+import asyncio
+import logging
+import socket
+import struct
+
+from .vpp_transport_socket import VppTransportSocketIOError
+
+logger = logging.getLogger('vpp_papi.transport')
+logger.addHandler(logging.NullHandler())
+
+
+class VppAsyncTransport:
+    """Socket transport running on an asyncio event loop.
+
+    There is no reader thread and no queue. A reader task reads complete
+    messages off the socket and hands each one to the parent's
+    msg_received(), which may return an awaitable to apply back pressure.
+    """
+    VppTransportSocketIOError = VppTransportSocketIOError
+
+    def __init__(self, parent, read_timeout, server_address,
+                 multiprocess=False):
+        self.read_timeout = read_timeout if read_timeout > 0 else None
+        self.parent = parent
+        self.server_address = server_address
+        self.header = struct.Struct('>QII')
+        self.message_table = {}
+        # The following fields are set in connect().
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.socket_index = None
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.loop.is_closed()
+
+    async def connect(self, name, pfx, msg_handler, rx_qlen):
+        if self.writer is not None:
+            raise VppTransportSocketIOError(
+                1, "PAPI socket transport connect: Need to disconnect first.")
+
+        self.loop = asyncio.get_running_loop()
+        self.reader, self.writer = await asyncio.open_unix_connection(
+            self.server_address)
+
+        # Initialise sockclnt_create
+        sockclnt_create = self.parent.messages['sockclnt_create']
+        sockclnt_create_reply = self.parent.messages['sockclnt_create_reply']
+
+        args = {'_vl_msg_id': 15,
+                'name': name,
+                'context': 124}
+        b = sockclnt_create.pack(args)
+        self.write(b)
+        try:
+            msg = await asyncio.wait_for(self._read(), self.read_timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            await self._close()
+            raise VppTransportSocketIOError(1, 'Invalid reply message')
+        if struct.unpack_from('>H', msg)[0] != 16:
+            await self._close()
+            raise VppTransportSocketIOError(1, 'Invalid reply message')
+
+        r, length = sockclnt_create_reply.unpack(msg)
+        self.socket_index = r.index
+        for m in r.message_table:
+            n = m.name
+            self.message_table[n] = m.index
+
+        self.reader_task = self.loop.create_task(self._read_loop())
+        return 0
+
+    async def disconnect(self):
+        rv = 0
+        try:
+            # Might fail, if VPP closes socket before packet makes it out,
+            # or if there was a failure during connect().
+            rv = await self.parent.api.sockclnt_delete(
+                index=self.socket_index)
+        except (IOError, self.parent.VPPApiError):
+            pass
+        await self._close()
+        # Wipe message table, VPP can be restarted with different plugins.
+        self.message_table = {}
+        return rv
+
+    async def _close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+        self.reader_task = None
+        self.reader = None
+        self.writer = None
+
+    def close(self):
+        """Close the socket without the event loop running.
+
+        Used at exit, where disconnect() cannot be awaited. VPP cleans
+        up the client when it sees the socket closed.
+        """
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            sock = self.writer.get_extra_info('socket')
+            self.writer.close()
+            if sock is not None:
+                # The transport only closes it on the next loop iteration
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.reader_task = None
+        self.reader = None
+        self.writer = None
+        self.message_table = {}
+
+    def get_msg_index(self, name):
+        try:
+            return self.message_table[name]
+        except KeyError:
+            return 0
+
+    def msg_table_max_index(self):
+        return len(self.message_table)
+
+    def write(self, buf):
+        """Queue a binary-packed message for sending to VPP.
+        Use drain() to wait for the write buffer to empty."""
+        if self.writer is None:
+            raise VppTransportSocketIOError(1, 'Not connected')
+        self.writer.write(self.header.pack(0, len(buf), 0) + buf)
+
+    def write_many(self, bufs):
+        """Queue a list of binary-packed messages for sending to VPP."""
+        if self.writer is None:
+            raise VppTransportSocketIOError(1, 'Not connected')
+        parts = []
+        for buf in bufs:
+            parts.append(self.header.pack(0, len(buf), 0))
+            parts.append(buf)
+        self.writer.write(b''.join(parts))
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except (OSError, ConnectionError) as err:
+            raise VppTransportSocketIOError(
+                1, 'Write error: {err!r}'.format(err=err))
+
+    async def _read(self):
+        """Read single complete message."""
+        hdr = await self.reader.readexactly(16)
+        (_, hdrlen, _) = self.header.unpack(hdr)
+        return await self.reader.readexactly(hdrlen)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                msg = await self._read()
+                waiter = self.parent.msg_received(msg)
+                if waiter is not None:
+                    await waiter
+        except (asyncio.IncompleteReadError, OSError, ConnectionError) as err:
+            logger.debug('socket read failed: {!r}'.format(err))
+            self.parent.connection_lost(
+                VppTransportSocketIOError(1, 'Connection lost'))
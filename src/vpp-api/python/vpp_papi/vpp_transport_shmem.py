@@ -0,0 +1,205 @@
+#
+# Copyright (c) 2021 Cisco and/or its affiliates.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# VPP shared memory transport.
+#
+import ctypes
+import ctypes.util
+import logging
+import math
+
+logger = logging.getLogger('vpp_papi.transport')
+logger.addHandler(logging.NullHandler())
+
+# Return value of vac_read() when no message arrived within the timeout.
+VAC_TIMEOUT = -5
+
+vac_callback_t = ctypes.CFUNCTYPE(None, ctypes.POINTER(ctypes.c_char),
+                                  ctypes.c_int)
+vac_error_callback_t = ctypes.CFUNCTYPE(None, ctypes.c_void_p,
+                                        ctypes.POINTER(ctypes.c_char),
+                                        ctypes.c_int)
+
+vpp_api = None
+
+
+class VppTransportShmemIOError(IOError):
+    pass
+
+
+def load_library(name='vppapiclient'):
+    """Load libvppapiclient and declare the functions used, once."""
+    global vpp_api
+    if vpp_api is not None:
+        return vpp_api
+    path = ctypes.util.find_library(name) or 'lib{}.so'.format(name)
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError as err:
+        raise VppTransportShmemIOError(
+            1, 'Cannot load {}: {}'.format(path, err))
+
+    c_char_pp = ctypes.POINTER(ctypes.POINTER(ctypes.c_char))
+    lib.vac_connect.argtypes = [ctypes.c_char_p, ctypes.c_char_p,
+                                vac_callback_t, ctypes.c_int]
+    lib.vac_disconnect.argtypes = []
+    lib.vac_read.argtypes = [c_char_pp, ctypes.POINTER(ctypes.c_int),
+                             ctypes.c_ushort]
+    lib.vac_write.argtypes = [ctypes.c_char_p, ctypes.c_int]
+    lib.vac_free.argtypes = [ctypes.c_void_p]
+    lib.vac_free.restype = None
+    lib.vac_get_msg_index.argtypes = [ctypes.c_char_p]
+    lib.vac_msg_table_max_index.argtypes = []
+    lib.vac_rx_suspend.argtypes = []
+    lib.vac_rx_suspend.restype = None
+    lib.vac_rx_resume.argtypes = []
+    lib.vac_rx_resume.restype = None
+    lib.vac_set_error_handler.argtypes = [vac_error_callback_t]
+    lib.vac_set_error_handler.restype = None
+    lib.vac_mem_init.argtypes = [ctypes.c_size_t]
+    lib.vac_mem_init.restype = None
+    vpp_api = lib
+    return lib
+
+
+@vac_error_callback_t
+def vac_error_handler(arg, msg, msg_len):
+    logger.warning("VPP API client:: %s",
+                   ctypes.string_at(msg, msg_len).decode(errors='replace'))
+
+
+class VppTransport:
+    """Shared memory transport, through libvppapiclient.
+
+    Messages are exchanged with VPP over the svm queues of the API
+    segment. Writing a message enqueues it on VPP's input queue, and
+    replies are dequeued from the client's own queue, so there is no
+    system call per message unless a side has to be woken up.
+
+    With a msg_handler, libvppapiclient runs a thread handing messages
+    to it. The thread is suspended while replies are read by read().
+    """
+    VppTransportShmemIOError = VppTransportShmemIOError
+
+    def __init__(self, parent, read_timeout, server_address,
+                 multiprocess=False):
+        self.connected = False
+        self.read_timeout = read_timeout
+        self.parent = parent
+        self.server_address = server_address
+        self.socket_index = 0
+        self.lib = load_library()
+        self.lib.vac_mem_init(0)
+        self.lib.vac_set_error_handler(vac_error_handler)
+        # The ctypes callback must outlive the connection.
+        self.msg_handler = None
+        self.callbacks = {
+            False: vac_callback_t(self._callback_sync),
+            True: vac_callback_t(self._callback_async),
+        }
+
+    def _callback_sync(self, data, length):
+        self.parent.msg_handler_sync(ctypes.string_at(data, length))
+
+    def _callback_async(self, data, length):
+        self.parent.msg_handler_async(ctypes.string_at(data, length))
+
+    def connect(self, name, pfx, msg_handler, rx_qlen):
+        self.msg_handler = msg_handler
+        if msg_handler is None:
+            msg_handler = vac_callback_t()
+        rv = self.lib.vac_connect(name.encode('ascii'), pfx, msg_handler,
+                                  rx_qlen)
+        self.connected = rv == 0
+        return rv
+
+    def disconnect(self):
+        rv = self.lib.vac_disconnect()
+        self.connected = False
+        self.msg_handler = None
+        return rv
+
+    def suspend(self):
+        self.lib.vac_rx_suspend()
+
+    def resume(self):
+        self.lib.vac_rx_resume()
+
+    def cork(self):
+        """Messages are enqueued as written, there is nothing to gather."""
+
+    def uncork(self):
+        pass
+
+    def flow_control(self, limit):
+        """Replies are bounded by the rx_qlen given to connect()."""
+        return 0
+
+    def get_callback(self, do_async):
+        return self.callbacks[bool(do_async)]
+
+    def get_msg_index(self, name):
+        if isinstance(name, str):
+            name = name.encode('ascii')
+        return self.lib.vac_get_msg_index(name)
+
+    def msg_table_max_index(self):
+        return self.lib.vac_msg_table_max_index()
+
+    @property
+    def message_table(self):
+        """Message ids of the messages known to the client, by name_crc.
+        libvppapiclient only looks up single names."""
+        table = {}
+        for name, msg in self.parent.messages.items():
+            name_crc = name + '_' + msg.crc[2:]
+            i = self.get_msg_index(name_crc)
+            if i > 0:
+                table[name_crc] = i
+        return table
+
+    def write(self, buf):
+        """Send a binary-packed message to VPP."""
+        if not self.connected:
+            raise VppTransportShmemIOError(1, 'Not connected')
+        if not isinstance(buf, bytes):
+            buf = bytes(buf)
+        rv = self.lib.vac_write(buf, len(buf))
+        if rv:
+            raise VppTransportShmemIOError(rv, 'vac_write failed')
+
+    def write_many(self, bufs):
+        """Send a list of binary-packed messages to VPP."""
+        for buf in bufs:
+            self.write(buf)
+
+    def read(self, timeout=None):
+        if not self.connected:
+            raise VppTransportShmemIOError(1, 'Not connected')
+        if timeout is None:
+            timeout = self.read_timeout
+        # vac_read() waits whole seconds, and forever for 0.
+        seconds = min(max(1, math.ceil(timeout)), 0xffff) if timeout else 0
+        data = ctypes.POINTER(ctypes.c_char)()
+        size = ctypes.c_int()
+        rv = self.lib.vac_read(ctypes.byref(data), ctypes.byref(size),
+                               seconds)
+        if rv == VAC_TIMEOUT:
+            return None
+        if rv:
+            raise VppTransportShmemIOError(
+                rv, 'vac_read failed.  It is likely that VPP died.')
+        msg = ctypes.string_at(data, size.value)
+        self.lib.vac_free(data)
+        return msg
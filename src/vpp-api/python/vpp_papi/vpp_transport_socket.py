@@ -1,6 +1,7 @@
 #
 # VPP Unix Domain Socket Transport.
 #
+import os
 import socket
 import struct
 import threading
@@ -12,6 +13,12 @@ import logging
 logger = logging.getLogger('vpp_papi.transport')
 logger.addHandler(logging.NullHandler())
 
+# Buffers passed to a single sendmsg() call.
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
 
 class VppTransportSocketIOError(IOError):
     # TODO: Document different values of error number (first numeric argument).
@@ -19,30 +26,61 @@ class VppTransportSocketIOError(IOError):
 
 
 class VppTransport:
+    """Unix domain socket transport.
+
+    A reader thread hands received replies to read() through a queue.
+    Unless multiprocess is set, that is a queue.SimpleQueue, passing
+    the message buffers on within the process. With multiprocess set
+    a multiprocessing.Queue is used, for replies to be read from other
+    processes, at the cost of pickling every message through a pipe.
+
+    Each message is sent with its header in one sendmsg() call. While
+    corked, written messages are gathered and sent together, by
+    uncork(), by read() or once IOV_MAX buffers are pending.
+    """
     VppTransportSocketIOError = VppTransportSocketIOError
 
-    def __init__(self, parent, read_timeout, server_address):
+    def __init__(self, parent, read_timeout, server_address,
+                 multiprocess=False):
         self.connected = False
         self.read_timeout = read_timeout if read_timeout > 0 else None
         self.parent = parent
         self.server_address = server_address
+        self.multiprocess = multiprocess
         self.header = struct.Struct('>QII')
         self.message_table = {}
-        # These queues can be accessed async.
-        # They are always up, but replaced on connect.
-        # TODO: Use multiprocessing.Pipe instead of multiprocessing.Queue
-        # if possible.
-        self.sque = multiprocessing.Queue()
-        self.q = multiprocessing.Queue()
+        # This queue can be accessed async.
+        # It is always up, but replaced on connect.
+        self.q = self._new_queue()
         # The following fields are set in connect().
         self.message_thread = None
         self.socket = None
+        # Written to, to stop the message thread.
+        self.wakeup = None
+        # While rx_limit is set, the message thread waits for rx_space
+        # before queueing more than rx_limit replies, for at most
+        # rx_wait seconds. Past that, it queues replies again until
+        # read() catches up, for a slow reader not to hold back events
+        # and the replies to other calls for long.
+        self.rx_limit = 0
+        self.rx_wait = 0.5
+        self.rx_overrun = False
+        self.rx_space = threading.Event()
+        self.rx_space.set()
+        # Headers and messages gathered while corked.
+        self.corked = False
+        self.pending = []
+
+    def _new_queue(self):
+        if self.multiprocess:
+            return multiprocessing.Queue()
+        return queue.SimpleQueue()
 
     def msg_thread_func(self):
         while True:
             try:
                 rlist, _, _ = select.select([self.socket,
-                                             self.sque._reader], [], [])
+                                             self.wakeup[0]], [], [])
             except socket.error:
                 # Terminate thread
                 logging.error('select failed')
@@ -50,7 +88,7 @@ class VppTransport:
                 return
 
             for r in rlist:
-                if r == self.sque._reader:
+                if r == self.wakeup[0]:
                     # Terminate
                     self.q.put(None)
                     return
@@ -67,6 +105,8 @@ class VppTransport:
                     # Put either to local queue or if context == 0
                     # callback queue
                     if self.parent.has_context(msg):
+                        if self.rx_limit:
+                            self._wait_rx_space()
                         self.q.put(msg)
                     else:
                         self.parent.msg_handler_async(msg)
@@ -74,6 +114,36 @@ class VppTransport:
                     raise VppTransportSocketIOError(
                         2, 'Unknown response from select')
 
+    def _wait_rx_space(self):
+        if self.q.qsize() < self.rx_limit:
+            self.rx_overrun = False
+            return
+        if self.rx_overrun or not self.connected:
+            return
+        self.rx_space.clear()
+        # Re-check, read() may have taken a message before the clear.
+        if self.q.qsize() >= self.rx_limit:
+            if not self.rx_space.wait(self.rx_wait):
+                logger.debug('Reply queue over limit for %ss, reading on',
+                             self.rx_wait)
+                self.rx_overrun = True
+
+    def flow_control(self, limit):
+        """Bound the number of replies queued for read() to limit.
+
+        While the limit is reached, the socket is not read and VPP is
+        held back by the socket buffers, for at most rx_wait seconds.
+        A limit of 0 turns flow control off again. It is not supported
+        with multiprocess. Returns the previous limit, for nested users
+        to restore it.
+        """
+        previous = self.rx_limit
+        if self.multiprocess:
+            return previous
+        self.rx_limit = limit
+        self.rx_space.set()
+        return previous
+
     def connect(self, name, pfx, msg_handler, rx_qlen):
         # TODO: Reorder the actions and add "roll-backs",
         # to restore clean disconnect state when failure happens durng connect.
@@ -95,15 +165,14 @@ class VppTransport:
 
         self.connected = True
 
-        # Queues' feeder threads from previous connect may still be sending.
-        # Close and join to avoid any errors.
-        self.sque.close()
-        self.q.close()
-        self.sque.join_thread()
-        self.q.join_thread()
+        if self.multiprocess:
+            # Queue's feeder thread from previous connect may still be
+            # sending. Close and join to avoid any errors.
+            self.q.close()
+            self.q.join_thread()
         # Finally safe to replace.
-        self.sque = multiprocessing.Queue()
-        self.q = multiprocessing.Queue()
+        self.q = self._new_queue()
+        self.wakeup = socket.socketpair()
         self.message_thread = threading.Thread(target=self.msg_thread_func)
 
         # Initialise sockclnt_create
@@ -116,8 +185,7 @@ class VppTransport:
         b = sockclnt_create.pack(args)
         self.write(b)
         msg = self._read()
-        hdr, length = self.parent.header.unpack(msg, 0)
-        if hdr.msgid != 16:
+        if struct.unpack_from('>H', msg)[0] != 16:
             # TODO: Add first numeric argument.
             raise VppTransportSocketIOError('Invalid reply message')
 
@@ -145,18 +213,28 @@ class VppTransport:
         except (IOError, self.parent.VPPApiError):
             pass
         self.connected = False
-        if self.socket is not None:
-            self.socket.close()
-        if self.sque is not None:
-            self.sque.put(True)  # Terminate listening thread
+        if self.wakeup is not None:
+            self.wakeup[1].send(b'\0')  # Terminate listening thread
+        # Release the listening thread, it no longer waits once
+        # disconnected. The limit stays with whoever set it.
+        self.rx_space.set()
         if self.message_thread is not None and self.message_thread.is_alive():
             # Allow additional connect() calls.
             self.message_thread.join()
+        # Closed once the listening thread is done selecting on them.
+        if self.socket is not None:
+            self.socket.close()
+        if self.wakeup is not None:
+            for s in self.wakeup:
+                s.close()
+        self.corked = False
+        self.pending = []
         # Wipe message table, VPP can be restarted with different plugins.
         self.message_table = {}
         # Collect garbage.
         self.message_thread = None
         self.socket = None
+        self.wakeup = None
         # Queues will be collected after connect replaces them.
         return rv
 
@@ -181,19 +259,70 @@ class VppTransport:
     def msg_table_max_index(self):
         return len(self.message_table)
 
+    def _sendmsg(self, parts):
+        """Send a list of buffers, IOV_MAX at a time per sendmsg()."""
+        i = 0
+        try:
+            while i < len(parts):
+                sent = self.socket.sendmsg(parts[i:i + IOV_MAX])
+                while i < len(parts) and len(parts[i]) <= sent:
+                    sent -= len(parts[i])
+                    i += 1
+                if sent:
+                    parts[i] = memoryview(parts[i])[sent:]
+        except socket.error as err:
+            raise VppTransportSocketIOError(1, 'Sendmsg error: {err!r}'.format(
+                err=err))
+
+    def _flush(self):
+        parts, self.pending = self.pending, []
+        self._sendmsg(parts)
+
     def write(self, buf):
         """Send a binary-packed message to VPP."""
         if not self.connected:
             raise VppTransportSocketIOError(1, 'Not connected')
 
-        # Send header
         header = self.header.pack(0, len(buf), 0)
+        if self.corked:
+            self.pending.append(header)
+            self.pending.append(buf)
+            if len(self.pending) >= IOV_MAX:
+                self._flush()
+            return
         try:
-            self.socket.sendall(header)
-            self.socket.sendall(buf)
+            sent = self.socket.sendmsg((header, buf))
         except socket.error as err:
-            raise VppTransportSocketIOError(1, 'Sendall error: {err!r}'.format(
+            raise VppTransportSocketIOError(1, 'Sendmsg error: {err!r}'.format(
                 err=err))
+        if sent < len(header) + len(buf):
+            # The socket buffer only took part of the message.
+            self._sendmsg([b''.join((header, buf))[sent:]])
+
+    def write_many(self, bufs):
+        """Send a list of binary-packed messages to VPP, in as few
+        sendmsg() calls as IOV_MAX allows."""
+        if not self.connected:
+            raise VppTransportSocketIOError(1, 'Not connected')
+
+        parts = self.pending if self.corked else []
+        for buf in bufs:
+            parts.append(self.header.pack(0, len(buf), 0))
+            parts.append(buf)
+        if not self.corked:
+            self._sendmsg(parts)
+        elif len(parts) >= IOV_MAX:
+            self._flush()
+
+    def cork(self):
+        """Gather written messages until uncork() or the next read()."""
+        self.corked = True
+
+    def uncork(self):
+        """Send the messages gathered since cork()."""
+        self.corked = False
+        if self.pending:
+            self._flush()
 
     def _read_fixed(self, size):
         """Repeat receive until fixed size is read. Return empty on error."""
@@ -228,9 +357,15 @@ class VppTransport:
     def read(self, timeout=None):
         if not self.connected:
             raise VppTransportSocketIOError(1, 'Not connected')
+        if self.pending:
+            # The reply waited for may be to a gathered message.
+            self._flush()
         if timeout is None:
             timeout = self.read_timeout
         try:
-            return self.q.get(True, timeout)
+            msg = self.q.get(True, timeout)
         except queue.Empty:
             return None
+        if self.rx_limit and not self.rx_space.is_set():
+            self.rx_space.set()
+        return msg